@@ -12,7 +12,10 @@ def create_app(test_config=None):
 
 # flatten package imports for the core package
 from .version import __version__
-from .plotting_backend import plotly_plots, matplotlib_plots
+from .helpers import lazy_import
+# the plotting backends are only imported once they are used
+plotly_plots = lazy_import("mspypeline.plotting_backend.plotly_plots")
+matplotlib_plots = lazy_import("mspypeline.plotting_backend.matplotlib_plots")
 from .modules import *
 from .core import *
 from .file_reader import *
@@ -10,6 +10,7 @@ import logging
 from mspypeline.helpers import get_logger
 from mspypeline import path_package, path_package_config
 from mspypeline.file_reader import MissingFilesException, BaseReader
+from mspypeline.modules import GeneSetLibrary
 
 
 class MSPInitializer:
@@ -21,6 +22,9 @@ class MSPInitializer:
     pathway_path = "pathways"
     possible_gos = sorted([x for x in os.listdir(os.path.join(path_package_config, go_path)) if x.endswith(".txt")])
     possible_pathways = sorted([x for x in os.listdir(os.path.join(path_package_config, pathway_path)) if x.endswith(".txt")])
+    gene_set_cache_path = "gene_set_cache"
+    # the libraries of the bundled txt files by file path, shared by all instances
+    bundled_libraries: Dict[str, GeneSetLibrary] = {}
 
     def __init__(self, dir_: str, file_path_yml: Optional[str] = None, loglevel=logging.DEBUG):
         self.logger = get_logger(self.__class__.__name__, loglevel=loglevel)
@@ -35,6 +39,7 @@ class MSPInitializer:
         self.reader_data = {}
 
         self.interesting_proteins, self.go_analysis_gene_names = None, None
+        self.gene_set_libraries: Dict[str, GeneSetLibrary] = {}
 
         # properties
         self._start_dir = None
@@ -62,6 +67,7 @@ class MSPInitializer:
         # set all attributes back None that where file specific
         self.configs = {}
         self.reader_data = {}
+        self.gene_set_libraries = {}
         self.file_path_yaml = "file"
 
     @property
@@ -139,14 +145,94 @@ class MSPInitializer:
         dict_pathway = {}
         dict_go = {}
         for pathway in self.configs.get("pathways"):
-            name, proteins = self.read_config_txt_file(MSPInitializer.pathway_path, pathway)
+            name, proteins = self.get_gene_set(MSPInitializer.pathway_path, pathway)
             dict_pathway[name] = proteins
 
         for go in self.configs.get("go_terms"):
-            name, proteins = self.read_config_txt_file(MSPInitializer.go_path, go)
+            name, proteins = self.get_gene_set(MSPInitializer.go_path, go)
             dict_go[name] = proteins
         return dict_pathway, dict_go
 
+    def get_bundled_library(self, path: str, set_name: str) -> Optional[GeneSetLibrary]:
+        """
+        Library of a single txt file of the package config. The set name is the file name and the description is
+        the name used in the plots. Each file is only read on its first request.
+
+        Parameters
+        ----------
+        path
+            either pathway_path or go_path
+        set_name
+            file name of the set
+
+        Returns
+        -------
+        the library or None if the file is not part of the package config
+        """
+        if path == MSPInitializer.pathway_path:
+            files = MSPInitializer.possible_pathways
+        elif path == MSPInitializer.go_path:
+            files = MSPInitializer.possible_gos
+        else:
+            raise ValueError(f"Invalid path: {path}")
+        if set_name not in files:
+            return None
+        full_path = os.path.join(path_package_config, path, set_name)
+        if full_path not in MSPInitializer.bundled_libraries:
+            description, genes = self.read_config_txt_file(path, set_name)
+            MSPInitializer.bundled_libraries[full_path] = GeneSetLibrary.from_gene_sets(
+                {set_name: genes}, {set_name: description}
+            )
+        return MSPInitializer.bundled_libraries[full_path]
+
+    def load_gene_set_libraries(self) -> Dict[str, GeneSetLibrary]:
+        """
+        Compiles the GMT files listed under gene_set_libraries in the configs. Relative paths are relative to the config
+        dir. The compiled libraries are cached in the config dir and memory-mapped on later loads.
+
+        Returns
+        -------
+        maps the file name without extension to the library
+        """
+        for file_path in self.configs.get("gene_set_libraries", []) or []:
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            if name in self.gene_set_libraries:
+                continue
+            full_path = os.path.join(self.path_config, file_path)
+            self.gene_set_libraries[name] = GeneSetLibrary.compile(
+                full_path, os.path.join(self.path_config, MSPInitializer.gene_set_cache_path),
+                loglevel=self.logger.getEffectiveLevel()
+            )
+        return self.gene_set_libraries
+
+    def get_gene_set(self, path: str, set_name: str) -> Tuple[str, list]:
+        """
+        Looks up a set in the bundled library of the path and afterwards in the gene set libraries from the configs
+
+        Parameters
+        ----------
+        path
+            either pathway_path or go_path
+        set_name
+            file name of a bundled set or name of a set in a GMT file
+
+        Returns
+        -------
+        the name of the set and its genes
+
+        Raises
+        ------
+        KeyError
+            if no library contains the set
+        """
+        bundled = self.get_bundled_library(path, set_name)
+        if bundled is not None:
+            return bundled.get_description(set_name), bundled.get_genes(set_name)
+        for library in self.load_gene_set_libraries().values():
+            if set_name in library:
+                return set_name, library.get_genes(set_name)
+        raise KeyError(f"Could not find gene set {set_name} in the {path} or gene set libraries")
+
     def read_config_txt_file(self, path, file) -> Tuple[str, list]:
         fullpath = os.path.join(path_package_config, path, file)
         if path == MSPInitializer.pathway_path:
@@ -185,7 +271,8 @@ class MSPInitializer:
         for Reader in BaseReader.__subclasses__():
             Reader: Type[BaseReader]  # for IDE hints
             try:
-                reader = Reader(self.start_dir, self.configs.get(Reader.name, {}))
+                reader = Reader(self.start_dir, self.configs.get(Reader.name, {}),
+                                dtype=self.configs.get("dtype", "float64"))
                 # reader = Reader(self.start_dir, self.configs)
                 self.configs[str(Reader.name)] = deepcopy(reader.reader_config)
                 # self.update_config_file()
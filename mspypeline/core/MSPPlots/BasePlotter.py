@@ -2,26 +2,33 @@ import pandas as pd
 import numpy as np
 import os
 import functools
-import matplotlib.pyplot as plt
-from scipy import stats
 from itertools import combinations
 from collections import defaultdict as ddict
 import logging
 import warnings
-from typing import Dict, Type, Iterable, Optional, Union, Any
-from sklearn.decomposition import PCA
+from typing import Dict, Type, Iterable, Optional, Union, Any, Tuple, List, Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from sklearn.decomposition import PCA, IncrementalPCA
 from copy import deepcopy
 
 from mspypeline.core import MSPInitializer
 from mspypeline.file_reader import BaseReader
-from mspypeline.plotting_backend import matplotlib_plots
-from mspypeline.modules import default_normalizers, Normalization, DataTree
+from mspypeline.modules import default_normalizers, Normalization, NormalizationCache, DataTree, GeneSetLibrary
+from mspypeline.modules.Normalization import iter_column_blocks
+from mspypeline.modules.Statistics import pairwise_ttest_ind, moderated_ttest, hypergeometric_enrichment, \
+    pairwise_correlation
 from mspypeline.helpers import get_number_rows_cols_for_fig, get_number_of_non_na_values, \
-    get_intersection_and_unique, get_logger, dict_depth
+    get_intersection_and_unique, get_logger, dict_depth, BackgroundWriter, DataExporter, lazy_import
 
+# matplotlib is only imported once a plot is rendered, so creating results in data mode does not import it
+matplotlib_plots = lazy_import("mspypeline.plotting_backend.matplotlib_plots")
 # TODO VALIDATE descriptive plots not changing between log2 and non log2
 
-FIG_FORMAT = ".pdf"
+# plot settings of the preview mode, see create_results
+PREVIEW_SETTINGS = {
+    "fig_format": ".png", "dpi": 50, "tight_bbox": False, "dense_threshold": 1000, "dense_mode": "hexbin",
+    "label_placement": "grid"
+}
 
 
 def validate_input(f):
@@ -48,11 +55,19 @@ def validate_input(f):
     return wrapper
 
 
+def render_plot(plot_function_name: str, plot_kwargs: dict) -> None:
+    """
+    Creates and saves a plot in a worker. The figure is discarded instead of being returned.
+    """
+    getattr(matplotlib_plots, plot_function_name)(**plot_kwargs)
+
+
 class BasePlotter:
     possible_plots = [
         "plot_detection_counts", "plot_number_of_detected_proteins", "plot_intensity_histograms",
         "plot_relative_std", "plot_rank", "plot_pathway_analysis", "plot_pathway_timecourse",
-        "plot_scatter_replicates", "plot_experiment_comparison", "plot_go_analysis", "plot_venn_results",
+        "plot_scatter_replicates", "plot_experiment_comparison", "plot_experiment_comparison_matrix",
+        "plot_correlation_heatmap", "plot_go_analysis", "plot_venn_results",
         "plot_venn_groups", "plot_r_volcano", "plot_pca_overview",
         "plot_normalization_overview_all_normalizers", "plot_heatmap_overview_all_normalizers"
     ]
@@ -77,9 +92,28 @@ class BasePlotter:
         self.configs = {} if configs is None else configs
         self.interesting_proteins = {} if interesting_proteins is None else interesting_proteins
         self.go_analysis_gene_names = {} if go_analysis_gene_names is None else go_analysis_gene_names
+        # means and detection of groups, see get_group_summary
+        self.group_summaries: Dict[tuple, Dict[str, pd.DataFrame]] = {}
+        # correlation matrices, see get_sample_correlation_data and get_group_correlation_data
+        self.correlations: Dict[tuple, Any] = {}
+        # pool of workers rendering the plots, only set while create_results runs with several workers
+        self.executor: Optional[Executor] = None
+        self.pending_plots: List[Future] = []
+        # writes the output files in the background, only set while create_results runs, see _render
+        self.output_writer: Optional[BackgroundWriter] = None
+        # saves the data instead of the plots, only set while create_results runs in data mode
+        self.data_exporter: Optional[DataExporter] = None
+        # pdf which receives all plots that are not saved otherwise, only set while figures are collected into one pdf
+        self.figure_sink = None
         self.normalizers = deepcopy(default_normalizers)
         self.selected_normalizer_name = self.configs.get("selected_normalizer", "None")
         self.selected_normalizer = self.normalizers.get(self.selected_normalizer_name, None)
+        # fitted normalizers and normalized data are cached in the config dir if requested
+        self.normalization_cache = None
+        if self.configs.get("use_normalization_cache", False):
+            self.normalization_cache = NormalizationCache(
+                os.path.join(self.start_dir, "config", "normalization_cache"), loglevel=loglevel
+            )
 
         self.intensity_df = None
         if required_reader is not None:
@@ -91,6 +125,9 @@ class BasePlotter:
                 self.logger.exception("Reader data does not provide information from %s reader", required_reader)
                 raise
 
+        # floating point type of all intensities
+        self.dtype = np.dtype(self.configs.get("dtype", "float64"))
+
         # setup everything for all_intensity dict
         self.int_mapping = {}
         self.intensity_label_names = {}
@@ -119,6 +156,17 @@ class BasePlotter:
         # path for volcano plots
         self.file_dir_volcano = os.path.join(self.start_dir, "volcano")
 
+    @property
+    def interesting_proteins(self) -> Dict[str, pd.Series]:
+        return self._interesting_proteins
+
+    @interesting_proteins.setter
+    def interesting_proteins(self, interesting_proteins: Dict[str, pd.Series]):
+        self._interesting_proteins = interesting_proteins
+        # union of the proteins of all pathways and their statistics, see get_pathway_statistics
+        self.pathway_proteins = set().union(*interesting_proteins.values())
+        self.pathway_statistics: Dict[tuple, Dict[str, pd.DataFrame]] = {}
+
     @classmethod
     def from_MSPInitializer(cls, mspinti_instance: MSPInitializer, **kwargs):
         default_kwargs = dict(
@@ -151,18 +199,152 @@ class BasePlotter:
         default_kwargs.update(**kwargs)
         return cls(**default_kwargs)
 
-    def create_results(self):
+    def create_results(self, n_workers: Optional[int] = None, worker_type: Optional[str] = None,
+                       mode: Optional[str] = None, preview: Optional[bool] = None):
+        """
+        Creates all plots which are enabled in the configs.
+
+        Parameters
+        ----------
+        n_workers
+            number of workers which render and save the figures. If None the n_workers setting of the configs is
+            used, 0 uses all cores. With one worker everything runs in this process, otherwise the data of the plots
+            is calculated here and each figure is rendered and written by one of the workers.
+        worker_type
+            "process" or "thread". If None the worker_type setting of the configs is used. Processes receive a
+            pickled copy of the data of each plot, threads share the data of this process. Threads avoid copying
+            the data, but do not render much faster than one worker: drawing runs under the GIL and the text layout,
+            which takes about 40% of the time of create_results, is serialized by matplotlib_plots.text_layout_lock.
+            Processes should be used to render on several cores.
+        mode
+            "plots" or "data". If None the results_mode setting of the configs is used. In data mode only the data of
+            the plots is calculated and saved in the data_format of the configs, see DataExporter, together with a
+            data_index.json in the start dir. matplotlib is not imported in data mode.
+        preview
+            if a quick preview should be created. If None the preview setting of the configs is used. The
+            preview_settings of the configs, by default PREVIEW_SETTINGS, replace the settings of all plots, so the
+            plots are saved as low resolution png files and dense plots are simplified.
+
+        Notes
+        -----
+        If the skip_unchanged_plots setting is true, plots are only created if their data, settings or the
+        mspypeline version changed since they were last saved, see matplotlib_plots.plot_manifest_record.
+
+        """
+        if mode is None:
+            mode = self.configs.get("results_mode", "plots")
+        if mode == "data":
+            self.create_data_results()
+            return
+        if mode != "plots":
+            raise ValueError(f"mode should be one of ['plots', 'data'], got {mode}")
+        if preview is None:
+            preview = self.configs.get("preview", False)
+        if n_workers is None:
+            n_workers = self.configs.get("n_workers", 1)
+        if worker_type is None:
+            worker_type = self.configs.get("worker_type", "process")
+        executors = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+        if worker_type not in executors:
+            raise ValueError(f"worker_type should be one of {list(executors)}, got {worker_type}")
+        # the lazily imported backend is executed on first use, which is not thread safe before python 3.12. So it is
+        # loaded here, before any worker or the background writer uses it.
+        matplotlib_plots.FIG_FORMAT
+        n_workers = n_workers or os.cpu_count()
         global_settings = self.configs.get("global_settings", {})
         self.logger.debug(f"got global settings: %s", global_settings)
-        for plot_name in self.possible_plots:
-            plot_settings_name = plot_name + "_settings"
-            plot_settings = self.configs.get(plot_settings_name, {})
-            plot_settings.update({k: v for k, v in global_settings.items() if k not in plot_settings})
-            if plot_settings.pop("create_plot", False):
-                self.logger.debug(f"creating plot {plot_name}")
-                getattr(self, plot_name)(**plot_settings)
+        # figures and csv files are written by a background thread while the next plot is created. Worker processes
+        # write their own files and should not be forked while the thread is running.
+        max_pending_writes = self.configs.get("max_pending_writes", 8)
+        if max_pending_writes > 0 and (n_workers == 1 or worker_type == "thread"):
+            self.output_writer = BackgroundWriter(max_pending_writes, loglevel=self.logger.getEffectiveLevel())
+        if n_workers > 1:
+            self.logger.debug("rendering plots with %s %s workers", n_workers, worker_type)
+            self.executor = executors[worker_type](max_workers=n_workers)
+        try:
+            for plot_name in self.possible_plots:
+                plot_settings_name = plot_name + "_settings"
+                # copied, so e.g. a preview does not change the settings of the next call
+                plot_settings = dict(self.configs.get(plot_settings_name, {}))
+                plot_settings.update({k: v for k, v in global_settings.items() if k not in plot_settings})
+                if preview:
+                    plot_settings.update(self.configs.get("preview_settings", PREVIEW_SETTINGS))
+                if self.configs.get("skip_unchanged_plots", False):
+                    plot_settings.setdefault("skip_unchanged_plots", True)
+                if plot_settings.pop("create_plot", False):
+                    self.logger.debug(f"creating plot {plot_name}")
+                    getattr(self, plot_name)(**plot_settings)
+            # raises the first error of a worker
+            for future in self.pending_plots:
+                future.result()
+            # raises the first error of a background write
+            if self.output_writer is not None:
+                self.output_writer.flush()
+        finally:
+            if self.executor is not None:
+                for future in self.pending_plots:
+                    future.cancel()
+                self.executor.shutdown()
+            self.executor, self.pending_plots = None, []
+            writer, self.output_writer = self.output_writer, None
+            if writer is not None:
+                writer.close(raise_errors=False)
         self.logger.info("Done creating plots")
 
+    def create_data_results(self):
+        """
+        Saves the data of all plots which are enabled in the configs instead of the plots, see create_results.
+        """
+        global_settings = self.configs.get("global_settings", {})
+        self.data_exporter = DataExporter(
+            os.path.join(self.start_dir, "data_index.json"), self.configs.get("data_format", "parquet"),
+            loglevel=self.logger.getEffectiveLevel()
+        )
+        try:
+            for plot_name in self.possible_plots:
+                plot_settings = dict(self.configs.get(plot_name + "_settings", {}))
+                plot_settings.update({k: v for k, v in global_settings.items() if k not in plot_settings})
+                if plot_settings.pop("create_plot", False):
+                    self.logger.debug(f"saving data of {plot_name}")
+                    getattr(self, plot_name)(**plot_settings)
+            self.data_exporter.write_index()
+        finally:
+            self.data_exporter = None
+        self.logger.info("Done saving plot data")
+
+    def _render(self, plot_function_name: str, **plot_kwargs):
+        """
+        Creates a plot with a function of the plotting backend.
+
+        Parameters
+        ----------
+        plot_function_name
+            name of the function of the plotting backend
+        plot_kwargs
+            passed to the plot function, together with the output_writer while create_results runs
+
+        Returns
+        -------
+        The return value of the plot function. While create_results runs with several workers and the plot is saved,
+        a Future is returned instead and the plot is rendered by a worker. In data mode the data is saved and None
+        is returned. If the plot is not saved and a figure_sink is set, the figure is added to the sink and None is
+        returned.
+
+        """
+        if self.data_exporter is not None:
+            self.data_exporter.export(plot_function_name, **plot_kwargs)
+            return None
+        if self.output_writer is not None:
+            plot_kwargs["output_writer"] = self.output_writer
+        if self.figure_sink is not None and plot_kwargs.get("save_path") is None:
+            self.figure_sink.add(getattr(matplotlib_plots, plot_function_name)(**plot_kwargs))
+            return None
+        if self.executor is None or plot_kwargs.get("save_path") is None:
+            return getattr(matplotlib_plots, plot_function_name)(**plot_kwargs)
+        future = self.executor.submit(render_plot, plot_function_name, plot_kwargs)
+        self.pending_plots.append(future)
+        return future
+
     def add_intensity_column(self, option_name: str, name_in_file: str, name_in_plot: str,
                              scale: str = "normal", df: Optional[pd.DataFrame] = None):
         if df is None:
@@ -182,7 +364,8 @@ class BasePlotter:
         # extract all raw intensities from the dataframe
         # replace all 0 with nan and remove the prefix from the columns
         intensities = df.loc[:, [c for c in df.columns if c.startswith(self.int_mapping[option_name])]
-            ].replace({0: np.nan}).rename(lambda x: x.replace(self.int_mapping[option_name], ""), axis=1)
+            ].replace({0: np.nan}).rename(lambda x: x.replace(self.int_mapping[option_name], ""), axis=1
+                                          ).astype(self.dtype)
         if scale == "log2":
             intensities = np.exp2(intensities)
         # ensure data will not have faulty values after log2 transformation
@@ -226,8 +409,11 @@ class BasePlotter:
             setattr(normalizer, "output_scale", "normal")
             setattr(normalizer, "col_name_prefix", norm_option_name)
         assert hasattr(normalizer, "fit_transform"), "normalizer must have fit_transform method"
-        data = self.all_intensities_dict[df_to_use].copy()
-        data = normalizer.fit_transform(data)
+        if self.normalization_cache is not None and isinstance(normalizer, Normalization.BaseNormalizer):
+            data = self.normalization_cache.fit_transform(normalizer, self.all_intensities_dict[df_to_use])
+        else:
+            data = self.all_intensities_dict[df_to_use].copy()
+            data = normalizer.fit_transform(data)
         self.add_intensity_column(new_option_name, norm_option_name + " ",
                                   f"{norm_option_name.replace('_', ' ')} {self.intensity_label_names[df_to_use_no_log2]}",
                                   scale="normal", df=data)
@@ -264,10 +450,10 @@ class BasePlotter:
                 # create venn diagrams comparing all replicates within an experiment
                 named_sets = self.get_venn_group_data(df_to_use, level)
                 # save the resulting venn diagram
-                plot = matplotlib_plots.save_venn(named_sets, **plot_kwargs)
+                plot = self._render("save_venn", named_sets=named_sets, **plot_kwargs)
                 plots.append(plot)
                 # create a mixture of bar and venn diagram
-                plot = matplotlib_plots.save_bar_venn(named_sets, **plot_kwargs)
+                plot = self._render("save_bar_venn", named_sets=named_sets, **plot_kwargs)
                 plots.append(plot)
         return plots
 
@@ -282,10 +468,10 @@ class BasePlotter:
                     plot_kwargs.update(**kwargs)
                     named_sets = self.get_venn_data_per_key(df_to_use, key)
                     # save the resulting venn diagram
-                    plot = matplotlib_plots.save_venn(named_sets, **plot_kwargs)
+                    plot = self._render("save_venn", named_sets=named_sets, **plot_kwargs)
                     plots.append(plot)
                     # create a mixture of bar and venn diagram
-                    plot = matplotlib_plots.save_bar_venn(named_sets, **plot_kwargs)
+                    plot = self._render("save_bar_venn", named_sets=named_sets, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -328,7 +514,7 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_detection_counts_results(**data, **plot_kwargs)
+                    plot = self._render("save_detection_counts_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -357,7 +543,7 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_number_of_detected_proteins_results(**data, **plot_kwargs)
+                    plot = self._render("save_number_of_detected_proteins_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -374,15 +560,68 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_intensity_histogram_results(**data, **plot_kwargs)
+                    plot = self._render("save_intensity_histogram_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
+    def get_sample_correlation_data(self, df_to_use: str, method: str = "pearson",
+                                    full_name: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Pairwise complete correlations of all samples. The matrix of all samples is computed once per df_to_use and
+        method, the correlations of the samples below a node are a slice of it.
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        method
+            pearson or spearman, see pairwise_correlation
+        full_name
+            If given only the samples below this node are returned
+
+        Returns
+        -------
+        Dictionary with DataFrames of shape samples x samples for the keys correlation and n_observations
+
+        """
+        cache_key = ("samples", df_to_use, method)
+        if cache_key not in self.correlations:
+            data = self.all_tree_dict[df_to_use].aggregate(None, method=None)
+            correlation, n_observations = pairwise_correlation(data.values, method=method)
+            self.correlations[cache_key] = {
+                "correlation": pd.DataFrame(correlation, index=data.columns, columns=data.columns),
+                "n_observations": pd.DataFrame(n_observations, index=data.columns, columns=data.columns)
+            }
+        result = self.correlations[cache_key]
+        if full_name is not None:
+            samples = self.all_tree_dict[df_to_use][full_name].aggregate(None).columns
+            result = {name: df.loc[samples, samples] for name, df in result.items()}
+        return result
+
+    def get_group_correlation_data(self, df_to_use: str, keys: Iterable[str], method: str = "pearson"
+                                   ) -> pd.DataFrame:
+        """
+        Correlations of the mean intensities of groups, using the proteins detected in enough replicates of both
+        groups. Computed once per df_to_use, keys and method.
+
+        See Also
+        --------
+        get_group_summary : the means and detected proteins of the groups
+        """
+        keys = tuple(keys)
+        cache_key = ("groups", df_to_use, keys, method)
+        if cache_key not in self.correlations:
+            summary = self.get_group_summary(df_to_use, keys)
+            correlation, _ = pairwise_correlation(summary["means"].values, summary["enough_values"].values, method)
+            self.correlations[cache_key] = pd.DataFrame(correlation, index=keys, columns=keys)
+        return self.correlations[cache_key]
+
     def get_scatter_replicates_data(self, df_to_use: str, full_name: str) -> Dict[str, pd.DataFrame]:
         data = self.all_tree_dict[df_to_use][full_name].aggregate(None)
         if data.empty:
             return {}
-        return {"scatter_data": data}
+        correlations = self.get_sample_correlation_data(df_to_use, "pearson")["correlation"]
+        return {"scatter_data": data, "correlations": correlations.loc[data.columns, data.columns]}
 
     @validate_input
     def plot_scatter_replicates(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]], **kwargs):
@@ -395,7 +634,7 @@ class BasePlotter:
                         plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use], full_name=full_name,
                                            df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_scatter_replicates_results(**data, **plot_kwargs)
+                        plot = self._render("save_scatter_replicates_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
@@ -414,7 +653,7 @@ class BasePlotter:
                                            df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive,
                                            interesting_proteins=self.interesting_proteins)
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_rank_results(**data, **plot_kwargs)
+                        plot = self._render("save_rank_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
@@ -456,41 +695,63 @@ class BasePlotter:
                         plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use], experiment_name=full_name,
                                            df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_relative_std_results(**data, **plot_kwargs)
+                        plot = self._render("save_relative_std_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
-    def get_pathway_analysis_data(self, df_to_use: str, level: int, pathway: str, equal_var=True, **kwargs):
+    def get_pathway_statistics(self, df_to_use: str, level: int, equal_var=True) -> Dict[str, pd.DataFrame]:
+        """
+        Grouped intensities and pairwise t-test p-values of all proteins of all pathways. The result is computed once
+        per df_to_use, level and equal_var, so proteins contained in several pathways are only tested once. Setting
+        interesting_proteins resets the results.
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        level
+            level of the groups which are compared
+        equal_var
+            passed to the t-test
+
+        Returns
+        -------
+        Dictionary with the protein intensities and the significances, both sorted by protein
+
+        """
+        key = (df_to_use, level, equal_var)
+        if key in self.pathway_statistics:
+            return self.pathway_statistics[key]
+        all_proteins = self.pathway_proteins & set(self.all_intensities_dict[df_to_use].index)
+        if len(all_proteins) < 1:
+            self.pathway_statistics[key] = {}
+            return {}
         level_keys = self.all_tree_dict[df_to_use].level_keys_full_name[level]
+        protein_intensities = self.all_tree_dict[df_to_use].groupby(level, method=None, index=list(all_proteins)).\
+            sort_index(axis=0).sort_index(axis=1, ascending=False)
+        # filter entries with too many nans based on function
+        groups = [protein_intensities.loc[:, level_key].values for level_key in level_keys]
+        has_enough_values = np.stack([(group > 0).sum(axis=1) >= get_number_of_non_na_values(group.shape[1])
+                                      for group in groups], axis=1)
+        # all pairwise t-tests of all proteins at once
+        _, p_values, pairs = pairwise_ttest_ind(groups, equal_var=equal_var)
+        first, second = zip(*pairs)
+        p_values[~(has_enough_values[:, list(first)] & has_enough_values[:, list(second)])] = np.nan
+        significances = pd.DataFrame(p_values, index=protein_intensities.index,
+                                     columns=pd.MultiIndex.from_tuples([(e1, e2) for e1, e2 in combinations(level_keys, 2)]))
+        self.pathway_statistics[key] = {"protein_intensities": protein_intensities, "significances": significances}
+        return self.pathway_statistics[key]
+
+    def get_pathway_analysis_data(self, df_to_use: str, level: int, pathway: str, equal_var=True, **kwargs):
         found_proteins = set(self.interesting_proteins[pathway])
         found_proteins &= set(self.all_intensities_dict[df_to_use].index)
-        found_proteins = list(found_proteins)
         if len(found_proteins) < 1:
             self.logger.warning("Skipping pathway %s in pathway analysis because no proteins were found", pathway)
             return {}
-        protein_intensities = self.all_tree_dict[df_to_use].groupby(level, method=None, index=found_proteins).\
-            sort_index(0).sort_index(1, ascending=False)
-        significances = []
-        for protein in protein_intensities.index:
-            per_protein_significant = []
-            for e1, e2 in combinations(level_keys, 2):
-                v1 = protein_intensities.loc[protein].loc[e1]
-                v2 = protein_intensities.loc[protein].loc[e2]
-                # filter entries with too many nans based on function
-                non_na_group_1 = get_number_of_non_na_values(v1.shape[0])
-                non_na_group_2 = get_number_of_non_na_values(v2.shape[0])
-                mask_1 = (v1 > 0).sum(axis=0) >= non_na_group_1
-                mask_2 = (v2 > 0).sum(axis=0) >= non_na_group_2
-                mask = np.logical_and(mask_1, mask_2)
-                if not mask:
-                    per_protein_significant.append(np.nan)
-                else:
-                    test = stats.ttest_ind(v1, v2, equal_var=equal_var, nan_policy="omit")
-                    per_protein_significant.append(test[1])
-            significances.append(per_protein_significant)
-        significances = pd.DataFrame(significances, index=protein_intensities.index,
-                                     columns=pd.MultiIndex.from_tuples([(e1, e2) for e1, e2 in combinations(level_keys, 2)]))
-        return {"protein_intensities": protein_intensities, "significances": significances}
+        statistics = self.get_pathway_statistics(df_to_use, level, equal_var)
+        # the statistics are sorted by protein, so selecting the sorted proteins keeps that order
+        found_proteins = sorted(found_proteins)
+        return {name: data.loc[found_proteins] for name, data in statistics.items()}
 
     @validate_input
     def plot_pathway_analysis(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]], **kwargs):
@@ -503,7 +764,7 @@ class BasePlotter:
                         plot_kwargs = dict(pathway=pathway, save_path=self.file_dir_pathway, df_to_use=df_to_use,
                                            level=level, intensity_label=self.intensity_label_names[df_to_use])
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_pathway_analysis_results(**data, **plot_kwargs)
+                        plot = self._render("save_pathway_analysis_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
@@ -511,6 +772,9 @@ class BasePlotter:
         pass
 
     def plot_pathway_timecourse(self, df_to_use: str = "raw", show_suptitle: bool = False, levels: Iterable = (2,), **kwargs):
+        if self.data_exporter is not None:
+            self.logger.warning("Skipping pathway timeline plot because it has no data to save")
+            return
         group_colors = {
             "SD": "#808080",
             "4W": "#0b8040",
@@ -531,7 +795,6 @@ class BasePlotter:
                 x_values.update({key: sum([int(s.replace("W", "")) for s in key.split("_") if s.endswith("W")])})
             max_time = max(x_values.values())
             for pathway in self.interesting_proteins:
-                plt.close("all")
                 found_proteins = set(self.interesting_proteins[pathway])
                 found_proteins &= set(self.all_intensities_dict[df_to_use].index)
                 found_proteins = sorted(list(found_proteins))
@@ -539,7 +802,7 @@ class BasePlotter:
                     self.logger.warning("Skipping pathway %s in pathway timeline because no proteins were found", pathway)
                     continue
                 n_rows, n_cols = get_number_rows_cols_for_fig(found_proteins)
-                fig, axarr = plt.subplots(n_rows, n_cols, figsize=(n_cols * int(max_time / 5), 4 * n_rows))
+                fig, axarr = matplotlib_plots.subplots(n_rows, n_cols, figsize=(n_cols * int(max_time / 5), 4 * n_rows))
                 if show_suptitle:
                     fig.suptitle(pathway)
                 try:
@@ -569,79 +832,216 @@ class BasePlotter:
                     ax.set_xlim(left=0, right=max_time + 1)
                 handles, labels = axiterator[0].get_legend_handles_labels()
                 fig.legend(handles, labels, bbox_to_anchor=(1.04, 0.5), loc="center left")
-                fig.tight_layout(rect=[0, 0.03, 1, 0.95])
-                res_path = os.path.join(self.file_dir_pathway, f"pathway_timeline_{pathway}" + FIG_FORMAT)
-                fig.savefig(res_path, dpi=200, bbox_inches="tight")
+                matplotlib_plots.tight_layout(fig)
+                matplotlib_plots.save_plot_func(fig, self.file_dir_pathway, f"pathway_timeline_{pathway}",
+                                                type(self).plot_pathway_timecourse, output_writer=self.output_writer,
+                                                **kwargs)
+
+    def get_group_summary(self, df_to_use: str, keys: Iterable[str], non_na_function=get_number_of_non_na_values
+                          ) -> Dict[str, pd.DataFrame]:
+        """
+        Mean intensity per group and which proteins were detected in enough or no replicates of a group.
+        The result is computed once per df_to_use and keys, so comparing all pairs of groups aggregates every group
+        only once.
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        keys
+            full names of the groups
+        non_na_function
+            minimum number of detected replicates given the number of replicates
+
+        Returns
+        -------
+        Dictionary with DataFrames of shape proteins x groups for the keys means, enough_values and missing
+
+        """
+        keys = tuple(keys)
+        cache_key = (df_to_use, keys, non_na_function)
+        if cache_key not in self.group_summaries:
+            data = pd.concat({key: self.all_tree_dict[df_to_use][key].aggregate(None) for key in keys}, axis=1)
+            detected_counts = (data > 0).T.groupby(level=0, sort=False).sum().T.reindex(columns=list(keys))
+            n_replicates = pd.Series(data.columns.get_level_values(0)).value_counts()
+            minimum = np.array([non_na_function(n_replicates[key]) for key in keys])
+            self.group_summaries[cache_key] = {
+                "means": data.T.groupby(level=0, sort=False).mean().T.reindex(columns=list(keys)),
+                "enough_values": detected_counts >= minimum,
+                "missing": detected_counts == 0
+            }
+        return self.group_summaries[cache_key]
 
     def get_experiment_comparison_data(self, df_to_use: str, full_name1: str, full_name2: str):
-        protein_intensities_sample1 = self.all_tree_dict[df_to_use][full_name1].aggregate(None)
-        protein_intensities_sample2 = self.all_tree_dict[df_to_use][full_name2].aggregate(None)
-        mask, exclusive_1, exclusive_2 = get_intersection_and_unique(protein_intensities_sample1, protein_intensities_sample2)
+        tree = self.all_tree_dict[df_to_use]
+        level = tree[full_name1].level
+        # all groups of a level share one summary
+        keys = tree.level_keys_full_name[level] if tree[full_name2].level == level else (full_name1, full_name2)
+        summary = self.get_group_summary(df_to_use, keys)
+        means, enough_values, missing = summary["means"], summary["enough_values"], summary["missing"]
+        mask = enough_values[full_name1] & enough_values[full_name2]
+        exclusive_1 = enough_values[full_name1] & missing[full_name2]
+        exclusive_2 = enough_values[full_name2] & missing[full_name1]
         # flatten all replicates
-        exclusive_sample1 = protein_intensities_sample1[exclusive_1].mean(axis=1)
-        exclusive_sample2 = protein_intensities_sample2[exclusive_2].mean(axis=1)
-        protein_intensities_sample1 = protein_intensities_sample1[mask].mean(axis=1)
-        protein_intensities_sample2 = protein_intensities_sample2[mask].mean(axis=1)
+        exclusive_sample1 = means.loc[exclusive_1, full_name1]
+        exclusive_sample2 = means.loc[exclusive_2, full_name2]
+        protein_intensities_sample1 = means.loc[mask, full_name1]
+        protein_intensities_sample2 = means.loc[mask, full_name2]
         if protein_intensities_sample1.empty and protein_intensities_sample2.empty:
             self.logger.warning("protein samples of %s and %s are both empty", full_name1, full_name2)
             return {}
         return {
             "protein_intensities_sample1": protein_intensities_sample1,
             "protein_intensities_sample2": protein_intensities_sample2,
-            "exclusive_sample1": exclusive_sample1, "exclusive_sample2": exclusive_sample2
+            "exclusive_sample1": exclusive_sample1, "exclusive_sample2": exclusive_sample2,
+            "correlation": self.get_group_correlation_data(df_to_use, keys).loc[full_name1, full_name2]
         }
 
     @validate_input
-    def plot_experiment_comparison(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]], **kwargs):
+    def plot_experiment_comparison(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]],
+                                   pairs: Optional[Iterable[Tuple[str, str]]] = None, **kwargs):
+        """
+        Creates one scatter plot per pair of groups. See plot_experiment_comparison_matrix for a summary of all pairs.
+
+        Parameters
+        ----------
+        dfs_to_use
+        levels
+        pairs
+            If given only these pairs of groups are plotted instead of all pairs of a level
+        kwargs
+            passed to the plot function
+
+        """
         # TODO correlation of log2 and not log 2 data is different
         plots = []
         for level in levels:
             for df_to_use in dfs_to_use:
-                for ex1, ex2 in combinations(self.all_tree_dict[df_to_use].level_keys_full_name[level], 2):
+                level_keys = self.all_tree_dict[df_to_use].level_keys_full_name[level]
+                level_pairs = combinations(level_keys, 2) if pairs is None else \
+                    [tuple(pair) for pair in pairs if pair[0] in level_keys and pair[1] in level_keys]
+                for ex1, ex2 in level_pairs:
                     data = self.get_experiment_comparison_data(df_to_use=df_to_use, full_name1=ex1, full_name2=ex2)
                     if data:
                         plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use], sample1=ex1, sample2=ex2,
                                            df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_experiment_comparison_results(**data, **plot_kwargs)
+                        plot = self._render("save_experiment_comparison_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
+    def get_experiment_comparison_matrix_data(self, df_to_use: str, level: int, **kwargs) -> Dict[str, pd.DataFrame]:
+        """
+        Compares all groups of a level at once. Proteins are shared by two groups if they were detected in enough
+        replicates of both groups, the correlations use the mean intensities of the shared proteins.
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        level
+            level of the groups
+        kwargs
+            accepts kwargs
+
+        Returns
+        -------
+        Dictionary with DataFrames of shape groups x groups for the keys shared, exclusive, pearson and spearman.
+        exclusive counts the proteins of the row group which are missing in the column group.
+
+        """
+        level_keys = self.all_tree_dict[df_to_use].level_keys_full_name[level]
+        if len(level_keys) < 2:
+            self.logger.warning("Skipping experiment comparison matrix for level %s, it has less than 2 groups", level)
+            return {}
+        summary = self.get_group_summary(df_to_use, level_keys)
+        enough_values = summary["enough_values"].values.astype(np.float64)
+        missing = summary["missing"].values.astype(np.float64)
+        data = {
+            "shared": np.rint(enough_values.T @ enough_values).astype(np.int64),
+            "exclusive": np.rint(enough_values.T @ missing).astype(np.int64),
+        }
+        for method in ("pearson", "spearman"):
+            data[method] = self.get_group_correlation_data(df_to_use, level_keys, method).values
+        return {name: pd.DataFrame(matrix, index=level_keys, columns=level_keys) for name, matrix in data.items()}
+
+    @validate_input
+    def plot_experiment_comparison_matrix(self, dfs_to_use: Union[str, Iterable[str]],
+                                          levels: Union[int, Iterable[int]], **kwargs):
+        plots = []
+        for level in levels:
+            for df_to_use in dfs_to_use:
+                data = self.get_experiment_comparison_matrix_data(df_to_use=df_to_use, level=level, **kwargs)
+                if data:
+                    plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
+                                       df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
+                    plot_kwargs.update(**kwargs)
+                    plot = self._render("save_experiment_comparison_matrix_results",
+                                        **data, **plot_kwargs)
+                    plots.append(plot)
+        return plots
+
+    def get_correlation_heatmap_data(self, df_to_use: str, level: int, method: str = "pearson", **kwargs
+                                     ) -> Dict[str, pd.DataFrame]:
+        """
+        Correlations of all samples, ordered by the groups of a level
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        level
+            level of the groups used to order the samples
+        method
+            pearson or spearman
+        kwargs
+            accepts kwargs
+
+        Returns
+        -------
+        Dictionary with the correlations, the columns and index are the groups and samples
+
+        """
+        samples = self.all_tree_dict[df_to_use].groupby(level, method=None).columns
+        correlation = self.get_sample_correlation_data(df_to_use, method)["correlation"]
+        correlation = correlation.loc[samples.get_level_values(1), samples.get_level_values(1)]
+        correlation.index, correlation.columns = samples, samples
+        return {"correlation": correlation}
+
+    @validate_input
+    def plot_correlation_heatmap(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]],
+                                 **kwargs):
+        plots = []
+        for level in levels:
+            for df_to_use in dfs_to_use:
+                data = self.get_correlation_heatmap_data(df_to_use=df_to_use, level=level, **kwargs)
+                if data:
+                    plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
+                                       df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
+                    plot_kwargs.update(**kwargs)
+                    plot = self._render("save_correlation_heatmap_results", **data, **plot_kwargs)
+                    plots.append(plot)
+        return plots
+
     def get_go_analysis_data(self, df_to_use: str, level: int):
         if not self.go_analysis_gene_names:
             return {}
-        background = set(self.all_intensities_dict[df_to_use].index)
+        # all genes that were detected throughout all experiments are the background
+        background = self.all_intensities_dict[df_to_use].index.unique()
+        # encode the compartments as boolean matrix over the background genes
+        gene_sets = GeneSetLibrary.from_gene_sets(self.go_analysis_gene_names).membership_matrix(background)
+        # mean intensity of all experiments over all replicates, proteins with mean intensity > 0 are detected
+        experiments = self.all_tree_dict[df_to_use].level_keys_full_name[level]
+        mean_intensities = self.all_tree_dict[df_to_use].groupby(level)
+        mean_intensities = mean_intensities[~mean_intensities.index.duplicated()]
+        detected = (mean_intensities.reindex(index=background, columns=experiments) > 0).values
+        overlap, p_values = hypergeometric_enrichment(detected, gene_sets)
         heights = ddict(list)
         test_results = ddict(list)
-        for compartiment, all_pathway_genes in self.go_analysis_gene_names.items():
-            all_pathway_genes = set(all_pathway_genes)
-            # get all pathway genes that were detected throughout all experiments
-            pathway_genes = all_pathway_genes & background
-            # all genes that are not in the pathway
-            not_pathway_genes = background - pathway_genes
-            # sanity check
-            assert pathway_genes | not_pathway_genes == background
-            heights["background"].append(len(pathway_genes))
-            for experiment in self.all_tree_dict[df_to_use].level_keys_full_name[level]:
-                # create df with intensity means for specific experiment over all replicates
-                mean_intensity = self.all_tree_dict[df_to_use][experiment].aggregate()
-                # get all proteins with mean intensity > 0
-                experiment_genes = set(mean_intensity[mean_intensity > 0].index)
-                # all other experiments are not detected
-                not_experiment_genes = background - experiment_genes
-                # sanity check
-                assert experiment_genes | not_experiment_genes == background
-                # append height for the plot
-                heights[experiment].append(len(experiment_genes & pathway_genes))
-                table = pd.DataFrame([
-                    [len(experiment_genes & pathway_genes), len(experiment_genes & not_pathway_genes)],
-                    [len(not_experiment_genes & pathway_genes), len(not_experiment_genes & not_pathway_genes)]
-                ], columns=["in pathway", "not in pathway"], index=["in experiment", "not in experiment"])
-                oddsratio, pvalue = stats.fisher_exact(table, alternative='greater')
-                # chi2, p, dof, ex = stats.chi2_contingency(table, correction=True)
-                # self.logger.debug(f"{chi2}, {dof}, {ex}")
-                # self.logger.debug(f"{compartiment} {experiment}: table: {table} fisher: {pvalue:.4f}, chi2: {p:.4f}")
-                test_results[experiment].append(pvalue)
+        heights["background"] = gene_sets.sum(axis=0).tolist()
+        for experiment_index, experiment in enumerate(experiments):
+            heights[experiment] = overlap[experiment_index].tolist()
+            test_results[experiment] = p_values[experiment_index].tolist()
         return {"heights": heights, "test_results": test_results}
 
     @validate_input
@@ -655,7 +1055,7 @@ class BasePlotter:
                                        go_analysis_gene_names=self.go_analysis_gene_names,
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_go_analysis_results(**data, **plot_kwargs)
+                    plot = self._render("save_go_analysis_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -719,33 +1119,198 @@ class BasePlotter:
 
         return {"volcano_data": plot_data, "unique_g1": unique_g1, "unique_g2": unique_g2}
 
+    def get_volcano_data(self, df_to_use: str, level: int, pairs: Optional[Iterable] = None):
+        """
+        Empirical Bayes moderated t-tests as in limma for all pairs of groups of a level, computed at once without R.
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        level
+            level of the groups that should be compared
+        pairs
+            pairs of group names to compare, defaults to all combinations
+
+        Returns
+        -------
+        Dictionary mapping each pair to the same data as get_r_volcano_data
+        """
+        level_keys = self.all_tree_dict[df_to_use].level_keys_full_name[level]
+        pairs = list(combinations(level_keys, 2)) if pairs is None else list(pairs)
+        group_data = {}
+        for group in {group for pair in pairs for group in pair}:
+            group_data[group] = self.all_tree_dict[df_to_use][group].aggregate(None)
+        valid_pairs = []
+        for g1, g2 in pairs:
+            if group_data[g1].shape[1] < 2 or group_data[g2].shape[1] < 2:
+                self.logger.warning("Skipping Volcano plot for comparison: %s, %s because the groups contain only "
+                                    "%s and %s experiments", g1, g2, group_data[g1].shape[1], group_data[g2].shape[1])
+            else:
+                valid_pairs.append((g1, g2))
+        if not valid_pairs:
+            return {}
+        groups = sorted(group_data)
+        index = group_data[groups[0]].index
+        group_data = {group: data.reindex(index) for group, data in group_data.items()}
+        # the same filter as for the limma version
+        masks = [get_intersection_and_unique(group_data[g1], group_data[g2]) for g1, g2 in valid_pairs]
+        result = moderated_ttest([group_data[group].values for group in groups],
+                                 pairs=[(groups.index(g1), groups.index(g2)) for g1, g2 in valid_pairs],
+                                 mask=np.stack([mask for mask, _, _ in masks], axis=1))
+        all_data = {}
+        for i, ((g1, g2), (mask, exclusive_1, exclusive_2)) in enumerate(zip(valid_pairs, masks)):
+            if not mask.any():
+                continue
+            plot_data = pd.DataFrame({col: result[col][:, i] for col in ("logFC", "AveExpr", "pval", "adjpval")},
+                                     index=pd.Index(index, name="Gene_names"))[mask.values]
+            plot_data = plot_data.sort_values("pval")
+            # calculate mean intensity for unique genes
+            unique_g1 = group_data[g1][exclusive_1].mean(axis=1).rename(f"{df_to_use} mean intensity")
+            unique_g2 = group_data[g2][exclusive_2].mean(axis=1).rename(f"{df_to_use} mean intensity")
+            all_data[(g1, g2)] = {"volcano_data": plot_data, "unique_g1": unique_g1, "unique_g2": unique_g2}
+        return all_data
+
     @validate_input
-    def plot_r_volcano(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]], **kwargs):
+    def plot_r_volcano(self, dfs_to_use: Union[str, Iterable[str]], levels: Union[int, Iterable[int]],
+                       backend: str = "python", **kwargs):
         # TODO both adj and un adj should be available
+        if backend not in ("python", "r"):
+            raise ValueError("backend should be one of: python, r")
         plots = []
         for level in levels:
             for df_to_use in dfs_to_use:
                 level_keys = self.all_tree_dict[df_to_use].level_keys_full_name[level]
-                for g1, g2 in combinations(level_keys, 2):
-                    data = self.get_r_volcano_data(g1, g2, df_to_use, level)
+                if backend == "python":
+                    all_data = self.get_volcano_data(df_to_use, level)
+                else:
+                    all_data = {(g1, g2): self.get_r_volcano_data(g1, g2, df_to_use, level)
+                                for g1, g2 in combinations(level_keys, 2)}
+                for (g1, g2), data in all_data.items():
                     if data:
                         plot_kwargs = dict(g1=g1, g2=g2, save_path=self.file_dir_volcano, df_to_use=df_to_use, level=level,
                                            intensity_label=self.intensity_label_names[df_to_use])
                         plot_kwargs.update(**kwargs)
-                        plot = matplotlib_plots.save_volcano_results(**data, **plot_kwargs)
+                        plot = self._render("save_volcano_results", **data, **plot_kwargs)
                         plots.append(plot)
         return plots
 
-    def get_pca_data(self, df_to_use: str, level: int, n_components: int = 4, fill_value: float = 0, fill_na_before_norm: bool = False, **kwargs):
-        data_input = self.all_tree_dict[df_to_use].groupby(level, method=None)
-        if fill_na_before_norm:
-            data_input.fillna(fill_value, inplace=True)
-        data_norm = data_input.subtract(data_input.mean(axis=1), axis=0).divide(data_input.std(axis=1), axis=0)
-        if not fill_na_before_norm:
-            data_norm.fillna(fill_value, inplace=True)
-        data_transform = data_norm.T
-        pca: PCA = PCA(n_components=n_components).fit(data_transform)
-        df = pd.DataFrame(pca.transform(data_transform).T, columns=data_input.columns,
+    @staticmethod
+    def get_row_mean_and_std(get_blocks: Callable[[], Iterable[np.ndarray]], fill_value: Optional[float] = None
+                             ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nan-aware mean and standard deviation (ddof=1) of each row, accumulated over blocks of columns so only one
+        block is in memory at a time. If fill_value is given missing values are replaced by it.
+
+        Parameters
+        ----------
+        get_blocks
+            callable returning a new iterator over the column blocks each time it is called
+        fill_value
+            value for missing values, if None they are ignored
+
+        """
+        def iter_blocks():
+            for block_values in get_blocks():
+                block_values = np.asarray(block_values, dtype=np.float64)
+                if fill_value is not None:
+                    block_values = np.where(np.isnan(block_values), fill_value, block_values)
+                yield block_values
+
+        total, count = 0, 0
+        for block_values in iter_blocks():
+            total = total + np.nansum(block_values, axis=1)
+            count = count + (~np.isnan(block_values)).sum(axis=1)
+        squares = 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            for block_values in iter_blocks():
+                squares = squares + np.nansum((block_values - mean[:, np.newaxis]) ** 2, axis=1)
+            std = np.sqrt(squares / (count - 1))
+        std[count < 2] = np.nan
+        return mean, std
+
+    def get_pca_data(self, df_to_use: str, level: int, n_components: int = 4, fill_value: float = 0,
+                     fill_na_before_norm: bool = False, solver: str = "exact", batch_size: Optional[int] = None,
+                     random_state: Optional[int] = 0, **kwargs):
+        """
+        Principal component analysis of all samples after standardizing each protein
+
+        Parameters
+        ----------
+        df_to_use
+            which dataframe/intensity should be used
+        level
+            on which level should the data be grouped
+        n_components
+            number of principal components
+        fill_value
+            value for missing intensities
+        fill_na_before_norm
+            If True missing intensities are filled before standardizing, otherwise afterwards
+        solver
+            "exact" uses a full singular value decomposition. "randomized" uses a randomized singular value
+            decomposition which is much faster for many samples and a small n_components. "incremental" fits
+            IncrementalPCA over blocks of samples. The blocks are read from the data tree one at a time, so the
+            matrix of all samples is never created
+        batch_size
+            number of samples per block for the incremental solver, by default 5 * n_components but at least 100
+        random_state
+            seed of the randomized solver
+        kwargs
+            accepts kwargs
+
+        Returns
+        -------
+        A dictionary with the transformed data and the fitted PCA
+
+        """
+        tree = self.all_tree_dict[df_to_use]
+        samples = [(key, data) for key in tree.level_keys_full_name[level] for data in tree[key].get_data()]
+        columns = pd.MultiIndex.from_tuples([(key, data.name) for key, data in samples], names=["level_0", "level_1"])
+        n_samples = len(samples)
+        if solver == "incremental":
+            batch_size = max(5 * n_components, 100) if batch_size is None else max(batch_size, n_components)
+            blocks = list(iter_column_blocks(n_samples, batch_size))
+            # every block needs at least n_components samples
+            if len(blocks) > 1 and blocks[-1].stop - blocks[-1].start < n_components:
+                blocks = blocks[:-2] + [slice(blocks[-2].start, n_samples)]
+            pca = IncrementalPCA(n_components=n_components, batch_size=batch_size)
+        elif solver == "randomized":
+            blocks = [slice(0, n_samples)]
+            pca = PCA(n_components=n_components, svd_solver="randomized", random_state=random_state)
+        elif solver == "exact":
+            blocks = [slice(0, n_samples)]
+            pca = PCA(n_components=n_components, svd_solver="full")
+        else:
+            raise ValueError(f"Invalid PCA solver: {solver}")
+
+        def get_block(block: slice) -> np.ndarray:
+            return pd.concat([data for _, data in samples[block]], axis=1).values
+
+        def standardize(block: slice) -> np.ndarray:
+            # a float64 copy of the block is standardized in place
+            block_values = np.array(get_block(block), dtype=np.float64)
+            if fill_na_before_norm:
+                block_values[np.isnan(block_values)] = fill_value
+            with np.errstate(invalid="ignore", divide="ignore"):
+                block_values -= mean[:, np.newaxis]
+                block_values /= std[:, np.newaxis]
+            if not fill_na_before_norm:
+                block_values[np.isnan(block_values)] = fill_value
+            return block_values.T
+
+        mean, std = self.get_row_mean_and_std(
+            lambda: (get_block(block) for block in blocks), fill_value if fill_na_before_norm else None
+        )
+        if len(blocks) == 1:
+            data_transform = standardize(blocks[0])
+            transformed = pca.fit(data_transform).transform(data_transform)
+        else:
+            for block in blocks:
+                pca.partial_fit(standardize(block))
+            transformed = np.concatenate([pca.transform(standardize(block)) for block in blocks])
+        df = pd.DataFrame(transformed.T, columns=columns,
                           index=[f"PC_{i}" for i in range(1, n_components + 1)])
         return {"pca_data": df, "pca_fit": pca}
 
@@ -759,7 +1324,7 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_pca_results(**data, **plot_kwargs)
+                    plot = self._render("save_pca_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -795,7 +1360,7 @@ class BasePlotter:
                     plot_kwargs = dict(level=level, df_to_use=df_to_use, save_path=self.file_dir_descriptive,
                                        intensity_label=self.intensity_label_names[df_to_use])
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_boxplot_results(**data, **plot_kwargs)
+                    plot = self._render("save_boxplot_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -817,7 +1382,7 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_n_proteins_vs_quantile_results(**data, **plot_kwargs)
+                    plot = self._render("save_n_proteins_vs_quantile_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -835,7 +1400,7 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_kde_results(**data, **plot_kwargs)
+                    plot = self._render("save_kde_results", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
@@ -852,7 +1417,8 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_normalization_overview_results(
+                    plot = self._render(
+                        "save_normalization_overview_results",
                         **n_prot_data, **kde_data, **boxplot_data, **plot_kwargs
                     )
                     plots.append(plot)
@@ -884,11 +1450,15 @@ class BasePlotter:
                     plot_kwargs = dict(intensity_label=self.intensity_label_names[df_to_use],
                                        df_to_use=df_to_use, level=level, save_path=self.file_dir_descriptive)
                     plot_kwargs.update(**kwargs)
-                    plot = matplotlib_plots.save_intensities_heatmap_result(**data, **plot_kwargs)
+                    plot = self._render("save_intensities_heatmap_result", **data, **plot_kwargs)
                     plots.append(plot)
         return plots
 
     def plot_all_normalizer_overview(self, dfs_to_use, levels, plot_function, file_name, **kwargs):
+        """
+        Creates the plots of plot_function for all normalizers in one pdf. Each figure is written to the pdf and
+        cleared as soon as it is created, so the returned plots are None.
+        """
         max_depth = dict_depth(self.analysis_design)
         if self.configs.get("has_replicates", False):
             max_depth -= 1
@@ -897,15 +1467,23 @@ class BasePlotter:
         normalizers.update(self.normalizers)
         plot_kwargs = dict()
         plot_kwargs.update(**kwargs)
-        plot_kwargs.update({"save_path": None})
-        for df_to_use in dfs_to_use:
-            for normaliser_name, normalizer in normalizers.items():
-                self.add_normalized_option(df_to_use, normalizer, normaliser_name)
-            dfs = [x for x in self.all_tree_dict if x.startswith(df_to_use.replace("_log2", ""))]
-            if "log2" in df_to_use:
-                dfs = [x for x in dfs if x.endswith("log2")]
-            plots += plot_function(dfs, max_depth - 1, **plot_kwargs)
-        matplotlib_plots.collect_plots_to_pdf(os.path.join(self.file_dir_descriptive, file_name), *plots)
+        # the plots are streamed into one file, in data mode the data of each plot is saved
+        if self.data_exporter is None:
+            plot_kwargs.update({"save_path": None})
+            self.figure_sink = matplotlib_plots.PdfSink(os.path.join(self.file_dir_descriptive, file_name),
+                                                        dpi=kwargs.get("dpi", 200))
+        try:
+            for df_to_use in dfs_to_use:
+                for normaliser_name, normalizer in normalizers.items():
+                    self.add_normalized_option(df_to_use, normalizer, normaliser_name)
+                dfs = [x for x in self.all_tree_dict if x.startswith(df_to_use.replace("_log2", ""))]
+                if "log2" in df_to_use:
+                    dfs = [x for x in dfs if x.endswith("log2")]
+                plots += plot_function(dfs, max_depth - 1, **plot_kwargs)
+        finally:
+            if self.figure_sink is not None:
+                self.figure_sink.close()
+                self.figure_sink = None
         return plots
 
     @validate_input
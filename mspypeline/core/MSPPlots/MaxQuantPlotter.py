@@ -3,12 +3,12 @@ import os
 
 import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
 
 from mspypeline.core import MSPInitializer
 from mspypeline.core.MSPPlots import BasePlotter
-from mspypeline.plotting_backend import matplotlib_plots
+from mspypeline.helpers import lazy_import
+
+matplotlib_plots = lazy_import("mspypeline.plotting_backend.matplotlib_plots")
 
 
 class MQReader:  # TODO currently circular dependency
@@ -62,6 +62,9 @@ class MaxQuantPlotter(BasePlotter):
         return super().from_file_reader(reader_instance, **default_kwargs)
 
     def create_report(self):
+        from matplotlib import pyplot as plt
+        from matplotlib.backends.backend_pdf import PdfPages
+
         def bar_from_counts(ax, counts, compare_counts=None, title=None, relative=False, yscale=None, bar_kwargs=None):
             if relative:
                 ax.set_ylabel("Relative counts")
@@ -144,6 +144,8 @@ class MSPGUI(tk.Tk):
         self.plot_row("Relative std", "relative_std")
         self.plot_row("Scatter replicates", "scatter_replicates")
         self.plot_row("Experiment comparison", "experiment_comparison")
+        self.plot_row("Experiment comparison matrix", "experiment_comparison_matrix")
+        self.plot_row("Correlation heatmap", "correlation_heatmap")
         self.plot_row("Rank", "rank")
 
         tk.Label(self, text="Statistical inference", font="Helvetica 10 bold").grid(
@@ -26,10 +26,12 @@ class DataDict(dict):
 
 
 class BaseReader(ABC):
-    def __init__(self, start_dir: str, reader_config: dict, loglevel=logging.DEBUG):
+    def __init__(self, start_dir: str, reader_config: dict, dtype: str = "float64", loglevel=logging.DEBUG):
         self.full_data = DataDict(data_source=self)
         self.start_dir = start_dir
         self.reader_config = reader_config
+        # floating point type of the intensities
+        self.dtype = dtype
         self.logger = get_logger(self.__class__.__name__, loglevel)
 
         # log which files will be read
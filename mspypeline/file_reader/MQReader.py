@@ -25,8 +25,9 @@ class MQReader(BaseReader):
                  reader_config: dict,
                  index_col: str = "Gene name",
                  duplicate_handling: str = "sum",
+                 dtype: str = "float64",
                  loglevel=logging.DEBUG):
-        super().__init__(start_dir, reader_config, loglevel=loglevel)
+        super().__init__(start_dir, reader_config, dtype=dtype, loglevel=loglevel)
         # TODO connect this to the configs of the initializer
         self.data_dir = os.path.join(self.start_dir, "txt")  # TODO only add this if is not there
         self.index_col = index_col
@@ -38,6 +39,7 @@ class MQReader(BaseReader):
             file_dir = os.path.join(self.data_dir, self.proteins_txt)
             df = pd.read_csv(file_dir, sep="\t", nrows=5)
             self.proteins_txt_columns = df.columns
+            self.proteins_txt_dtypes = df.dtypes
         except FileNotFoundError:
             raise MissingFilesException("Could find all of: " + ", ".join(MQReader.required_files))
 
@@ -145,9 +147,22 @@ class MQReader(BaseReader):
         raise NotImplementedError("This is not implemented at the moment. Please stick to the naming convention")
         # TODO update the attempted matching mechanism
 
+    @staticmethod
+    def is_intensity_column(col: str) -> bool:
+        return "Intensity " in col or "LFQ " in col or "iBAQ " in col
+
     def preprocess_proteinGroups(self):
         file_dir = os.path.join(self.data_dir, MQReader.proteins_txt)
-        df_protein_groups = pd.read_csv(file_dir, sep="\t")
+        # intensity columns are downcast while reading, non numeric ones are converted below
+        intensity_dtypes = {col: self.dtype for col, dtype in self.proteins_txt_dtypes.items()
+                            if self.is_intensity_column(col) and is_numeric_dtype(dtype)}
+        try:
+            df_protein_groups = pd.read_csv(file_dir, sep="\t", dtype=intensity_dtypes)
+        except ValueError:
+            # the dtypes are guessed from the first rows, later rows might e.g. contain decimal commas
+            self.logger.debug("Could not read the intensities of %s as numbers, converting them after reading",
+                              MQReader.proteins_txt)
+            df_protein_groups = pd.read_csv(file_dir, sep="\t")
         df_protein_groups.columns = self.rename_df_columns(df_protein_groups.columns)
         not_contaminants = (df_protein_groups[
                                 ["Only identified by site", "Reverse", "Potential contaminant"]] == "+"
@@ -199,10 +214,10 @@ class MQReader(BaseReader):
         self.logger.info("Setting index of %s to %s", MQReader.proteins_txt, self.index_col)
         df_protein_groups = df_protein_groups.set_index(df_protein_groups[self.index_col], drop=False)
         # convert all non numeric intensities
-        for col in [col for col in df_protein_groups.columns if "Intensity " in col or "LFQ " in col or "iBAQ " in col]:
+        for col in [col for col in df_protein_groups.columns if self.is_intensity_column(col)]:
             if not is_numeric_dtype(df_protein_groups[col]):
-                df_protein_groups[col] = df_protein_groups[col].apply(lambda x: x.replace(",", ".")).fillna(0)
-                df_protein_groups[col] = df_protein_groups[col].astype("int64")
+                df_protein_groups[col] = df_protein_groups[col].str.replace(",", ".").fillna(0)
+            df_protein_groups[col] = df_protein_groups[col].astype(self.dtype)
         # handle all rows with duplicated index column
         duplicates = df_protein_groups.duplicated(subset=self.index_col, keep=False)
         if any(duplicates):
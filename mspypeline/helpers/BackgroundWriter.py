@@ -0,0 +1,97 @@
+import logging
+import queue
+import threading
+from typing import Callable, List
+
+from mspypeline.helpers.Logger import get_logger
+
+
+class BackgroundWriter:
+    """
+    Runs write functions, e.g. saving a figure or a csv file, in a background thread, so the caller can continue
+    while the previous results are serialized and written to disk. At most max_pending writes are queued, submitting
+    another one blocks until a write is finished. Errors of the writes are collected and raised by flush.
+
+    The objects passed to a write must not be changed by the caller afterwards.
+    """
+    def __init__(self, max_pending: int = 8, loglevel: int = logging.DEBUG):
+        """
+        Parameters
+        ----------
+        max_pending
+            maximum number of queued writes
+        loglevel
+            loglevel of the logger
+        """
+        self.logger = get_logger(self.__class__.__name__, loglevel)
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors: List[Exception] = []
+        self.thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # do not mask an error of the caller by an error of a write
+        self.close(raise_errors=exc_type is None)
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                write_function, args, kwargs = task
+                write_function(*args, **kwargs)
+            except Exception as e:
+                self.logger.debug("Error in background write: %s", e)
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, write_function: Callable, *args, **kwargs):
+        """
+        Queues write_function(*args, **kwargs)
+
+        Raises
+        ------
+        RuntimeError
+            if the writer was closed
+        """
+        if not self.thread.is_alive():
+            raise RuntimeError("The writer was closed")
+        self.queue.put((write_function, args, kwargs))
+
+    def flush(self):
+        """
+        Waits until all queued writes are done
+
+        Raises
+        ------
+        Exception
+            the first error of the writes since the last flush
+        """
+        self.queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            if len(errors) > 1:
+                self.logger.warning("%s background writes failed, raising the first error", len(errors))
+            raise errors[0]
+
+    def close(self, raise_errors: bool = True):
+        """
+        Finishes all queued writes and stops the thread
+
+        Parameters
+        ----------
+        raise_errors
+            if the errors of the writes should be raised like in flush or discarded
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if raise_errors:
+            self.flush()
+        else:
+            self.errors = []
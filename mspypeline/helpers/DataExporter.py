@@ -0,0 +1,132 @@
+import importlib.util
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from mspypeline.helpers.Logger import get_logger
+from mspypeline.helpers.Utils import get_plot_name_suffix
+
+
+class DataExporter:
+    """
+    Saves the data of plots instead of the figures. The DataFrames, Series, arrays and sets passed to a plot are each
+    written to one file, all other arguments like the intensity label are recorded as settings. A json index lists the
+    files and settings of every plot.
+
+    Files are named after the plotting function, e.g. save_rank_results(rank_data=...) with df_to_use raw and level 0
+    is saved as rank_raw_level_0_rank_data.parquet. Plots with the same name are numbered in the order they are saved.
+    """
+    data_formats = {
+        "parquet": ("pyarrow", "fastparquet"),
+        "feather": ("pyarrow",),
+        "csv": ()
+    }
+
+    def __init__(self, index_path: str, data_format: str = "parquet", loglevel: int = logging.DEBUG):
+        """
+        Parameters
+        ----------
+        index_path
+            path of the json index
+        data_format
+            "parquet", "feather" or "csv". Parquet and feather require pyarrow, parquet also works with fastparquet
+        loglevel
+            loglevel of the logger
+
+        Raises
+        ------
+        ValueError
+            if the data_format is unknown
+        ImportError
+            if no library to write the data_format is installed
+        """
+        self.logger = get_logger(self.__class__.__name__, loglevel)
+        if data_format not in self.data_formats:
+            raise ValueError(f"data_format should be one of {list(self.data_formats)}, got {data_format}")
+        engines = self.data_formats[data_format]
+        if engines and not any(importlib.util.find_spec(engine) for engine in engines):
+            raise ImportError(f"Saving data as {data_format} requires one of: {', '.join(engines)}")
+        self.index_path = index_path
+        self.data_format = data_format
+        self.index: Dict[str, dict] = {}
+
+    def export(self, plot_function_name: str, save_path: Optional[str], **kwargs):
+        """
+        Saves the data of a plot
+
+        Parameters
+        ----------
+        plot_function_name
+            name of the plotting function, e.g. save_rank_results
+        save_path
+            directory of the files. If None nothing is saved
+        kwargs
+            arguments of the plotting function
+        """
+        if save_path is None:
+            return
+        data, settings = {}, {}
+        for key, value in kwargs.items():
+            self._collect(key, key, value, data, settings)
+        name = plot_function_name.replace("save_", "", 1).replace("_results", "").replace("_result", "")
+        name += get_plot_name_suffix(df_to_use=kwargs.get("df_to_use"), level=kwargs.get("level"))
+        unique_name, i = name, 1
+        while unique_name in self.index:
+            unique_name = f"{name}_{i}"
+            i += 1
+        os.makedirs(save_path, exist_ok=True)
+        files = {}
+        for path, df in data.items():
+            file_path = os.path.join(save_path, f"{unique_name}_{path}.{self.data_format}")
+            self._write(df, file_path)
+            files[path] = os.path.relpath(file_path, os.path.dirname(self.index_path))
+        self.logger.debug("saved data of %s", unique_name)
+        self.index[unique_name] = {"function": plot_function_name, "files": files, "settings": settings}
+
+    def _collect(self, key: str, path: str, value: Any, data: Dict[str, pd.DataFrame], settings: dict):
+        if isinstance(value, pd.DataFrame):
+            data[path] = value
+        elif isinstance(value, pd.Series):
+            data[path] = value.to_frame(name=key if value.name is None else value.name)
+        elif isinstance(value, np.ndarray) and value.ndim > 0:
+            data[path] = pd.DataFrame(value.reshape(len(value), -1))
+        elif isinstance(value, (set, frozenset)):
+            data[path] = pd.DataFrame({key: sorted(value, key=str)})
+        elif isinstance(value, dict):
+            sub_settings = {}
+            for sub_key, sub_value in value.items():
+                self._collect(str(sub_key), f"{path}_{sub_key}", sub_value, data, sub_settings)
+            if sub_settings:
+                settings[key] = sub_settings
+        elif isinstance(value, np.generic):
+            settings[key] = value.item()
+        else:
+            settings[key] = value
+
+    def _write(self, df: pd.DataFrame, file_path: str):
+        if self.data_format == "csv":
+            df.to_csv(file_path)
+            return
+        # columnar formats require string column names
+        if not isinstance(df.columns, pd.MultiIndex):
+            df = df.rename(columns=str)
+        if self.data_format == "parquet":
+            df.to_parquet(file_path)
+        else:
+            # feather does not store the index
+            df.reset_index().rename(columns=str).to_feather(file_path)
+
+    def write_index(self):
+        """
+        Writes the json index of all saved plots
+        """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        index = {"data_format": self.data_format, "plots": self.index}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, default=str)
+        os.replace(tmp_path, self.index_path)
@@ -1,11 +1,14 @@
-from typing import Optional, Dict, Tuple, Iterator, Union, Iterable
+from typing import Optional, Dict, Tuple, Iterator, Union, Iterable, Any
+import hashlib
+import importlib.util
+import sys
+from types import ModuleType
 import pandas as pd
 from collections.abc import Sized
 from collections import defaultdict as ddict
 from itertools import combinations
 from collections import deque
 import numpy as np
-from matplotlib.lines import Line2D
 
 
 def get_number_rows_cols_for_fig(obj: Union[int, Sized]) -> Tuple[int, int]:
@@ -92,14 +95,72 @@ def plot_annotate_line(ax, row1, row2, x, data,  fs: int = None, maxasterix: int
     ax.text(x, midy, text, rotation=-90, **kwargs)
 
 
-def venn_names(named_sets: Dict[str, set]) -> Iterator[Tuple[set, set, set]]:
+def get_venn_intersections(named_sets: Dict[str, set]) -> Dict[Tuple[str, ...], set]:
+    """
+    Each element is encoded as bitmask of the sets containing it. Elements with the same bitmask form the exclusive
+    intersection of these sets, so all intersections are found with a single np.unique instead of one set operation per
+    combination of sets.
+
+    Parameters
+    ----------
+    named_sets
+        maps the name of a set to its elements
+
+    Returns
+    -------
+    Maps the names of the intersected sets to the elements which are only part of these sets. Only non-empty
+    intersections are contained.
+
+    """
+    names = sorted(named_sets)
+    elements = pd.Index(pd.unique(np.array([e for name in names for e in named_sets[name]], dtype=object)))
+    membership = np.zeros((len(elements), len(names)), dtype=bool)
+    for i, name in enumerate(names):
+        membership[elements.get_indexer(list(named_sets[name])), i] = True
+    # rows of the packed membership are the bitmasks of the elements
+    bitmasks = np.packbits(membership, axis=1, bitorder="little")
+    unique_bitmasks, inverse, counts = np.unique(bitmasks, axis=0, return_inverse=True, return_counts=True)
+    unique_membership = np.unpackbits(unique_bitmasks, axis=1, count=len(names), bitorder="little").astype(bool)
+    grouped_elements = np.split(elements.values[np.argsort(inverse.reshape(-1), kind="stable")], np.cumsum(counts)[:-1])
+    return {
+        tuple(name for name, is_member in zip(names, mask) if is_member): set(group)
+        for mask, group in zip(unique_membership, grouped_elements)
+    }
+
+
+def venn_names(named_sets: Dict[str, set], only_nonempty: bool = False) -> Iterator[Tuple[tuple, set, set]]:
+    """
+    Exclusive intersections of all combinations of sets. The combinations are ordered by the number of intersected
+    sets and then by the sorted set names.
+
+    Parameters
+    ----------
+    named_sets
+        maps the name of a set to its elements
+    only_nonempty
+        If True only the combinations with at least one element are returned. Otherwise all 2^n - 1 combinations are
+        returned, which is only feasible for few sets.
+
+    Returns
+    -------
+    Iterator over the names of the intersected sets, the names of all other sets and the elements which are only part
+    of the intersected sets
+
+    See Also
+    --------
+    get_venn_intersections : computes the non-empty intersections
+
+    """
     names = set(named_sets)
-    for i in range(1, len(named_sets) + 1):
-        for to_intersect in combinations(sorted(named_sets), i):
-            others = names.difference(to_intersect)
-            intersected = set.intersection(*(named_sets[k] for k in to_intersect))
-            unioned = set.union(*(named_sets[k] for k in others)) if others else set()
-            yield to_intersect, others, intersected - unioned
+    intersections = get_venn_intersections(named_sets)
+    if only_nonempty:
+        positions = {name: i for i, name in enumerate(sorted(named_sets))}
+        combinations_to_yield = sorted(intersections, key=lambda x: (len(x), [positions[name] for name in x]))
+    else:
+        combinations_to_yield = (to_intersect for i in range(1, len(named_sets) + 1)
+                                 for to_intersect in combinations(sorted(named_sets), i))
+    for to_intersect in combinations_to_yield:
+        yield to_intersect, names.difference(to_intersect), intersections.get(to_intersect, set())
 
 
 def install_r_dependencies(r_package_names, r_bioconducter_package_names):
@@ -170,6 +231,7 @@ def get_legend_elements(labels: list, color_map: Optional[dict] = None):
             dict of strings, with keys being the name of a label and values the corresponding color
 
     """
+    from matplotlib.lines import Line2D
     if color_map is None:
         color_map = {name: f"C{i}" for i, name in enumerate(labels)}
     legend_elements = [Line2D([0], [0], marker='o', color='w', label=name,
@@ -178,6 +240,33 @@ def get_legend_elements(labels: list, color_map: Optional[dict] = None):
     return legend_elements
 
 
+def lazy_import(name: str) -> ModuleType:
+    """
+    Imports a module once one of its attributes is used. This keeps e.g. matplotlib from being imported if no plots
+    are created. Before python 3.12 the first use is not thread safe, so the module should be loaded, e.g. by using
+    one of its attributes, before several threads use it.
+
+    Parameters
+    ----------
+    name
+        full name of the module
+
+    Returns
+    -------
+    the module, which is executed on first attribute access
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
 def get_plot_name_suffix(df_to_use: Optional[str] = None, level: Optional[int] = None) -> str:
     """
     Generate a suffix for the plot name
@@ -197,3 +286,70 @@ def get_plot_name_suffix(df_to_use: Optional[str] = None, level: Optional[int] =
     s = "" if df_to_use is None else f"_{df_to_use}"
     s += "" if level is None else f"_level_{level}"
     return s
+
+
+def _update_fingerprint(hasher, obj: Any):
+    # the type is part of the fingerprint, so e.g. 1 and "1" or a list and a tuple differ
+    hasher.update(type(obj).__name__.encode())
+    if obj is None or isinstance(obj, (str, bytes, bool, int, float, np.generic)):
+        hasher.update(repr(obj).encode())
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        if isinstance(obj, pd.DataFrame):
+            _update_fingerprint(hasher, obj.columns.tolist())
+            _update_fingerprint(hasher, [str(dtype) for dtype in obj.dtypes])
+        else:
+            _update_fingerprint(hasher, obj.name)
+            _update_fingerprint(hasher, str(obj.dtype))
+        _update_fingerprint(hasher, list(obj.index.names))
+        try:
+            hasher.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        except TypeError:
+            # cells which can not be hashed by pandas, e.g. sets
+            _update_fingerprint(hasher, obj.index.tolist())
+            _update_fingerprint(hasher, obj.values.tolist())
+    elif isinstance(obj, pd.Index):
+        _update_fingerprint(hasher, obj.tolist())
+    elif isinstance(obj, np.ndarray):
+        hasher.update(repr((obj.dtype.str, obj.shape)).encode())
+        if obj.dtype == object:
+            _update_fingerprint(hasher, obj.tolist())
+        else:
+            hasher.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        hasher.update(str(len(obj)).encode())
+        for key in sorted(obj, key=repr):
+            _update_fingerprint(hasher, key)
+            _update_fingerprint(hasher, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(str(len(obj)).encode())
+        for value in obj:
+            _update_fingerprint(hasher, value)
+    elif isinstance(obj, (set, frozenset)):
+        _update_fingerprint(hasher, sorted(obj, key=repr))
+    else:
+        raise TypeError(f"Can not create a fingerprint of {type(obj)}")
+
+
+def get_fingerprint(*objects: Any) -> str:
+    """
+    Creates a fingerprint of the content of objects, which is the same for equal objects in every python session.
+
+    Parameters
+    ----------
+    objects
+        can be nested dicts, lists, tuples and sets of pandas objects, numpy arrays, strings and numbers
+
+    Returns
+    -------
+    the sha1 hex digest of the objects
+
+    Raises
+    ------
+    TypeError
+        if any of the objects is of another type, e.g. a figure
+
+    """
+    hasher = hashlib.sha1()
+    for obj in objects:
+        _update_fingerprint(hasher, obj)
+    return hasher.hexdigest()
@@ -94,6 +94,31 @@ class DataNode:
                     n_children += 1
         return n_children
 
+    def get_data(self, go_max_depth: bool = False) -> List[pd.Series]:
+        """
+
+        Parameters
+        ----------
+        go_max_depth
+            If technical replicates were aggregated, this can be specified to use the unaggregated values instead.
+
+        Returns
+        -------
+        List[pd.Series]
+            The data of all nodes below this one, in the order of the columns of aggregate with method None
+        """
+        queue = deque([self])
+        data = []
+        while queue:
+            parent = queue.popleft()
+            should_go_deeper = go_max_depth and parent.children
+            if parent.data is not None and not should_go_deeper:
+                data.append(parent.data)
+            else:
+                for child in parent:
+                    queue += [child]
+        return data
+
     def aggregate(self,
                   method: Union[None, str, Callable] = "mean",
                   go_max_depth: bool = False,
@@ -114,26 +139,19 @@ class DataNode:
         Union[pd.Series, pd.DataFrame]
             Result of the aggregation
         """
-        queue = deque([self])
         data = []
-        while queue:
-            parent = queue.popleft()
-            should_go_deeper = go_max_depth and parent.children
-            if parent.data is not None and not should_go_deeper:
-                if index is not None:
-                    # append only the items in the index
-                    series_data = parent.data.loc[index]
-                    if not isinstance(series_data, pd.Series):
-                        series_data = pd.Series(series_data, name=parent.data.name, index=[index])
-                    data.append(series_data)
-                else:
-                    data.append(parent.data)
+        for node_data in self.get_data(go_max_depth):
+            if index is not None:
+                # append only the items in the index
+                series_data = node_data.loc[index]
+                if not isinstance(series_data, pd.Series):
+                    series_data = pd.Series(series_data, name=node_data.name, index=[index])
+                data.append(series_data)
             else:
-                for child in parent:
-                    queue += [child]
+                data.append(node_data)
         data = pd.concat(data, axis=1)
         if method is not None:
-            data = data.aggregate(method, axis=1).rename(self.full_name, axis=1)
+            data = data.aggregate(method, axis=1).rename(self.full_name)
         return data
 
     def groupby(
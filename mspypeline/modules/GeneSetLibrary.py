@@ -0,0 +1,331 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from mspypeline.helpers import get_logger
+
+
+class GeneSetLibrary:
+    """
+    Collection of gene sets, e.g. pathways, GO terms or a GMT file from MSigDB.
+    The genes are encoded as integer ids into the sorted array of all genes and the membership of the sets is stored
+    in compressed sparse row (CSR) format, so the genes of set i are ``genes[indices[indptr[i]:indptr[i + 1]]]``.
+    A compiled library is saved as plain .npy files which are memory-mapped when loaded.
+
+    Attributes
+    ----------
+    set_names
+        names of all gene sets
+    descriptions
+        description of each gene set
+    genes
+        sorted names of all genes, the position of a gene is its integer id
+    indptr
+        start of the genes of each set in indices, has one entry more than there are sets
+    indices
+        integer ids of the genes of all sets, sorted within each set
+    """
+    array_names = ("set_names", "descriptions", "genes", "indptr", "indices")
+    meta_file_name = "meta.json"
+    version = 1
+
+    def __init__(self, set_names: np.ndarray, descriptions: np.ndarray, genes: np.ndarray, indptr: np.ndarray,
+                 indices: np.ndarray, loglevel: int = logging.DEBUG):
+        self.logger = get_logger(self.__class__.__name__, loglevel)
+        self.set_names = set_names
+        self.descriptions = descriptions
+        self.genes = genes
+        self.indptr = indptr
+        self.indices = indices
+        self._set_positions = None
+        # transposed membership to look up the sets of a gene, only created when needed
+        self._gene_indptr = None
+        self._gene_indices = None
+
+    def __len__(self):
+        return len(self.set_names)
+
+    def __contains__(self, set_name):
+        return set_name in self.set_positions
+
+    def __repr__(self):
+        return f"GeneSetLibrary(n_sets={len(self)}, n_genes={len(self.genes)}, n_entries={len(self.indices)})"
+
+    @classmethod
+    def from_gene_sets(cls, gene_sets: Dict[str, Iterable[str]], descriptions: Optional[Dict[str, str]] = None,
+                       loglevel: int = logging.DEBUG) -> "GeneSetLibrary":
+        """
+        Parameters
+        ----------
+        gene_sets
+            maps the name of each set to its genes. Duplicated, empty and missing genes are removed
+        descriptions
+            maps the name of a set to its description. Sets without description use their name
+        loglevel
+            loglevel of the logger
+
+        Returns
+        -------
+        the library with the sets in the order of gene_sets
+        """
+        descriptions = {} if descriptions is None else descriptions
+        set_names = list(gene_sets)
+        set_genes = [[gene for gene in gene_sets[name] if isinstance(gene, str) and gene] for name in set_names]
+        lengths = np.array([len(genes) for genes in set_genes], dtype=np.int64)
+        # factorizing by hashing is much faster than sorting all strings, only the unique genes are sorted
+        codes, genes = pd.factorize(np.array(list(chain.from_iterable(set_genes)), dtype=object))
+        genes = np.asarray(genes, dtype=str)
+        order = np.argsort(genes)
+        genes = genes[order]
+        gene_ids = np.empty(len(order), dtype=np.int64)
+        gene_ids[order] = np.arange(len(order))
+        gene_ids = gene_ids[codes]
+        set_ids = np.repeat(np.arange(len(set_names), dtype=np.int64), lengths)
+        # sort the entries by set and gene id and drop genes listed more than once in a set
+        order = np.lexsort((gene_ids, set_ids))
+        set_ids, gene_ids = set_ids[order], gene_ids[order]
+        keep = np.ones(len(set_ids), dtype=bool)
+        keep[1:] = (set_ids[1:] != set_ids[:-1]) | (gene_ids[1:] != gene_ids[:-1])
+        set_ids, gene_ids = set_ids[keep], gene_ids[keep]
+        indptr = np.zeros(len(set_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(set_ids, minlength=len(set_names)), out=indptr[1:])
+        return cls(
+            set_names=np.array(set_names, dtype=str),
+            descriptions=np.array([descriptions.get(name, name) for name in set_names], dtype=str),
+            genes=genes.astype(str),
+            indptr=indptr,
+            indices=gene_ids.astype(np.int32),
+            loglevel=loglevel
+        )
+
+    @staticmethod
+    def read_gmt(file_path: str) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+        """
+        Reads a file in the gene matrix transposed (GMT) format, which contains one tab separated line per set with the
+        name, the description and the genes of the set.
+
+        Parameters
+        ----------
+        file_path
+            path to the GMT file
+
+        Returns
+        -------
+        the genes and the descriptions of each set
+        """
+        gene_sets, descriptions = {}, {}
+        with open(file_path) as f:
+            for line in f:
+                fields = line.rstrip("\r\n").split("\t")
+                if len(fields) < 2 or not fields[0]:
+                    continue
+                name = fields[0]
+                descriptions[name] = fields[1]
+                gene_sets[name] = gene_sets.get(name, []) + [gene for gene in map(str.strip, fields[2:]) if gene]
+        return gene_sets, descriptions
+
+    @classmethod
+    def from_gmt(cls, file_path: str, loglevel: int = logging.DEBUG) -> "GeneSetLibrary":
+        """
+        Parameters
+        ----------
+        file_path
+            path to the GMT file
+        loglevel
+            loglevel of the logger
+
+        See Also
+        --------
+        read_gmt : parses the file
+        compile : reuses a compiled version of the file
+        """
+        gene_sets, descriptions = cls.read_gmt(file_path)
+        return cls.from_gene_sets(gene_sets, descriptions, loglevel=loglevel)
+
+    def save(self, dir_: str):
+        """
+        Saves the library as one .npy file per array, which can be memory-mapped by load
+
+        Parameters
+        ----------
+        dir_
+            directory for the files, will be created if it does not exist
+        """
+        os.makedirs(dir_, exist_ok=True)
+        for array_name in GeneSetLibrary.array_names:
+            np.save(os.path.join(dir_, array_name + ".npy"), np.asarray(getattr(self, array_name)))
+
+    @classmethod
+    def load(cls, dir_: str, mmap_mode: Optional[str] = "r", loglevel: int = logging.DEBUG) -> "GeneSetLibrary":
+        """
+        Parameters
+        ----------
+        dir_
+            directory of a saved library
+        mmap_mode
+            passed to np.load, by default the arrays are memory-mapped read only
+        loglevel
+            loglevel of the logger
+        """
+        arrays = {array_name: np.load(os.path.join(dir_, array_name + ".npy"), mmap_mode=mmap_mode)
+                  for array_name in GeneSetLibrary.array_names}
+        return cls(**arrays, loglevel=loglevel)
+
+    @staticmethod
+    def get_fingerprint(file_path: str) -> str:
+        """
+        Identifies a version of a file by its path, size and modification time
+        """
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{GeneSetLibrary.version}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    @classmethod
+    def compile(cls, file_path: str, cache_dir: str, loglevel: int = logging.DEBUG) -> "GeneSetLibrary":
+        """
+        Loads a GMT file from the compiled cache. The file is only parsed if it was not compiled before or if it has
+        changed since then.
+
+        Parameters
+        ----------
+        file_path
+            path to the GMT file
+        cache_dir
+            directory containing the compiled libraries
+        loglevel
+            loglevel of the logger
+
+        Returns
+        -------
+        the memory-mapped library
+        """
+        logger = get_logger(cls.__name__, loglevel)
+        fingerprint = cls.get_fingerprint(file_path)
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        library_dir = os.path.join(cache_dir, name)
+        meta_path = os.path.join(library_dir, GeneSetLibrary.meta_file_name)
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") == fingerprint:
+                logger.debug("Loading compiled gene set library %s", library_dir)
+                return cls.load(library_dir, loglevel=loglevel)
+        logger.info("Compiling gene set library from %s", file_path)
+        library = cls.from_gmt(file_path, loglevel=loglevel)
+        # write to a temporary directory first, so an interrupted compilation never leaves a broken cache
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        library.save(tmp_dir)
+        with open(os.path.join(tmp_dir, GeneSetLibrary.meta_file_name), "w") as f:
+            json.dump({"fingerprint": fingerprint, "source": os.path.abspath(file_path),
+                       "n_sets": len(library), "n_genes": len(library.genes)}, f)
+        shutil.rmtree(library_dir, ignore_errors=True)
+        os.replace(tmp_dir, library_dir)
+        return cls.load(library_dir, loglevel=loglevel)
+
+    @property
+    def set_positions(self) -> Dict[str, int]:
+        if self._set_positions is None:
+            self._set_positions = {name: i for i, name in enumerate(self.set_names.tolist())}
+        return self._set_positions
+
+    def get_gene_ids(self, genes: Iterable[str]) -> np.ndarray:
+        """
+        Integer ids of genes, genes which are not part of the library have the id -1
+        """
+        genes = np.asarray(list(genes), dtype=str)
+        positions = np.searchsorted(self.genes, genes)
+        positions[positions == len(self.genes)] = 0
+        found = (self.genes[positions] == genes) if len(self.genes) else np.zeros(len(genes), dtype=bool)
+        return np.where(found, positions, -1)
+
+    def get_genes(self, set_name: str) -> List[str]:
+        """
+        Parameters
+        ----------
+        set_name
+            name of the gene set
+
+        Returns
+        -------
+        the sorted genes of the set
+
+        Raises
+        ------
+        KeyError
+            if the library does not contain the set
+        """
+        position = self.set_positions[set_name]
+        return self.genes[self.indices[self.indptr[position]:self.indptr[position + 1]]].tolist()
+
+    def get_description(self, set_name: str) -> str:
+        return str(self.descriptions[self.set_positions[set_name]])
+
+    def get_sets_of_gene(self, gene: str) -> List[str]:
+        """
+        Parameters
+        ----------
+        gene
+            name of the gene
+
+        Returns
+        -------
+        names of all sets containing the gene
+        """
+        gene_id = self.get_gene_ids([gene])[0]
+        if gene_id < 0:
+            return []
+        if self._gene_indptr is None:
+            set_ids = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind="stable")
+            self._gene_indices = set_ids[order]
+            self._gene_indptr = np.zeros(len(self.genes) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.genes)), out=self._gene_indptr[1:])
+        return self.set_names[self._gene_indices[self._gene_indptr[gene_id]:self._gene_indptr[gene_id + 1]]].tolist()
+
+    def membership_matrix(self, index: Iterable[str], set_names: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        index
+            genes of the rows, e.g. the index of an intensity DataFrame
+        set_names
+            sets of the columns. If None all sets are used
+
+        Returns
+        -------
+        boolean matrix with shape genes x sets which is True if a gene is part of a set
+        """
+        index = pd.Index(index)
+        set_positions = np.arange(len(self)) if set_names is None else \
+            np.array([self.set_positions[name] for name in set_names], dtype=np.int64)
+        membership = np.zeros((len(index), len(set_positions)), dtype=bool)
+        if len(self.genes) == 0 or len(index) == 0:
+            return membership
+        if not index.is_unique:
+            codes, unique_index = pd.factorize(index)
+            return self.membership_matrix(unique_index, set_names)[codes]
+        # position of each library gene in the index
+        gene_rows = index.get_indexer(self.genes)
+        starts, stops = np.asarray(self.indptr)[set_positions], np.asarray(self.indptr)[set_positions + 1]
+        lengths = stops - starts
+        columns = np.repeat(np.arange(len(set_positions)), lengths)
+        entries = np.repeat(stops - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        rows = gene_rows[np.asarray(self.indices)[entries]]
+        found = rows >= 0
+        membership[rows[found], columns[found]] = True
+        return membership
+
+    def to_dict(self, set_names: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+        """
+        Maps the name of each set to its genes
+        """
+        set_names = self.set_names.tolist() if set_names is None else set_names
+        return {name: self.get_genes(name) for name in set_names}
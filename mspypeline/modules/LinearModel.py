@@ -0,0 +1,211 @@
+import logging
+from itertools import combinations
+from typing import Dict, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from mspypeline.helpers import get_logger
+from mspypeline.modules.DataStructure import DataTree
+from mspypeline.modules.Statistics import squeeze_var, benjamini_hochberg
+
+
+class LinearModel:
+    """
+    Fits one linear model per protein with a shared design matrix, similar to lmFit from limma.
+    Proteins are grouped by their pattern of missing values and each pattern is factorised with one QR decomposition,
+    so thousands of proteins are fitted with a few matrix operations.
+
+    Attributes
+    ----------
+    coefficients
+        estimated coefficients with shape proteins x coefficients
+    standard_errors
+        standard errors of the coefficients with shape proteins x coefficients
+    sigma
+        residual standard deviation of each protein
+    df_residual
+        residual degrees of freedom of each protein
+    """
+    def __init__(self, design: pd.DataFrame, loglevel: int = logging.DEBUG):
+        """
+        Parameters
+        ----------
+        design
+            design matrix with the samples as index and the coefficients as columns
+        loglevel
+            loglevel of the logger
+        """
+        self.logger = get_logger(self.__class__.__name__, loglevel)
+        self.design = design.astype(np.float64)
+        self.index = None
+        self.coefficients = None
+        self.standard_errors = None
+        self.sigma = None
+        self.df_residual = None
+        # unscaled covariance matrix of the coefficients for each missing value pattern
+        self.pattern = None
+        self.pattern_cov_unscaled = None
+
+    @staticmethod
+    def design_from_data_tree(tree: DataTree, level: int, covariates: Optional[pd.DataFrame] = None
+                              ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Creates a design matrix with one indicator column per group of a level
+
+        Parameters
+        ----------
+        tree
+            tree containing the intensities
+        level
+            level of the groups
+        covariates
+            additional columns of the design matrix, e.g. batch or timepoint, with the samples as index
+
+        Returns
+        -------
+        the intensities with the samples as columns and the design matrix
+        """
+        data = tree.groupby(level, method=None)
+        groups = data.columns.get_level_values(0)
+        data.columns = data.columns.get_level_values(1)
+        design = pd.DataFrame({group: (groups == group).astype(np.float64) for group in dict.fromkeys(groups)},
+                              index=data.columns)
+        if covariates is not None:
+            design = pd.concat([design, covariates.reindex(design.index)], axis=1)
+        return data, design
+
+    @classmethod
+    def from_data_tree(cls, tree: DataTree, level: int, covariates: Optional[pd.DataFrame] = None,
+                       loglevel: int = logging.DEBUG) -> "LinearModel":
+        """
+        Fits a model with one coefficient per group of a level and optional covariates
+
+        See Also
+        --------
+        design_from_data_tree : creates the design matrix
+        """
+        data, design = cls.design_from_data_tree(tree, level, covariates)
+        return cls(design, loglevel=loglevel).fit(data)
+
+    def fit(self, data: pd.DataFrame) -> "LinearModel":
+        """
+        Parameters
+        ----------
+        data
+            log intensities with the proteins as rows and the samples of the design as columns
+
+        Returns
+        -------
+        self
+        """
+        values = data.loc[:, self.design.index].values.astype(np.float64)
+        design = self.design.values
+        n_features, n_coefficients = values.shape[0], design.shape[1]
+        self.index = data.index
+        self.coefficients = np.full((n_features, n_coefficients), np.nan)
+        self.standard_errors = np.full((n_features, n_coefficients), np.nan)
+        self.sigma = np.full(n_features, np.nan)
+        self.df_residual = np.zeros(n_features)
+
+        observed = ~np.isnan(values)
+        patterns, self.pattern = np.unique(observed, axis=0, return_inverse=True)
+        self.pattern = self.pattern.reshape(-1)
+        self.pattern_cov_unscaled = np.full((patterns.shape[0], n_coefficients, n_coefficients), np.nan)
+        self.logger.debug("Fitting %s proteins with %s missing value patterns", n_features, patterns.shape[0])
+        for pattern_index, pattern in enumerate(patterns):
+            rows = self.pattern == pattern_index
+            x = design[pattern]
+            n_obs = x.shape[0]
+            if n_obs < n_coefficients:
+                continue
+            q, r = np.linalg.qr(x)
+            # coefficients that can not be estimated for this pattern are left missing
+            if np.linalg.matrix_rank(r) < n_coefficients:
+                continue
+            y = values[rows][:, pattern].T
+            coefficients = np.linalg.solve(r, q.T @ y)
+            residuals = y - x @ coefficients
+            df_residual = n_obs - n_coefficients
+            r_inv = np.linalg.inv(r)
+            cov_unscaled = r_inv @ r_inv.T
+            with np.errstate(invalid="ignore", divide="ignore"):
+                sigma = np.sqrt((residuals ** 2).sum(axis=0) / df_residual)
+            self.coefficients[rows] = coefficients.T
+            self.sigma[rows] = sigma
+            self.df_residual[rows] = df_residual
+            self.standard_errors[rows] = sigma[:, np.newaxis] * np.sqrt(np.diag(cov_unscaled))[np.newaxis, :]
+            self.pattern_cov_unscaled[pattern_index] = cov_unscaled
+        return self
+
+    def get_contrast_matrix(self, contrasts: Union[Dict[str, Dict[str, float]], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Parameters
+        ----------
+        contrasts
+            either a DataFrame with the coefficients as index and one column per contrast or a dictionary mapping the
+            name of each contrast to the weights of the coefficients
+
+        Returns
+        -------
+        DataFrame with the coefficients as index and one column per contrast
+        """
+        if not isinstance(contrasts, pd.DataFrame):
+            contrasts = pd.DataFrame(contrasts)
+        unknown = set(contrasts.index) - set(self.design.columns)
+        if unknown:
+            raise ValueError("Unknown coefficients in contrasts: " + ", ".join(map(str, unknown)))
+        return contrasts.reindex(self.design.columns).fillna(0).astype(np.float64)
+
+    @staticmethod
+    def pairwise_contrasts(coefficients: Sequence[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Contrasts for all pairs of coefficients. The contrast named g2-g1 is the difference between g2 and g1
+
+        Parameters
+        ----------
+        coefficients
+            names of the coefficients, usually the groups of a level
+
+        Returns
+        -------
+        dictionary mapping the names of the contrasts to the weights of the coefficients
+        """
+        return {f"{g2}-{g1}": {g2: 1., g1: -1.} for g1, g2 in combinations(coefficients, 2)}
+
+    def test_contrasts(self, contrasts: Union[Dict[str, Dict[str, float]], pd.DataFrame], moderated: bool = False
+                       ) -> Dict[str, np.ndarray]:
+        """
+        Tests linear combinations of the coefficients for each protein
+
+        Parameters
+        ----------
+        contrasts
+            the contrasts to test, see get_contrast_matrix
+        moderated
+            If True the residual variances are moderated using empirical Bayes as in limma's eBayes
+
+        Returns
+        -------
+        dictionary with the contrast names and arrays with shape proteins x contrasts for the keys:
+        estimate, standard_error, t, df, pval and adjpval
+        """
+        if self.coefficients is None:
+            raise ValueError("Please call fit first")
+        contrast_matrix = self.get_contrast_matrix(contrasts)
+        c = contrast_matrix.values
+        estimate = self.coefficients @ c
+        # unscaled variance of each contrast for each pattern
+        pattern_var = np.einsum("ik,pkl,il->pi", c.T, self.pattern_cov_unscaled, c.T)
+        stdev_unscaled = np.sqrt(pattern_var[self.pattern])
+        sigma2, df = self.sigma ** 2, self.df_residual
+        if moderated:
+            sigma2, _, df_prior = squeeze_var(sigma2, df)
+            df = np.minimum(df + df_prior, np.nansum(df))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            standard_error = stdev_unscaled * np.sqrt(sigma2)[:, np.newaxis]
+            t = estimate / standard_error
+            p = 2 * stats.t.sf(np.abs(t), df[:, np.newaxis])
+        p[np.isnan(t)] = np.nan
+        return {"contrasts": list(contrast_matrix.columns), "estimate": estimate, "standard_error": standard_error,
+                "t": t, "df": np.broadcast_to(df[:, np.newaxis], t.shape), "pval": p, "adjpval": benjamini_hochberg(p)}
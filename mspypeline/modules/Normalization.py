@@ -1,6 +1,9 @@
 from abc import abstractmethod, ABC
-from collections import defaultdict as ddict
-from typing import Type, Callable, Optional
+from typing import Type, Callable, Optional, Iterator, Union, Sequence, Dict, List
+import os
+import hashlib
+import pickle
+import tempfile
 import pandas as pd
 import numpy as np
 import logging
@@ -8,6 +11,8 @@ import warnings
 from sklearn.exceptions import ConvergenceWarning
 
 from mspypeline.helpers import get_logger
+from mspypeline.version import __version__
+from mspypeline.modules.NormalizationKernels import interpolation_positions, median_polish_kernel, map_ranks
 
 
 def interpolate_data(data: pd.DataFrame) -> pd.DataFrame:
@@ -30,7 +35,7 @@ def interpolate_data(data: pd.DataFrame) -> pd.DataFrame:
         return data
     data_arg_sort = np.argsort(data.values, axis=0)
     data_sorted = np.take_along_axis(data.values, data_arg_sort, axis=0)
-    data_index = data.index[data_arg_sort]
+    data_index = np.asarray(data.index)[data_arg_sort]
 
     rows, cols = data_sorted.shape
 
@@ -49,29 +54,10 @@ def interpolate_data(data: pd.DataFrame) -> pd.DataFrame:
                  decimal * np.take_along_axis(data_sorted, index_min, axis=0)
 
     # now the index of the new values needs to be reconstructed, since each column was sorted differently
+    positions = interpolation_positions(index, float_index)
     result = []
-    # reconstruct one column at a time
     for column_index, column_name in enumerate(data.columns):
-        series_index = np.empty((rows,))
-        series_index[:] = np.nan
-
-        index_mapping = ddict(lambda: (np.nan, np.inf))
-        for i, (index_val, float_val) in enumerate(zip(index[:, column_index], float_index[:, column_index])):
-            decimal = float_val - index_val
-            if index_mapping[index_val][1] > decimal:
-                index_mapping[index_val] = i, decimal
-
-            if index_mapping[index_val + 1][1] > 1 - decimal:
-                index_mapping[index_val + 1] = i, 1 - decimal
-
-        # the index that was added last needs to be removed
-        index_mapping.pop(index_val + 1)
-
-        for key, (idx, _) in index_mapping.items():
-            series_index[idx] = key
-
-        series_index[np.isnan(series_index)] = np.arange(np.nanmax(series_index) + 1, rows, 1)
-        s_ind = data_index[:, column_index][series_index.astype(int)]
+        s_ind = data_index[:, column_index][positions[:, column_index]]
         result.append(pd.Series(new_values[:, column_index], index=s_ind, name=column_name))
 
     return pd.concat(result, axis=1, sort=False)
@@ -79,33 +65,108 @@ def interpolate_data(data: pd.DataFrame) -> pd.DataFrame:
 
 def median_polish(data: pd.DataFrame, max_iter: int = 100, tol: float = 0.001):
     overall = np.nanmedian(data.values)
-    row_effect = pd.Series([0] * data.shape[0], index=data.index, dtype="float64")
-    column_effect = pd.Series([0] * data.shape[1], index=data.columns, dtype="float64")
-    residuals = data - overall
-
-    for i in range(max_iter):
-        # row collapse
-        row_medians = residuals.median(axis=1)
-        overall += column_effect.median()
-        row_effect += row_medians
-        residuals = residuals.sub(row_medians, axis=0)
-        column_effect -= column_effect.median()
-        # column collapse
-        column_medians = residuals.median(axis=0)
-        overall += row_effect.median()
-        column_effect += column_medians
-        residuals = residuals.sub(column_medians, axis=1)
-        row_effect -= row_effect.median()
-        # check stop condition
-        # could be adapted to check difference between last two updates
-        if column_medians.abs().sum() + row_medians.abs().sum() <= tol:
-            break
-    else:
+    if data.empty:
+        return {"ave": overall, "row_effect": pd.Series(index=data.index, dtype="float64"),
+                "col_effect": pd.Series(index=data.columns, dtype="float64"), "residual": data.astype("float64")}
+    overall, row_effect, column_effect, residuals, converged = median_polish_kernel(data.values, max_iter, tol)
+    if not converged:
         warnings.warn("Stopping because max iter was reached", ConvergenceWarning)
-    return {"ave": overall, "row_effect": row_effect, "col_effect": column_effect, "residual": residuals}
+    return {"ave": overall, "row_effect": pd.Series(row_effect, index=data.index),
+            "col_effect": pd.Series(column_effect, index=data.columns),
+            "residual": pd.DataFrame(residuals, index=data.index, columns=data.columns)}
+
+
+def _index_to_arrays(name: str, index: pd.Index) -> Dict[str, np.ndarray]:
+    if isinstance(index, pd.MultiIndex):
+        raise TypeError(f"{name}: a MultiIndex can not be stored as array")
+    if index.name is not None and not isinstance(index.name, str):
+        raise TypeError(f"{name}: only index names which are strings can be stored as array")
+    values = index.values
+    if values.dtype == object:
+        if not all(isinstance(value, str) for value in values):
+            raise TypeError(f"{name}: only indices of strings or numbers can be stored as array")
+        values = values.astype(str)
+    arrays = {f"{name}:index": values}
+    if index.name is not None:
+        arrays[f"{name}:index_name"] = np.array(index.name)
+    return arrays
+
+
+def _index_from_arrays(name: str, arrays: Dict[str, np.ndarray]) -> pd.Index:
+    values = arrays[f"{name}:index"]
+    if values.dtype.kind == "U":
+        values = values.astype(object)
+    index_name = arrays.get(f"{name}:index_name")
+    return pd.Index(values, name=None if index_name is None else str(index_name))
+
+
+def to_arrays(name: str, value) -> Dict[str, np.ndarray]:
+    """
+    Converts a fitted attribute into plain arrays, which can be saved without pickle, see from_arrays
+
+    Parameters
+    ----------
+    name
+        name of the attribute, the keys of the arrays start with it
+    value
+        None, a Series, an Index, a numeric array or a dict with numeric keys and values
+
+    Returns
+    -------
+    A dictionary of arrays, with the type of the value encoded in the keys
+
+    """
+    if value is None:
+        return {f"{name}:none": np.empty(0)}
+    if isinstance(value, pd.Series):
+        return {f"{name}:series": value.values, **_index_to_arrays(name, value.index)}
+    if isinstance(value, pd.Index):
+        return _index_to_arrays(name, value)
+    if isinstance(value, dict):
+        arrays = {f"{name}:dict_keys": np.array(list(value.keys())),
+                  f"{name}:dict_values": np.array(list(value.values()))}
+    elif isinstance(value, np.ndarray):
+        arrays = {f"{name}:array": value}
+    else:
+        raise TypeError(f"{name}: {type(value).__name__} can not be stored as array")
+    if any(array.dtype == object for array in arrays.values()):
+        raise TypeError(f"{name}: only numeric values can be stored as array")
+    return arrays
+
+
+def from_arrays(name: str, arrays: Dict[str, np.ndarray]):
+    """
+    Restores a fitted attribute which was converted by to_arrays
+
+    Parameters
+    ----------
+    name
+        name of the attribute
+    arrays
+        arrays created by to_arrays, can contain the arrays of other attributes
+
+    Returns
+    -------
+    The restored value
+
+    """
+    if f"{name}:none" in arrays:
+        return None
+    if f"{name}:series" in arrays:
+        return pd.Series(arrays[f"{name}:series"], index=_index_from_arrays(name, arrays))
+    if f"{name}:index" in arrays:
+        return _index_from_arrays(name, arrays)
+    if f"{name}:dict_keys" in arrays:
+        return dict(zip(arrays[f"{name}:dict_keys"].tolist(), arrays[f"{name}:dict_values"].tolist()))
+    if f"{name}:array" in arrays:
+        return arrays[f"{name}:array"]
+    raise KeyError(f"no arrays for {name}")
 
 
 class BaseNormalizer(ABC):
+    # names of the attributes that are set by fit, all other attributes are considered parameters
+    fitted_attributes = ()
+
     def __init__(self, input_scale: str = "log2",
                  output_scale: str = "normal",
                  col_name_prefix: Optional[str] = None,
@@ -144,6 +205,39 @@ class BaseNormalizer(ABC):
         self.__dict__ = state
         self.logger = get_logger(self.__class__.__name__, self.loglevel)
 
+    def get_params(self) -> dict:
+        """
+        Returns
+        -------
+        A dictionary with all attributes that influence the result of fit and transform. Fitted attributes,
+        the logger and the loglevel are excluded.
+        """
+        excluded = set(self.fitted_attributes) | {"logger", "loglevel"}
+        return {k: v for k, v in self.__dict__.items() if k not in excluded}
+
+    def get_fitted_state(self) -> Dict[str, np.ndarray]:
+        """
+        Returns
+        -------
+        The fitted attributes as plain arrays, which can be saved without pickle, see to_arrays
+        """
+        state = {}
+        for attribute in self.fitted_attributes:
+            state.update(to_arrays(attribute, getattr(self, attribute)))
+        return state
+
+    def set_fitted_state(self, state: Dict[str, np.ndarray]):
+        """
+        Restores the fitted attributes from the arrays created by get_fitted_state
+
+        Parameters
+        ----------
+        state
+            the arrays of the fitted attributes
+        """
+        for attribute in self.fitted_attributes:
+            setattr(self, attribute, from_arrays(attribute, state))
+
     @abstractmethod
     def fit(self, data: pd.DataFrame):
         raise NotImplementedError
@@ -155,8 +249,111 @@ class BaseNormalizer(ABC):
     def fit_transform(self, data: pd.DataFrame):
         return self.fit(data).transform(data)
 
+    def partial_fit(self, data: pd.DataFrame):
+        """
+        Updates the fitted reference with additional samples. If the normalizer was not fitted yet this is the same as
+        calling fit.
+
+        Parameters
+        ----------
+        data
+            DataFrame with the new samples as columns
+
+        Returns
+        -------
+        self
+        """
+        raise NotImplementedError
+
+    def transform_new(self, data: pd.DataFrame):
+        """
+        Transforms samples that were not part of the data passed to fit against the frozen reference,
+        without refitting the normalizer. The cost only depends on the number of new samples.
+
+        Parameters
+        ----------
+        data
+            DataFrame with the new samples as columns
+
+        Returns
+        -------
+        The transformed data
+        """
+        raise NotImplementedError
+
+    def fit_blocks(self, get_blocks: Callable[[], Iterator[pd.DataFrame]]):
+        """
+        Fits the normalizer on data that is provided as column blocks. The first block is passed to fit, all following
+        blocks to partial_fit. Only one block has to be in memory at a time.
+
+        Parameters
+        ----------
+        get_blocks
+            callable returning a new iterator over the column blocks each time it is called
+
+        Returns
+        -------
+        self
+        """
+        for i, block in enumerate(get_blocks()):
+            if i == 0:
+                self.fit(block)
+            else:
+                self.partial_fit(block)
+        return self
+
+    def save(self, path: str):
+        """
+        Saves the normalizer including its fitted reference to disk
+
+        Parameters
+        ----------
+        path
+            path of the file
+        """
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "BaseNormalizer":
+        """
+        Loads a normalizer that was saved with save
+
+        Parameters
+        ----------
+        path
+            path of the file
+
+        Returns
+        -------
+        The loaded normalizer
+        """
+        with open(path, "rb") as f:
+            normalizer = pickle.load(f)
+        if not isinstance(normalizer, cls):
+            raise ValueError(f"{path} does not contain a {cls.__name__}")
+        return normalizer
+
+    @staticmethod
+    def _get_output_dtype(data: pd.DataFrame):
+        # the output keeps the floating point type of the input, e.g. float32, everything else results in float64
+        dtypes = set(data.dtypes)
+        if len(dtypes) == 1 and np.issubdtype(next(iter(dtypes)), np.floating):
+            return next(iter(dtypes))
+        return np.float64
+
+    def _finalize_output(self, result: pd.DataFrame, dtype=np.float64) -> pd.DataFrame:
+        result = result.astype(dtype, copy=False)
+        if self.output_scale == "normal":
+            result = np.exp2(result)
+        if self.col_name_prefix is not None:
+            result.rename(lambda x: f"{self.col_name_prefix} {x}", axis=1, inplace=True)
+        return result
+
 
 class MedianNormalizer(BaseNormalizer):
+    fitted_attributes = ("factors", "medians")
+
     def __init__(self, input_scale: str = "log2",
                  output_scale: str = "normal",
                  col_name_prefix: Optional[str] = None,
@@ -164,25 +361,42 @@ class MedianNormalizer(BaseNormalizer):
                  **kwargs):
         super().__init__(input_scale, output_scale, col_name_prefix, loglevel, **kwargs)
         self.factors = None
+        self.medians = None
 
     def fit(self, data: pd.DataFrame):
         if self.input_scale == "normal":
             data = np.log2(data)
-        medians = data.median()
-        self.factors = medians - medians.mean()
+        self.medians = data.median()
+        self.factors = self.medians - self.medians.mean()
+        return self
+
+    def partial_fit(self, data: pd.DataFrame):
+        if self.medians is None:
+            return self.fit(data)
+        if self.input_scale == "normal":
+            data = np.log2(data)
+        medians = pd.concat([self.medians, data.median()])
+        self.medians = medians[~medians.index.duplicated(keep="last")]
+        self.factors = self.medians - self.medians.mean()
         return self
 
     def transform(self, data: pd.DataFrame):
         if self.factors is None:
             raise ValueError("Please call fit first or use fit_transform")
+        dtype = self._get_output_dtype(data)
         if self.input_scale == "normal":
             data = np.log2(data)
         result = data - self.factors
-        if self.output_scale == "normal":
-            result = np.exp2(result)
-        if self.col_name_prefix is not None:
-            result.rename(lambda x: f"{self.col_name_prefix} {x}", axis=1, inplace=True)
-        return result
+        return self._finalize_output(result, dtype)
+
+    def transform_new(self, data: pd.DataFrame):
+        if self.medians is None:
+            raise ValueError("Please call fit first or use fit_transform")
+        dtype = self._get_output_dtype(data)
+        if self.input_scale == "normal":
+            data = np.log2(data)
+        result = data - (data.median() - self.medians.mean())
+        return self._finalize_output(result, dtype)
 
 
 class QuantileNormalizer(BaseNormalizer):
@@ -190,6 +404,9 @@ class QuantileNormalizer(BaseNormalizer):
     Quantile Normalizer as described on wikipedia
     https://en.wikipedia.org/wiki/Quantile_normalization
     """
+    fitted_attributes = ("rank_replace", "rank_means", "half_rank_means", "sorted_sum", "sorted_count",
+                         "reference_index")
+
     def __init__(self, missing_value_handler: Optional[Callable] = interpolate_data,
                  input_scale: str = "log2",
                  output_scale: str = "normal",
@@ -199,43 +416,75 @@ class QuantileNormalizer(BaseNormalizer):
         super().__init__(input_scale, output_scale, col_name_prefix, loglevel, **kwargs)
         self.missing_value_handler = missing_value_handler
         self.rank_replace = {}
+        # per rank sum and number of values of the sorted samples, their ratio is the reference distribution
+        self.sorted_sum = None
+        self.sorted_count = None
+        self.reference_index = None
 
-    def fit(self, data: pd.DataFrame):
+    def _accumulate_sorted(self, data: pd.DataFrame):
         if self.input_scale == "normal":
             data = np.log2(data)
         if self.missing_value_handler is not None:
             data = self.missing_value_handler(data)
-        sorted_values = pd.DataFrame(np.sort(data.values, axis=0))
-        sorted_mean = sorted_values.mean(axis=1)
-        self.rank_replace.update({rank + 1.: intensity for rank, intensity in sorted_mean.iteritems()})
+        sorted_values = np.sort(data.values, axis=0)
+        self.sorted_sum = self.sorted_sum + np.nansum(sorted_values, axis=1)
+        self.sorted_count = self.sorted_count + (~np.isnan(sorted_values)).sum(axis=1)
+
+    def _update_rank_replace(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sorted_mean = pd.Series(self.sorted_sum / self.sorted_count)
+        sorted_mean[self.sorted_count == 0] = np.nan
+        self.rank_replace = {rank + 1.: intensity for rank, intensity in sorted_mean.items()}
         # also include all half ranks
         half_steps = pd.concat(
-            (sorted_mean, sorted_mean[1:].append(pd.Series([np.nan]), ignore_index=True)),
+            (sorted_mean, pd.concat((sorted_mean[1:], pd.Series([np.nan])), ignore_index=True)),
             axis=1).mean(axis=1)
-        self.rank_replace.update({rank + 1.5: intensity for rank, intensity in half_steps.iteritems()})
+        self.rank_replace.update({rank + 1.5: intensity for rank, intensity in half_steps.items()})
+        # array versions of the mapping used by transform
+        self.rank_means, self.half_rank_means = sorted_mean.values, half_steps.values
+
+    def fit(self, data: pd.DataFrame):
+        self.reference_index = data.index
+        self.sorted_sum = np.zeros(data.shape[0])
+        self.sorted_count = np.zeros(data.shape[0], dtype=int)
+        self._accumulate_sorted(data)
+        self._update_rank_replace()
+        return self
+
+    def partial_fit(self, data: pd.DataFrame):
+        if self.reference_index is None:
+            return self.fit(data)
+        self._accumulate_sorted(data.reindex(self.reference_index))
+        self._update_rank_replace()
         return self
 
     def transform(self, data: pd.DataFrame):
         if not self.rank_replace:
             raise ValueError("Please call fit first or use fit_transform")
+        dtype = self._get_output_dtype(data)
         if self.missing_value_handler is not None:
             na_mask = data.notna()
             data = self.missing_value_handler(data)
         result = data.rank()
         if self.missing_value_handler is not None:
             result = result[na_mask]
-        result = result.apply(pd.Series.map, arg=self.rank_replace)
-        if self.output_scale == "normal":
-            result = np.exp2(result)
-        if self.col_name_prefix is not None:
-            result.rename(lambda x: f"{self.col_name_prefix} {x}", axis=1, inplace=True)
-        return result
+        result = pd.DataFrame(map_ranks(result.values, self.rank_means, self.half_rank_means),
+                              index=result.index, columns=result.columns)
+        return self._finalize_output(result, dtype)
+
+    def transform_new(self, data: pd.DataFrame):
+        if self.reference_index is None:
+            raise ValueError("Please call fit first or use fit_transform")
+        # each sample is mapped onto the reference independently, only the rows need to match the reference
+        return self.transform(data.reindex(self.reference_index))
 
 
 class TailRobustNormalizer(BaseNormalizer):
     """
     https://www.biorxiv.org/content/10.1101/2020.04.17.046227v1.full
     """
+    fitted_attributes = ("offset_factor", "fitted_normalizer")
+
     def __init__(self, normalizer: Type[BaseNormalizer] = QuantileNormalizer,
                  missing_value_handler: Optional[Callable] = interpolate_data,
                  input_scale: str = "log2",
@@ -247,29 +496,325 @@ class TailRobustNormalizer(BaseNormalizer):
         self.offset_factor = None
         self.normalizer = normalizer
         self.missing_value_handler = missing_value_handler
+        # normalizer fitted on the data without offset, used to transform new samples
+        self.fitted_normalizer = None
+
+    def get_fitted_state(self) -> Dict[str, np.ndarray]:
+        state = to_arrays("offset_factor", self.offset_factor)
+        if self.fitted_normalizer is not None:
+            state.update({f"fitted_normalizer.{key}": value
+                          for key, value in self.fitted_normalizer.get_fitted_state().items()})
+        return state
+
+    def set_fitted_state(self, state: Dict[str, np.ndarray]):
+        self.offset_factor = from_arrays("offset_factor", state)
+        prefix = "fitted_normalizer."
+        normalizer_state = {key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)}
+        self.fitted_normalizer = None
+        if normalizer_state:
+            self.fitted_normalizer = self._get_normalizer()
+            self.fitted_normalizer.set_fitted_state(normalizer_state)
+
+    def _get_normalizer(self) -> BaseNormalizer:
+        return self.normalizer(missing_value_handler=self.missing_value_handler, input_scale="log2",
+                               output_scale="log2", col_name_prefix=None, loglevel=self.logger.getEffectiveLevel())
+
+    def _to_log2(self, data: pd.DataFrame) -> pd.DataFrame:
+        # the offset is subtracted in double precision, rounding errors would otherwise change the ranks
+        data = data.astype(np.float64, copy=False)
+        return np.log2(data) if self.input_scale == "normal" else data
+
+    def _fit_offset(self, data: pd.DataFrame):
+        self.offset_factor = data.mean(axis=1)
 
     def fit(self, data: pd.DataFrame):
-        if self.input_scale == "normal":
-            data = np.log2(data)
-        self.offset_factor = data.mean(axis=1)
+        data = self._to_log2(data)
+        self._fit_offset(data)
+        self.fitted_normalizer = self._get_normalizer().fit(data.subtract(self.offset_factor, axis=0))
         return self
 
+    def fit_transform(self, data: pd.DataFrame):
+        dtype = self._get_output_dtype(data)
+        data = self._to_log2(data)
+        self._fit_offset(data)
+        self.fitted_normalizer = self._get_normalizer()
+        result = self.fitted_normalizer.fit_transform(data.subtract(self.offset_factor, axis=0))
+        result = result.add(self.offset_factor, axis=0)
+        return self._finalize_output(result, dtype)
+
+    def fit_blocks(self, get_blocks: Callable[[], Iterator[pd.DataFrame]]):
+        """
+        Requires two passes over the blocks, the first one to determine the offset factor and
+        the second one to fit the wrapped normalizer on the data without offset.
+        """
+        offset_sum, offset_count = None, None
+        for block in get_blocks():
+            block = self._to_log2(block)
+            block_sum, block_count = block.sum(axis=1), block.notna().sum(axis=1)
+            offset_sum = block_sum if offset_sum is None else offset_sum + block_sum
+            offset_count = block_count if offset_count is None else offset_count + block_count
+        self.offset_factor = offset_sum / offset_count.replace(0, np.nan)
+
+        def get_blocks_without_offset():
+            for b in get_blocks():
+                b = self._to_log2(b)
+                yield b.subtract(self.offset_factor, axis=0)
+
+        self.fitted_normalizer = self._get_normalizer().fit_blocks(get_blocks_without_offset)
+        return self
+
+    def partial_fit(self, data: pd.DataFrame):
+        """
+        Not supported. New samples change the offset factor and thereby the data without offset of all previously
+        seen samples, which the wrapped normalizer was fitted on. Updating the reference without revisiting these
+        samples is off by up to a few tenths on the log2 scale. Use fit on all samples or fit_blocks instead.
+
+        Raises
+        ------
+        NotImplementedError
+            always
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} can not be updated with new samples, use fit or fit_blocks instead"
+        )
+
     def transform(self, data: pd.DataFrame):
         if self.offset_factor is None:
             raise ValueError("Please call fit first or use fit_transform")
-        if self.input_scale == "normal":
-            data = np.log2(data)
+        dtype = self._get_output_dtype(data)
+        data = self._to_log2(data)
         result = data.subtract(self.offset_factor, axis=0)
-        result = self.normalizer(missing_value_handler=self.missing_value_handler, input_scale="log2",
-                                 output_scale="log2", col_name_prefix=None, loglevel=self.logger.getEffectiveLevel()
-                                 ).fit_transform(result)
+        result = self._get_normalizer().fit_transform(result)
         result = result.add(self.offset_factor, axis=0)
-        if self.output_scale == "normal":
-            result = np.exp2(result)
-        if self.col_name_prefix is not None:
-            result.rename(lambda x: f"{self.col_name_prefix} {x}", axis=1, inplace=True)
+        return self._finalize_output(result, dtype)
+
+    def transform_new(self, data: pd.DataFrame):
+        if self.fitted_normalizer is None:
+            raise ValueError("Please call fit first or use fit_transform")
+        dtype = self._get_output_dtype(data)
+        data = self._to_log2(data)
+        data = data.reindex(self.offset_factor.index)
+        result = self.fitted_normalizer.transform_new(data.subtract(self.offset_factor, axis=0))
+        result = result.add(self.offset_factor, axis=0)
+        return self._finalize_output(result, dtype)
+
+
+def iter_column_blocks(n_columns: int, block_size: int) -> Iterator[slice]:
+    """
+    Parameters
+    ----------
+    n_columns
+        total number of columns
+    block_size
+        maximum number of columns per block
+
+    Returns
+    -------
+    An iterator over slices, each selecting one block of columns
+    """
+    if block_size < 1:
+        raise ValueError("block_size should be at least 1")
+    for start in range(0, n_columns, block_size):
+        yield slice(start, min(start + block_size, n_columns))
+
+
+def normalize_chunked(normalizer: BaseNormalizer,
+                      data: Union[str, np.ndarray],
+                      output: Union[str, np.ndarray],
+                      block_size: int = 256,
+                      index: Optional[Sequence] = None,
+                      columns: Optional[Sequence] = None):
+    """
+    Out-of-core normalization of a protein x sample matrix which is too large to be normalized in memory.
+    The normalizer is fitted on column blocks using fit_blocks and each block is then transformed with transform_new
+    and written to the output. Peak memory is bounded by the block size.
+
+    Parameters
+    ----------
+    normalizer
+        the normalizer to fit and apply
+    data
+        path to a .npy file, which will be memory-mapped, or any 2D array supporting numpy style slicing,
+        e.g. a np.memmap or a zarr array
+    output
+        path to the .npy file that should be created or a writable 2D array with the same shape as data
+    block_size
+        number of columns per block
+    index
+        names of the rows, defaults to a range index
+    columns
+        names of the columns, defaults to a range index
+
+    Returns
+    -------
+    The output array
+    """
+    if isinstance(data, str):
+        data = np.load(data, mmap_mode="r")
+    n_rows, n_cols = data.shape
+    index = pd.RangeIndex(n_rows) if index is None else pd.Index(index)
+    columns = pd.RangeIndex(n_cols) if columns is None else pd.Index(columns)
+    if isinstance(output, str):
+        output = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64, shape=(n_rows, n_cols))
+
+    def get_blocks():
+        for block_slice in iter_column_blocks(n_cols, block_size):
+            yield pd.DataFrame(np.asarray(data[:, block_slice], dtype=np.float64),
+                               index=index, columns=columns[block_slice])
+
+    normalizer.fit_blocks(get_blocks)
+    for block_slice, block in zip(iter_column_blocks(n_cols, block_size), get_blocks()):
+        result = normalizer.transform_new(block)
+        output[:, block_slice] = result.reindex(index).values
+    if isinstance(output, np.memmap):
+        output.flush()
+    return output
+
+
+class NormalizationCache:
+    """
+    Content addressed cache for fitted normalizers and normalized data.
+    Entries are keyed by a hash of the input data together with the class and the parameters of the normalizer and
+    the mspypeline version, so results of an older version are not reused.
+    Each entry stores the fitted state of the normalizer and the transformed data as plain arrays in a .npz file, see
+    BaseNormalizer.get_fitted_state. Only the most recently used entries are kept.
+    """
+    def __init__(self, cache_dir: str, max_entries: int = 32, loglevel: int = logging.DEBUG):
+        """
+
+        Parameters
+        ----------
+        cache_dir
+            directory where the cache files are stored. Will be created on the first write
+        max_entries
+            maximum number of entries, the least recently used entries are removed once a new entry is written
+        loglevel
+            loglevel of the logger
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.logger = get_logger(self.__class__.__name__, loglevel)
+
+    @staticmethod
+    def _param_to_str(value) -> str:
+        if isinstance(value, type) or callable(value):
+            return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+        return repr(value)
+
+    def get_key(self, normalizer: BaseNormalizer, data: pd.DataFrame) -> str:
+        """
+        Parameters
+        ----------
+        normalizer
+            normalizer which should be applied to the data
+        data
+            data that should be normalized
+
+        Returns
+        -------
+        A hex digest identifying the combination of data, normalizer class, normalizer parameters and mspypeline
+        version
+        """
+        h = hashlib.sha1()
+        h.update(__version__.encode())
+        h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        h.update(repr(list(data.columns)).encode())
+        h.update(self._param_to_str(normalizer.__class__).encode())
+        for param, value in sorted(normalizer.get_params().items()):
+            h.update(f"{param}={self._param_to_str(value)};".encode())
+        return h.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get_entries(self) -> List[str]:
+        """
+        Returns
+        -------
+        The paths of all cache files, the least recently used first
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        paths = [os.path.join(self.cache_dir, file) for file in os.listdir(self.cache_dir) if file.endswith(".npz")]
+        return sorted(paths, key=os.path.getmtime)
+
+    def fit_transform(self, normalizer: BaseNormalizer, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Loads the fitted state and the transformed data from the cache if the entry exists.
+        Otherwise normalizer.fit_transform is called and the result is written to the cache.
+
+        Parameters
+        ----------
+        normalizer
+            normalizer which should be applied to the data. Its fitted attributes are updated in both cases
+        data
+            data that should be normalized
+
+        Returns
+        -------
+        The transformed data
+        """
+        key = self.get_key(normalizer, data)
+        path = self.get_path(key)
+        if os.path.isfile(path):
+            try:
+                result = self.read_entry(normalizer, path)
+                # marks the entry as recently used
+                os.utime(path)
+                self.logger.debug("Loaded %s result from cache: %s", normalizer.__class__.__name__, path)
+                return result
+            except Exception:
+                self.logger.warning("Could not read cache file %s, normalizing again", path, exc_info=True)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        result = normalizer.fit_transform(data.copy())
+        try:
+            self.write_entry(normalizer, result, path)
+        except (OSError, TypeError):
+            self.logger.warning("Could not write cache file %s", path, exc_info=True)
         return result
 
+    @staticmethod
+    def read_entry(normalizer: BaseNormalizer, path: str) -> pd.DataFrame:
+        with np.load(path, allow_pickle=False) as f:
+            arrays = dict(f)
+        normalizer.set_fitted_state({key[len("state."):]: value for key, value in arrays.items()
+                                     if key.startswith("state.")})
+        return pd.DataFrame(arrays["data"], index=_index_from_arrays("data_index", arrays),
+                            columns=_index_from_arrays("data_columns", arrays))
+
+    def write_entry(self, normalizer: BaseNormalizer, result: pd.DataFrame, path: str):
+        arrays = {"data": result.values, **_index_to_arrays("data_index", result.index),
+                  **_index_to_arrays("data_columns", result.columns)}
+        arrays.update({f"state.{key}": value for key, value in normalizer.get_fitted_state().items()})
+        if any(array.dtype == object for array in arrays.values()):
+            raise TypeError("only numeric data can be cached")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first so interrupted writes do not leave a corrupt entry, the name is unique so
+        # several runs can write the same entry
+        tmp_file = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False)
+        try:
+            with tmp_file:
+                np.savez(tmp_file, **arrays)
+            os.replace(tmp_file.name, path)
+        except BaseException:
+            if os.path.exists(tmp_file.name):
+                os.remove(tmp_file.name)
+            raise
+        entries = self.get_entries()
+        for old_path in entries[:max(len(entries) - self.max_entries, 0)]:
+            if old_path != path:
+                os.remove(old_path)
+
+    def clear(self):
+        """
+        Removes all cache files
+        """
+        for path in self.get_entries():
+            os.remove(path)
+
 
 default_normalizers = {
     "median_norm": MedianNormalizer(),
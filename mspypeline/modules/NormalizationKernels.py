@@ -0,0 +1,277 @@
+"""
+Kernels for the inner loops of the normalization methods. Each kernel is available as an explicit loop, which is
+compiled with numba if it is installed, and as a vectorized numpy implementation. By default the compiled loop is used
+if numba is importable and the numpy implementation otherwise. Both give identical results.
+"""
+from typing import Optional, Tuple
+import warnings
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # used as @njit or as @njit(cache=True)
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+def _use_numba(use_numba: Optional[bool]) -> bool:
+    return HAS_NUMBA if use_numba is None else use_numba
+
+
+@njit(cache=True)
+def _interpolation_positions_loop(index, float_index):
+    rows, cols = index.shape
+    positions = np.empty((rows, cols), dtype=np.int64)
+    for c in range(cols):
+        n_keys = index[rows - 1, c] + 1
+        best_position = np.full(n_keys + 1, -1, dtype=np.int64)
+        best_distance = np.full(n_keys + 1, np.inf)
+        for i in range(rows):
+            key = index[i, c]
+            decimal = float_index[i, c] - key
+            if best_distance[key] > decimal:
+                best_distance[key] = decimal
+                best_position[key] = i
+            if best_distance[key + 1] > 1 - decimal:
+                best_distance[key + 1] = 1 - decimal
+                best_position[key + 1] = i
+        column = np.full(rows, -1, dtype=np.int64)
+        # the key after the last one is not used, larger keys overwrite smaller ones
+        for key in range(n_keys):
+            if best_position[key] >= 0:
+                column[best_position[key]] = key
+        fill = n_keys
+        for i in range(rows):
+            if column[i] < 0:
+                column[i] = fill
+                fill += 1
+        positions[:, c] = column
+    return positions
+
+
+def _interpolation_positions_numpy(index, float_index):
+    rows, cols = index.shape
+    decimal = (float_index - index).ravel()
+    column = np.tile(np.arange(cols), rows)
+    position = np.repeat(np.arange(rows), cols)
+    # every row is a candidate for its own key and for the following key
+    keys = np.concatenate((index.ravel(), index.ravel() + 1))
+    distance = np.concatenate((decimal, 1 - decimal))
+    column, position = np.tile(column, 2), np.tile(position, 2)
+    # per column and key the closest candidate wins, ties are won by the first row
+    order = np.lexsort((position, distance, keys, column))
+    keys, column, position = keys[order], column[order], position[order]
+    first = np.ones(keys.shape, dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (column[1:] != column[:-1])
+    n_keys = index[-1] + 1
+    keep = first & (keys < n_keys[column])
+    positions = np.full((rows, cols), -1, dtype=np.int64)
+    np.maximum.at(positions, (position[keep], column[keep]), keys[keep])
+    missing = positions < 0
+    fill = np.cumsum(missing, axis=0) - 1 + n_keys[np.newaxis, :]
+    positions[missing] = fill[missing]
+    return positions
+
+
+def interpolation_positions(index: np.ndarray, float_index: np.ndarray, use_numba: Optional[bool] = None) -> np.ndarray:
+    """
+    Reconstructs for each interpolated value the position in the column wise sorted data it belongs to.
+
+    Parameters
+    ----------
+    index
+        integer part of the interpolation positions, shape rows x columns
+    float_index
+        interpolation positions, shape rows x columns
+    use_numba
+        whether to use the loop kernel. Defaults to True if numba is installed
+
+    Returns
+    -------
+    An integer array with the same shape as index
+
+    """
+    index = np.ascontiguousarray(index, dtype=np.int64)
+    float_index = np.ascontiguousarray(float_index, dtype=np.float64)
+    if index.size == 0:
+        return index
+    if _use_numba(use_numba):
+        return _interpolation_positions_loop(index, float_index)
+    return _interpolation_positions_numpy(index, float_index)
+
+
+@njit(cache=True)
+def _nanmedian(values):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return np.nan
+    return np.median(values)
+
+
+@njit(cache=True)
+def _median_polish_loop(values, max_iter, tol):
+    rows, cols = values.shape
+    overall = _nanmedian(values.ravel())
+    row_effect = np.zeros(rows)
+    column_effect = np.zeros(cols)
+    residuals = values - overall
+    row_medians = np.empty(rows)
+    column_medians = np.empty(cols)
+    converged = False
+    for _ in range(max_iter):
+        # row collapse
+        for r in range(rows):
+            row_medians[r] = _nanmedian(residuals[r, :])
+        overall += _nanmedian(column_effect)
+        row_effect += row_medians
+        for r in range(rows):
+            residuals[r, :] -= row_medians[r]
+        column_effect -= _nanmedian(column_effect)
+        # column collapse
+        for c in range(cols):
+            column_medians[c] = _nanmedian(residuals[:, c])
+        overall += _nanmedian(row_effect)
+        column_effect += column_medians
+        for c in range(cols):
+            residuals[:, c] -= column_medians[c]
+        row_effect -= _nanmedian(row_effect)
+        # check stop condition, nan values are skipped like in pandas
+        if np.nansum(np.abs(column_medians)) + np.nansum(np.abs(row_medians)) <= tol:
+            converged = True
+            break
+    return overall, row_effect, column_effect, residuals, converged
+
+
+def _nanmedian_numpy(values, axis=None):
+    if values.size == 0:
+        return np.nan
+    # all nan slices result in nan, the same as in pandas
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "All-NaN slice encountered", RuntimeWarning)
+        return np.nanmedian(values, axis=axis)
+
+
+def _median_polish_numpy(values, max_iter, tol):
+    overall = _nanmedian_numpy(values)
+    row_effect = np.zeros(values.shape[0])
+    column_effect = np.zeros(values.shape[1])
+    residuals = values - overall
+    converged = False
+    for _ in range(max_iter):
+        # row collapse
+        row_medians = _nanmedian_numpy(residuals, axis=1)
+        overall += _nanmedian_numpy(column_effect)
+        row_effect += row_medians
+        residuals -= row_medians[:, np.newaxis]
+        column_effect -= _nanmedian_numpy(column_effect)
+        # column collapse
+        column_medians = _nanmedian_numpy(residuals, axis=0)
+        overall += _nanmedian_numpy(row_effect)
+        column_effect += column_medians
+        residuals -= column_medians[np.newaxis, :]
+        row_effect -= _nanmedian_numpy(row_effect)
+        # check stop condition, nan values are skipped like in pandas
+        if np.nansum(np.abs(column_medians)) + np.nansum(np.abs(row_medians)) <= tol:
+            converged = True
+            break
+    return overall, row_effect, column_effect, residuals, converged
+
+
+def median_polish_kernel(values: np.ndarray, max_iter: int = 100, tol: float = 0.001, use_numba: Optional[bool] = None
+                         ) -> Tuple[float, np.ndarray, np.ndarray, np.ndarray, bool]:
+    """
+    Tukey's median polish on a non empty array
+
+    Parameters
+    ----------
+    values
+        2D array which may contain missing values
+    max_iter
+        maximum number of iterations
+    tol
+        the iteration stops once the sum of absolute row and column medians is below tol
+    use_numba
+        whether to use the loop kernel. Defaults to True if numba is installed
+
+    Returns
+    -------
+    overall effect, row effects, column effects, residuals and whether the stop condition was reached
+
+    """
+    values = np.array(values, dtype=np.float64)
+    if _use_numba(use_numba):
+        return _median_polish_loop(values, max_iter, tol)
+    return _median_polish_numpy(values, max_iter, tol)
+
+
+@njit(cache=True)
+def _map_ranks_loop(ranks, rank_means, half_rank_means):
+    n = rank_means.shape[0]
+    flat_ranks = ranks.ravel()
+    flat_result = np.empty(flat_ranks.shape[0])
+    for i in range(flat_ranks.shape[0]):
+        rank = flat_ranks[i]
+        flat_result[i] = np.nan
+        if np.isnan(rank):
+            continue
+        position = int(np.floor(rank)) - 1
+        if position < 0 or position >= n:
+            continue
+        remainder = rank - np.floor(rank)
+        if remainder == 0:
+            flat_result[i] = rank_means[position]
+        elif remainder == 0.5:
+            flat_result[i] = half_rank_means[position]
+    return flat_result.reshape(ranks.shape)
+
+
+def _map_ranks_numpy(ranks, rank_means, half_rank_means):
+    n = rank_means.shape[0]
+    with np.errstate(invalid="ignore"):
+        floor = np.floor(ranks)
+        remainder = ranks - floor
+    position = np.where(np.isnan(floor), -1, floor - 1).astype(np.int64)
+    valid = (position >= 0) & (position < n)
+    position = np.where(valid, position, 0)
+    result = np.full(ranks.shape, np.nan)
+    whole = valid & (remainder == 0)
+    half = valid & (remainder == 0.5)
+    if n > 0:
+        result[whole] = rank_means[position[whole]]
+        result[half] = half_rank_means[position[half]]
+    return result
+
+
+def map_ranks(ranks: np.ndarray, rank_means: np.ndarray, half_rank_means: np.ndarray,
+              use_numba: Optional[bool] = None) -> np.ndarray:
+    """
+    Replaces the (average) ranks by the reference intensities.
+
+    Parameters
+    ----------
+    ranks
+        array of ranks starting at 1, ties have a rank ending in .5
+    rank_means
+        the reference intensity for each integer rank
+    half_rank_means
+        the reference intensity for rank + 0.5
+    use_numba
+        whether to use the loop kernel. Defaults to True if numba is installed
+
+    Returns
+    -------
+    An array of the same shape as ranks, ranks that are missing or not in the reference are nan
+
+    """
+    ranks = np.ascontiguousarray(ranks, dtype=np.float64)
+    rank_means = np.ascontiguousarray(rank_means, dtype=np.float64)
+    half_rank_means = np.ascontiguousarray(half_rank_means, dtype=np.float64)
+    if _use_numba(use_numba):
+        return _map_ranks_loop(ranks, rank_means, half_rank_means)
+    return _map_ranks_numpy(ranks, rank_means, half_rank_means)
@@ -0,0 +1,501 @@
+from itertools import combinations
+from typing import Sequence, Optional, Tuple, List
+import warnings
+import numpy as np
+from scipy import stats, special, fft
+
+
+def group_statistics(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Row wise statistics ignoring missing values
+
+    Parameters
+    ----------
+    values
+        2D array with the features as rows and the samples of one group as columns
+
+    Returns
+    -------
+    number of non missing values, mean and sample variance (ddof=1) of each row
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0).sum(axis=1) / count
+        squares = np.where(valid, (values - mean[:, np.newaxis]) ** 2, 0).sum(axis=1)
+        var = squares / (count - 1)
+    var[count < 2] = np.nan
+    return count, mean, var
+
+
+def ttest_from_statistics(count1, mean1, var1, count2, mean2, var2, equal_var: bool = True
+                          ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Two sample t-test from precomputed statistics, all arguments have to be broadcastable against each other
+
+    Parameters
+    ----------
+    count1
+        number of observations in the first sample
+    mean1
+        mean of the first sample
+    var1
+        sample variance of the first sample
+    count2
+        number of observations in the second sample
+    mean2
+        mean of the second sample
+    var2
+        sample variance of the second sample
+    equal_var
+        If True the pooled variance is used, otherwise Welch's t-test is performed
+
+    Returns
+    -------
+    t statistic and two-sided p value
+
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if equal_var:
+            df = count1 + count2 - 2.
+            pooled_var = ((count1 - 1) * var1 + (count2 - 1) * var2) / df
+            denominator = np.sqrt(pooled_var * (1. / count1 + 1. / count2))
+        else:
+            vn1 = var1 / count1
+            vn2 = var2 / count2
+            df = (vn1 + vn2) ** 2 / (vn1 ** 2 / (count1 - 1) + vn2 ** 2 / (count2 - 1))
+            # if both variances are 0 the degrees of freedom are undefined, this is the same as in scipy
+            df = np.where(np.isnan(df), 1, df)
+            denominator = np.sqrt(vn1 + vn2)
+        t = (mean1 - mean2) / denominator
+        p = 2 * stats.t.sf(np.abs(t), df)
+    return t, p
+
+
+def batched_ttest_ind(a: np.ndarray, b: np.ndarray, equal_var: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row wise two sample t-test between a and b, missing values are omitted.
+    Gives the same result as calling scipy.stats.ttest_ind(..., nan_policy="omit") for each row.
+
+    Parameters
+    ----------
+    a
+        2D array with the features as rows and the samples of the first group as columns
+    b
+        2D array with the features as rows and the samples of the second group as columns
+    equal_var
+        If True the pooled variance is used, otherwise Welch's t-test is performed
+
+    Returns
+    -------
+    t statistic and two-sided p value for each row
+
+    """
+    return ttest_from_statistics(*group_statistics(a), *group_statistics(b), equal_var=equal_var)
+
+
+def pairwise_ttest_ind(groups: Sequence[np.ndarray], pairs: Optional[Sequence[Tuple[int, int]]] = None,
+                       equal_var: bool = True) -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, int]]]:
+    """
+    Row wise two sample t-tests between pairs of groups. The statistics of each group are computed once
+    and all pairs are tested in one vectorized step.
+
+    Parameters
+    ----------
+    groups
+        one 2D array per group, all with the same rows
+    pairs
+        pairs of group positions to compare, defaults to all combinations
+    equal_var
+        If True the pooled variance is used, otherwise Welch's t-test is performed
+
+    Returns
+    -------
+    t statistic and p values both with shape features x pairs and the pairs
+
+    """
+    pairs = list(combinations(range(len(groups)), 2)) if pairs is None else list(pairs)
+    count, mean, var = (np.stack(x, axis=1) for x in zip(*(group_statistics(g) for g in groups)))
+    first = [p[0] for p in pairs]
+    second = [p[1] for p in pairs]
+    t, p = ttest_from_statistics(count[:, first], mean[:, first], var[:, first],
+                                 count[:, second], mean[:, second], var[:, second], equal_var=equal_var)
+    return t, p, pairs
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """
+    Benjamini-Hochberg adjusted p values along the first axis, missing values are ignored.
+    Gives the same result as p.adjust(p, method="BH") in R for each column.
+
+    Parameters
+    ----------
+    p_values
+        1D or 2D array of p values
+
+    Returns
+    -------
+    adjusted p values with the same shape as the input
+
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    one_dimensional = p_values.ndim == 1
+    p_values = p_values.reshape(p_values.shape[0], -1)
+    adjusted = np.full(p_values.shape, np.nan)
+    for column in range(p_values.shape[1]):
+        valid = ~np.isnan(p_values[:, column])
+        p = p_values[valid, column]
+        n = p.shape[0]
+        if n == 0:
+            continue
+        order = np.argsort(p)[::-1]
+        # cumulative minimum starting from the largest p value
+        p_adj = np.minimum.accumulate(p[order] * n / np.arange(n, 0, -1))
+        result = np.empty(n)
+        result[order] = np.minimum(p_adj, 1)
+        adjusted[valid, column] = result
+    return adjusted[:, 0] if one_dimensional else adjusted
+
+
+def trigamma_inverse(y: np.ndarray) -> np.ndarray:
+    """
+    Solves trigamma(x) = y for x using Newton's method, the same as trigammaInverse from limma
+
+    Parameters
+    ----------
+    y
+        array of positive values
+
+    Returns
+    -------
+    x with the same shape as y
+
+    """
+    y = np.asarray(y, dtype=np.float64)
+    x = np.full(y.shape, np.nan)
+    large = y > 1e7
+    small = y < 1e-6
+    x[large] = 1 / np.sqrt(y[large])
+    x[small] = 1 / y[small]
+    iterate = (y > 0) & ~large & ~small
+    y_iter = y[iterate]
+    x_iter = 0.5 + 1 / y_iter
+    for _ in range(50):
+        tri = special.polygamma(1, x_iter)
+        dif = tri * (1 - tri / y_iter) / special.polygamma(2, x_iter)
+        x_iter = x_iter + dif
+        if y_iter.size == 0 or np.max(-dif / x_iter) < 1e-8:
+            break
+    x[iterate] = x_iter
+    return x
+
+
+def fit_f_dist(x: np.ndarray, df1: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Moment estimation of the parameters of a scaled F-distribution, the same as fitFDist from limma.
+    Each column is fitted independently, missing values are ignored.
+
+    Parameters
+    ----------
+    x
+        1D or 2D array of sample variances
+    df1
+        degrees of freedom of the sample variances, broadcastable to x
+
+    Returns
+    -------
+    the scale and the second degrees of freedom per column
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    one_dimensional = x.ndim == 1
+    df1 = np.broadcast_to(np.asarray(df1, dtype=np.float64), x.shape).reshape(x.shape[0], -1)
+    x = x.reshape(x.shape[0], -1)
+    with np.errstate(invalid="ignore"):
+        ok = np.isfinite(df1) & (df1 > 1e-15) & np.isfinite(x) & (x > -1e-15)
+    x = np.where(ok, np.maximum(x, 0), np.nan)
+    df1 = np.where(ok, df1, np.nan)
+    n = ok.sum(axis=0)
+    # avoid zero variances
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "All-NaN slice encountered", RuntimeWarning)
+        m = np.nanmedian(x, axis=0)
+    if np.any((m == 0) & (n > 1)):
+        warnings.warn("More than half of residual variances are exactly zero: eBayes unreliable")
+    m = np.where(m == 0, 1, m)
+    x = np.maximum(x, 1e-5 * m)
+    e = np.log(x) - special.digamma(df1 / 2) + np.log(df1 / 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        e_mean = np.nansum(e, axis=0) / n
+        e_var = np.nansum((e - e_mean) ** 2, axis=0) / (n - 1)
+        e_var = e_var - np.nansum(special.polygamma(1, df1 / 2), axis=0) / n
+    positive = e_var > 0
+    df2 = np.full(e_mean.shape, np.inf)
+    df2[positive] = 2 * trigamma_inverse(e_var[positive])
+    scale = np.exp(e_mean)
+    scale[positive] = np.exp(e_mean[positive] + special.digamma(df2[positive] / 2) - np.log(df2[positive] / 2))
+    # special cases of very few variances
+    scale[n == 1] = np.nansum(x, axis=0)[n == 1]
+    df2[n == 1] = 0
+    scale[n == 0], df2[n == 0] = np.nan, np.nan
+    if one_dimensional:
+        return scale[0], df2[0]
+    return scale, df2
+
+
+def squeeze_var(var: np.ndarray, df: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Empirical Bayes moderation of the sample variances, the same as squeezeVar from limma.
+    Each column is moderated independently.
+
+    Parameters
+    ----------
+    var
+        1D or 2D array of sample variances
+    df
+        degrees of freedom of the sample variances, broadcastable to var
+
+    Returns
+    -------
+    the posterior variances, the prior variance and the prior degrees of freedom
+
+    """
+    var = np.asarray(var, dtype=np.float64)
+    df = np.broadcast_to(np.asarray(df, dtype=np.float64), var.shape)
+    var_prior, df_prior = fit_f_dist(var, df)
+    # variances without residual degrees of freedom are replaced by the prior
+    var = np.where(df == 0, 0, var)
+    with np.errstate(invalid="ignore"):
+        var_post = np.where(np.isinf(df_prior), var_prior, (df * var + df_prior * var_prior) / (df + df_prior))
+    return var_post, var_prior, df_prior
+
+
+def moderated_ttest(groups: Sequence[np.ndarray], pairs: Optional[Sequence[Tuple[int, int]]] = None,
+                    mask: Optional[np.ndarray] = None) -> dict:
+    """
+    Empirical Bayes moderated t-tests between pairs of groups, the same as running lmFit, contrasts.fit, eBayes and
+    topTable(adjust="BH") from limma on a two group design for each pair. The statistics of each group are computed
+    once and all pairs are tested at once.
+
+    Parameters
+    ----------
+    groups
+        one 2D array of log intensities per group, all with the same rows
+    pairs
+        pairs of group positions to compare, defaults to all combinations. The fold change is second - first
+    mask
+        boolean array with shape features x pairs selecting the features that should be tested for each pair
+
+    Returns
+    -------
+    dictionary with the pairs and arrays with shape features x pairs for the keys:
+    logFC, AveExpr, t, df, pval and adjpval. Features that were not tested are nan.
+
+    """
+    pairs = list(combinations(range(len(groups)), 2)) if pairs is None else list(pairs)
+    count, mean, var = (np.stack(x, axis=1) for x in zip(*(group_statistics(g) for g in groups)))
+    first = [p[0] for p in pairs]
+    second = [p[1] for p in pairs]
+    if mask is None:
+        mask = np.ones((count.shape[0], len(pairs)), dtype=bool)
+    mask = mask & (count[:, first] > 0) & (count[:, second] > 0)
+    n1, n2 = count[:, first].astype(np.float64), count[:, second].astype(np.float64)
+    # residual variance and degrees of freedom of the two group linear model
+    df_residual = np.where(mask, n1 + n2 - 2, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma2 = (np.nan_to_num(var[:, first] * (n1 - 1)) + np.nan_to_num(var[:, second] * (n2 - 1))) / df_residual
+        sigma2 = np.where(df_residual > 0, sigma2, np.nan)
+        log_fc = np.where(mask, mean[:, second] - mean[:, first], np.nan)
+        ave_expr = np.where(mask, (mean[:, first] * n1 + mean[:, second] * n2) / (n1 + n2), np.nan)
+        stdev_unscaled = np.sqrt(1 / n1 + 1 / n2)
+    var_post, _, df_prior = squeeze_var(sigma2, np.nan_to_num(df_residual))
+    df_pooled = np.nansum(df_residual, axis=0)
+    df_total = np.minimum(np.nan_to_num(df_residual) + df_prior, df_pooled)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = log_fc / stdev_unscaled / np.sqrt(var_post)
+        p = 2 * stats.t.sf(np.abs(t), df_total)
+    t[~mask], p[~mask] = np.nan, np.nan
+    return {"pairs": pairs, "logFC": log_fc, "AveExpr": ave_expr, "t": t, "df": np.where(mask, df_total, np.nan),
+            "pval": p, "adjpval": benjamini_hochberg(p)}
+
+
+def hypergeometric_enrichment(detected: np.ndarray, gene_sets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One sided Fisher's exact test (alternative="greater") for the enrichment of each gene set in each sample.
+    All overlaps are computed with one matrix product and all p values with one call of the hypergeometric
+    survival function. Gives the same p values as scipy.stats.fisher_exact on each 2x2 table.
+
+    Parameters
+    ----------
+    detected
+        boolean array with shape genes x samples, True if the gene was detected in the sample
+    gene_sets
+        boolean array with shape genes x sets, True if the gene is part of the set. All genes are the background
+
+    Returns
+    -------
+    the overlap counts and the p values, both with shape samples x sets
+
+    """
+    detected = np.asarray(detected, dtype=bool)
+    gene_sets = np.asarray(gene_sets, dtype=bool)
+    # float products are exact for counts below 2 ** 24 and use the fast matrix multiplication
+    overlap = np.rint(detected.T.astype(np.float32) @ gene_sets.astype(np.float32)).astype(np.int64)
+    n_detected = detected.sum(axis=0)[:, np.newaxis]
+    set_size = gene_sets.sum(axis=0)[np.newaxis, :]
+    p_values = stats.hypergeom.sf(overlap - 1, detected.shape[0], set_size, n_detected)
+    return overlap, np.clip(p_values, 0, 1)
+
+
+def _pairwise_spearman(values: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    # the ranks depend on the rows observed in both columns, so they are computed for each column against all following
+    # columns. Rows which are not observed in both columns are ranked last, they do not change the ranks of the others
+    n_columns = values.shape[1]
+    correlation = np.full((n_columns, n_columns), np.nan)
+    for i in range(n_columns):
+        common = observed[:, i:] & observed[:, [i]]
+        ranks = stats.rankdata(np.where(common, values[:, i:], np.inf), axis=0)
+        ranks_i = stats.rankdata(np.where(common, values[:, [i]], np.inf), axis=0)
+        n = common.sum(axis=0)
+        # the average ranks of the n common rows are centered by subtracting (n + 1) / 2
+        x = np.where(common, ranks - (n + 1) / 2, 0)
+        y = np.where(common, ranks_i - (n + 1) / 2, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation[i, i:] = (x * y).sum(axis=0) / np.sqrt((x * x).sum(axis=0) * (y * y).sum(axis=0))
+        correlation[i:, i] = correlation[i, i:]
+    return correlation
+
+
+def pairwise_correlation(values: np.ndarray, mask: Optional[np.ndarray] = None, method: str = "pearson"
+                         ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairwise complete correlation of all columns. For each pair of columns only the rows observed in both columns are
+    used, like pandas.DataFrame.corr. For pearson all sums over the pairwise complete rows are computed with masked
+    matrix products, so no pair of columns is handled separately.
+
+    Parameters
+    ----------
+    values
+        array with shape rows x columns, missing values are nan
+    mask
+        boolean array with the shape of values, only the rows which are True are used for a column.
+        If None all non missing values are used
+    method
+        either pearson or spearman. For spearman the columns are ranked again for every pair of columns, since the
+        ranks depend on the rows observed in both. The number of rankings grows quadratically with the columns
+
+    Returns
+    -------
+    the correlation matrix and the number of rows used for each pair of columns, both with shape columns x columns
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    if mask is not None:
+        observed &= np.asarray(mask, dtype=bool)
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Invalid correlation method: {method}")
+    m = observed.astype(np.float64)
+    n = m.T @ m
+    if method == "spearman":
+        correlation = _pairwise_spearman(values, observed)
+    else:
+        # centering each column does not change the correlations but avoids cancellation in the sums of squares
+        n_observed = observed.sum(axis=0)
+        column_means = np.where(observed, values, 0).sum(axis=0) / np.maximum(n_observed, 1)
+        x = np.where(observed, values - column_means, 0)
+        # sum_x[i, j] is the sum of column i over the rows observed in both columns
+        sum_x = x.T @ m
+        sum_xx = (x * x).T @ m
+        sum_xy = x.T @ x
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = sum_xy - sum_x * sum_x.T / n
+            variance = sum_xx - sum_x ** 2 / n
+            correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[n < 2] = np.nan
+    return np.clip(correlation, -1, 1), np.rint(n).astype(np.int64)
+
+
+def kde_bandwidth(values: np.ndarray, bw_method="scott") -> np.ndarray:
+    """
+    Standard deviation of the gaussian kernel of each column, as used by scipy.stats.gaussian_kde for one dimensional
+    data
+
+    Parameters
+    ----------
+    values
+        array with shape rows x columns, missing values are nan
+    bw_method
+        "scott", "silverman" or a scalar factor which is multiplied with the standard deviation of the columns
+
+    Returns
+    -------
+    the bandwidth of each column, nan for columns with less than two values
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = (~np.isnan(values)).sum(axis=0)
+    if bw_method == "scott":
+        factor = n ** (-1 / 5)
+    elif bw_method == "silverman":
+        factor = (n * 3 / 4) ** (-1 / 5)
+    elif np.isscalar(bw_method) and not isinstance(bw_method, str):
+        factor = np.full(values.shape[1], float(bw_method))
+    else:
+        raise ValueError(f"Invalid bandwidth method: {bw_method}")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        std = np.nanstd(values, axis=0, ddof=1)
+    return np.where(n > 1, factor * std, np.nan)
+
+
+def binned_kde(values: np.ndarray, grid: np.ndarray, bw_method="scott") -> np.ndarray:
+    """
+    Gaussian kernel density estimate of all columns on a shared, equally spaced grid. The values of each column are
+    linearly binned onto the grid and the bins are convolved with the kernels of all columns by one FFT, so the cost
+    does not depend on the product of the number of values and grid points like evaluating scipy.stats.gaussian_kde.
+    The binning error decreases quadratically with the grid spacing relative to the bandwidth.
+
+    Parameters
+    ----------
+    values
+        array with shape rows x columns, missing values are nan
+    grid
+        equally spaced, increasing positions at which the densities are evaluated. Values outside of the grid are
+        assigned to the closest grid point
+    bw_method
+        see kde_bandwidth
+
+    Returns
+    -------
+    the densities with shape grid x columns, nan for columns with less than two values or without variance
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    n_grid, n_cols = len(grid), values.shape[1]
+    bandwidth = kde_bandwidth(values, bw_method)
+    densities = np.full((n_grid, n_cols), np.nan)
+    if n_grid < 2 or n_cols == 0:
+        return densities
+    delta = (grid[-1] - grid[0]) / (n_grid - 1)
+    # linear binning, each value is split between its two closest grid points
+    observed = ~np.isnan(values)
+    position = np.clip((values[observed] - grid[0]) / delta, 0, n_grid - 1)
+    left = np.minimum(np.floor(position).astype(np.int64), n_grid - 2)
+    right_weight = position - left
+    column = np.nonzero(observed)[1]
+    counts = np.bincount(left * n_cols + column, weights=1 - right_weight, minlength=n_grid * n_cols)
+    counts += np.bincount((left + 1) * n_cols + column, weights=right_weight, minlength=n_grid * n_cols)
+    counts = counts.reshape(n_grid, n_cols) / np.maximum(observed.sum(axis=0), 1)
+    # kernels over all distances between grid points, arranged circularly so the convolution is not truncated
+    valid = np.isfinite(bandwidth) & (bandwidth > 0)
+    size = fft.next_fast_len(2 * n_grid)
+    distance = np.arange(size, dtype=np.float64)
+    distance = np.minimum(distance, size - distance) * delta
+    kernels = np.exp(-0.5 * (distance[:, np.newaxis] / bandwidth[valid]) ** 2) / (bandwidth[valid] * np.sqrt(2 * np.pi))
+    convolved = fft.irfft(fft.rfft(counts[:, valid], n=size, axis=0) * fft.rfft(kernels, axis=0), n=size, axis=0)
+    densities[:, valid] = np.maximum(convolved[:n_grid], 0)
+    return densities
@@ -1,6 +1,9 @@
 from .DataStructure import DataNode, DataTree
 from .Normalization import interpolate_data, MedianNormalizer, QuantileNormalizer, TailRobustNormalizer,\
-    default_normalizers
+    NormalizationCache, normalize_chunked, default_normalizers
+from .Statistics import batched_ttest_ind, pairwise_ttest_ind, moderated_ttest, hypergeometric_enrichment
+from .LinearModel import LinearModel
+from .GeneSetLibrary import GeneSetLibrary
 
 __all__ = [
     "DataNode",
@@ -9,5 +12,13 @@ __all__ = [
     "MedianNormalizer",
     "QuantileNormalizer",
     "TailRobustNormalizer",
-    "default_normalizers"
+    "NormalizationCache",
+    "normalize_chunked",
+    "default_normalizers",
+    "batched_ttest_ind",
+    "pairwise_ttest_ind",
+    "moderated_ttest",
+    "hypergeometric_enrichment",
+    "LinearModel",
+    "GeneSetLibrary"
 ]
@@ -0,0 +1,102 @@
+"""
+Placement of text labels next to the points they annotate. In contrast to the iterative repulsion of adjust_text,
+every label is tried at a fixed number of positions around its point, so the run time only grows linearly with the
+number of labels.
+"""
+from typing import Sequence
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.text import Annotation, Text
+
+
+def _box_sums(sums: np.ndarray, i0: np.ndarray, i1: np.ndarray, j0: np.ndarray, j1: np.ndarray) -> np.ndarray:
+    # sums of the cells [i0, i1) x [j0, j1) from a summed area table with a leading row and column of zeros
+    return sums[i1, j1] - sums[i0, j1] - sums[i1, j0] + sums[i0, j0]
+
+
+def _summed_area_table(grid: np.ndarray) -> np.ndarray:
+    sums = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1))
+    sums[1:, 1:] = grid.cumsum(axis=0).cumsum(axis=1)
+    return sums
+
+
+def place_labels_on_grid(
+        ax: Axes, labels: Sequence[Annotation], points: np.ndarray, cell_size: float = 4, n_rings: int = 6,
+        n_directions: int = 16, label_overlap_weight: float = 10, distance_weight: float = 1
+):
+    """
+    Greedy placement of labels on an occupancy grid of the axes. The points are binned into grid cells once. Then
+    the labels are placed one after another, in the given order, at the candidate position with the lowest cost.
+    The candidates are the point of the label and n_rings rings of n_directions positions around it. The cost of a
+    position is the number of points below the label, the number of cells shared with already placed labels times
+    label_overlap_weight and the distance to the point in label heights times distance_weight. Positions outside of
+    the axes are only used if no other position is available. Labels which are moved away from their point keep the
+    arrow of the annotation, the arrow is removed from the others.
+
+    Parameters
+    ----------
+    ax
+        axes of the labels and points
+    labels
+        annotations of the points, their xy position is the point and their text is moved. Their layout should be
+        final, i.e. the figure should not be resized afterwards
+    points
+        array with the x and y data coordinates of all points which should not be covered by labels
+    cell_size
+        size of the grid cells in pixels
+    n_rings
+        number of rings of candidate positions around each point
+    n_directions
+        number of candidate positions per ring
+    label_overlap_weight
+        cost of every cell which is shared with another label
+    distance_weight
+        cost of moving a label by its height
+
+    """
+    if len(labels) == 0:
+        return
+    renderer = ax.figure.canvas.get_renderer()
+    axes_box = ax.get_window_extent(renderer)
+    n_x = max(int(np.ceil(axes_box.width / cell_size)), 1)
+    n_y = max(int(np.ceil(axes_box.height / cell_size)), 1)
+    # number of points in every cell, points outside of the axes are ignored
+    points = ax.transData.transform(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    points = points[np.isfinite(points).all(axis=1)]
+    density, _, _ = np.histogram2d(
+        points[:, 0], points[:, 1], bins=(n_x, n_y),
+        range=((axes_box.x0, axes_box.x0 + n_x * cell_size), (axes_box.y0, axes_box.y0 + n_y * cell_size))
+    )
+    point_sums = _summed_area_table(density)
+    label_cells = np.zeros((n_x, n_y))
+
+    angles = np.linspace(0, 2 * np.pi, n_directions, endpoint=False)
+    anchors = ax.transData.transform(np.array([label.xy for label in labels], dtype=np.float64))
+    to_data = ax.transData.inverted()
+    for label, anchor in zip(labels, anchors):
+        # the extent of the annotation would include its arrow
+        label.update_positions(renderer)
+        text_box = Text.get_window_extent(label, renderer)
+        width, height = text_box.width + cell_size, text_box.height + cell_size
+        # distance between the edge of the label and its point for every ring
+        gaps = np.arange(n_rings)[:, np.newaxis] * height + height / 2
+        dx = np.concatenate([[0], (np.cos(angles) * (width / 2 + gaps)).ravel()])
+        dy = np.concatenate([[0], (np.sin(angles) * (height / 2 + gaps)).ravel()])
+        left = (anchor[0] + dx - width / 2 - axes_box.x0) / cell_size
+        bottom = (anchor[1] + dy - height / 2 - axes_box.y0) / cell_size
+        i0, j0 = np.floor(left).astype(int), np.floor(bottom).astype(int)
+        i1, j1 = np.ceil(left + width / cell_size).astype(int), np.ceil(bottom + height / cell_size).astype(int)
+        outside = (i0 < 0) | (j0 < 0) | (i1 > n_x) | (j1 > n_y)
+        i0, i1 = np.clip(i0, 0, n_x), np.clip(i1, 0, n_x)
+        j0, j1 = np.clip(j0, 0, n_y), np.clip(j1, 0, n_y)
+        cost = _box_sums(point_sums, i0, i1, j0, j1)
+        cost += label_overlap_weight * _box_sums(_summed_area_table(label_cells), i0, i1, j0, j1)
+        cost += distance_weight * np.hypot(dx, dy) / height
+        if not outside.all():
+            cost[outside] = np.inf
+        best = int(np.argmin(cost))
+        label.xyann = tuple(to_data.transform((anchor[0] + dx[best], anchor[1] + dy[best])))
+        label_cells[i0[best]:i1[best], j0[best]:j1[best]] += 1
+        if best == 0:
+            label.arrowprops, label.arrow_patch = None, None
@@ -1,53 +1,297 @@
 import os
 from itertools import combinations
-from typing import Tuple, Optional, Union, Callable, Dict, Iterable
+from typing import Tuple, Optional, Union, Callable, Dict, Iterable, List
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 import matplotlib.colors as colors
 import matplotlib.cm as cm
+from matplotlib import __version_info__ as matplotlib_version_info
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib.collections import LineCollection
 from adjustText import adjust_text
 from matplotlib.colorbar import ColorbarBase
 from matplotlib_venn import venn2, venn3
 from scipy.optimize import curve_fit
-from scipy.stats import gaussian_kde
 from scipy import stats
 from sklearn.decomposition import PCA
 import functools
+import json
+import threading
 import warnings
+from contextlib import contextmanager
 
 from mspypeline.helpers import get_number_rows_cols_for_fig, plot_annotate_line, get_legend_elements, \
-    get_plot_name_suffix, get_intersection_and_unique, venn_names
+    get_plot_name_suffix, venn_names, BackgroundWriter, get_fingerprint
+from mspypeline.version import __version__
+from mspypeline.modules.Statistics import binned_kde
+from mspypeline.plotting_backend.label_placement import place_labels_on_grid
 
 FIG_FORMAT = ".pdf"
+PLOT_MANIFEST_DIR = ".plot_manifest"
+# outputs of the plot which is created by the current thread, see plot_manifest_record
+_manifest_state = threading.local()
 
 
 def linear(x, m, b):
     return m * x + b
 
 
+def new_figure(**kwargs) -> Figure:
+    """
+    Creates a figure with its own Agg canvas. Unlike figures created by pyplot it is not tracked by a global figure
+    manager, so figures can be created, saved and garbage collected independently, also from several threads.
+
+    Parameters
+    ----------
+    kwargs
+        passed to Figure, e.g. figsize
+
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def subplots(nrows: int = 1, ncols: int = 1, sharex: Union[bool, str] = False, sharey: Union[bool, str] = False,
+             squeeze: bool = True, subplot_kw: Optional[dict] = None, gridspec_kw: Optional[dict] = None, **fig_kw
+             ) -> Tuple[Figure, Union[Axes, np.ndarray]]:
+    """
+    Same as pyplot.subplots, but the figure is created by new_figure
+    """
+    fig = new_figure(**fig_kw)
+    axarr = fig.subplots(nrows, ncols, sharex=sharex, sharey=sharey, squeeze=squeeze, subplot_kw=subplot_kw,
+                         gridspec_kw=gridspec_kw)
+    return fig, axarr
+
+
+# matplotlib parses math text such as "$Log_2$" with one parser which is shared by all figures, so the steps which
+# lay out the text of a figure must not run in several threads at the same time. The parser is called from within
+# drawing and text extent calculations, so the lock covers these steps as a whole. They take about 40% of the time of
+# create_results, which limits the speedup of thread workers, see BasePlotter.create_results.
+text_layout_lock = threading.RLock()
+
+
+def tight_layout(fig: Figure, rect: Tuple[float, float, float, float] = (0, 0.03, 1, 0.95)):
+    with text_layout_lock:
+        fig.tight_layout(rect=list(rect))
+
+
+def write_output(output_writer: Optional[BackgroundWriter], write_function: Callable, *args, **kwargs):
+    """
+    Calls write_function(*args, **kwargs) in the background if an output_writer is passed, otherwise directly
+    """
+    if output_writer is None:
+        write_function(*args, **kwargs)
+    else:
+        output_writer.submit(write_function, *args, **kwargs)
+
+
+# number of points from which on scatter plots are not drawn as vector elements, see get_dense_mode
+DENSE_THRESHOLD = 50000
+
+
+def get_dense_mode(n_points: int, dense_threshold: Optional[int] = DENSE_THRESHOLD, dense_mode: str = "rasterize",
+                   **kwargs) -> Optional[str]:
+    """
+    Rendering policy for plots with many points. Drawing every point as a vector element makes the files large and
+    slow to write and open, so above a threshold the points are either rasterized or replaced by their density.
+    Axes, labels and highlighted points always stay vector elements.
+
+    Parameters
+    ----------
+    n_points
+        number of points of the plot
+    dense_threshold
+        number of points from which on the dense_mode is used. None always draws vector elements
+    dense_mode
+        "rasterize" draws the points as an image, "hexbin" draws their density in hexagonal bins and "vector" always
+        draws vector elements
+    kwargs
+        accepts kwargs
+
+    Returns
+    -------
+    None if the points should be drawn as vector elements, otherwise the dense_mode
+
+    """
+    if dense_mode not in ("rasterize", "hexbin", "vector"):
+        raise ValueError(f"Invalid dense mode: {dense_mode}")
+    if dense_mode == "vector" or dense_threshold is None or n_points <= dense_threshold:
+        return None
+    return dense_mode
+
+
+def dense_scatter(ax: Axes, x, y, mode: Optional[str], xscale: str = "linear", yscale: str = "linear",
+                  gridsize: int = 100, cmap: Union[str, colors.Colormap] = "Greys", **scatter_kwargs):
+    """
+    Scatter plot drawn according to a mode of get_dense_mode
+
+    Parameters
+    ----------
+    ax
+        axes to draw on
+    x
+    y
+    mode
+        None, "rasterize" or "hexbin"
+    xscale
+        scale of the x axis, needs to be known before drawing the density
+    yscale
+        scale of the y axis
+    gridsize
+        number of hexagons in x direction of the density
+    cmap
+        colormap of the density
+    scatter_kwargs
+        passed to the scatter plot, only the label is used for the density
+
+    Returns
+    -------
+    the collection that was drawn
+
+    """
+    if mode == "hexbin":
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        finite = np.isfinite(x) & np.isfinite(y)
+        if xscale == "log":
+            finite &= x > 0
+        if yscale == "log":
+            finite &= y > 0
+        return ax.hexbin(x[finite], y[finite], gridsize=gridsize, bins="log", mincnt=1, cmap=cmap, xscale=xscale,
+                         yscale=yscale, linewidths=0, label=scatter_kwargs.get("label"))
+    return ax.scatter(x, y, rasterized=mode == "rasterize", **scatter_kwargs)
+
+
+def bin_rows(data: pd.DataFrame, max_rows: int) -> np.ndarray:
+    """
+    Reduces the rows of data to at most max_rows by averaging blocks of consecutive rows. A value of a block is
+    missing if more than half of the values of the block are missing.
+
+    Parameters
+    ----------
+    data
+        data with rows to bin
+    max_rows
+        maximum number of rows of the result
+
+    Returns
+    -------
+    array with the binned rows
+
+    """
+    values = data.values.astype(np.float64)
+    bin_size = int(np.ceil(len(values) / max_rows))
+    if bin_size <= 1:
+        return values
+    bins = np.arange(len(values)) // bin_size
+    n_bins = bins[-1] + 1
+    present = ~np.isnan(values)
+    counts = np.zeros((n_bins, values.shape[1]))
+    sums = np.zeros((n_bins, values.shape[1]))
+    np.add.at(counts, bins, present)
+    np.add.at(sums, bins, np.where(present, values, 0))
+    sizes = np.bincount(bins)[:, np.newaxis]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts * 2 >= sizes, sums / counts, np.nan)
+
+
+# first and last matplotlib version whose pdf backend was checked to keep the images of all pages in the private
+# PdfFile._images until the pdf is closed, see PdfSink
+PDF_IMAGE_FLUSH_VERSIONS = ((3, 6), (3, 10))
+
+
+class PdfSink:
+    """
+    Saves figures as pages of one pdf while they are created. By default each figure is cleared once it is saved, so
+    only the figure which is currently created is kept in memory, instead of all figures of the pdf.
+
+    The pdf backend keeps the rasterized images of all pages until the pdf is closed. For the matplotlib versions of
+    PDF_IMAGE_FLUSH_VERSIONS the images are written after each page instead, which uses private attributes of the
+    backend. Other versions write the images on close, like PdfPages.
+    """
+    def __init__(self, path: str, dpi: int = 200, clear_figures: bool = True):
+        """
+        Parameters
+        ----------
+        path
+            path of the pdf, ".pdf" is appended if it is missing
+        dpi
+            resolution of rasterized elements
+        clear_figures
+            if the figures should be cleared after they are saved
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not path.endswith(".pdf"):
+            path += ".pdf"
+        self.dpi = dpi
+        self.clear_figures = clear_figures
+        self.pdf = PdfPages(path)
+        first_version, last_version = PDF_IMAGE_FLUSH_VERSIONS
+        pdf_file = getattr(self.pdf, "_file", None)
+        self.flush_images = first_version <= tuple(matplotlib_version_info[:2]) <= last_version and \
+            isinstance(getattr(pdf_file, "_images", None), dict) and hasattr(pdf_file, "writeImages")
+        # names and object ids of the images which were already written to the pdf
+        self.written_images = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, plot):
+        """
+        Saves a plot as the next page
+
+        Parameters
+        ----------
+        plot
+            a figure, a tuple containing a figure, e.g. (figure, axes), or a function returning figure and axes.
+            Other values, e.g. None for skipped plots, are ignored
+        """
+        figure = None
+        if callable(plot):
+            figure, axes = plot()
+        elif isinstance(plot, Iterable):
+            for x in plot:
+                if isinstance(x, Figure):
+                    figure = x
+                    break
+        elif isinstance(plot, Figure):
+            figure = plot
+        if figure is not None:
+            with text_layout_lock:
+                self.pdf.savefig(figure, dpi=self.dpi)
+                if self.flush_images:
+                    self._write_images()
+            if self.clear_figures:
+                # the artists of a figure reference each other and are otherwise only freed by the garbage collector
+                figure.clear()
+
+    def _write_images(self):
+        # only the names of the written images are kept, which the pdf needs at the end
+        pdf_file = self.pdf._file
+        pdf_file.writeImages()
+        # the images are keyed by their id, which can be reused once they are freed
+        self.written_images.update({("written", ob.id): (None, name, ob) for _, name, ob in pdf_file._images.values()})
+        pdf_file._images = {}
+
+    def close(self):
+        if self.written_images:
+            pdf_file = self.pdf._file
+            pdf_file._images.update(self.written_images)
+            # all images were written already
+            pdf_file.writeImages = lambda: None
+        self.pdf.close()
+
+
 def collect_plots_to_pdf(path: str, *args, dpi: int = 200):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    if not path.endswith(".pdf"):
-        path += ".pdf"
-    with PdfPages(path) as pdf:
+    with PdfSink(path, dpi=dpi, clear_figures=False) as sink:
         for plot in args:
-            figure = None
-            if callable(plot):
-                figure, axes = plot()
-            elif isinstance(plot, Iterable):
-                for x in plot:
-                    if isinstance(x, plt.Figure):
-                        figure = x
-                        break
-            elif isinstance(plot, plt.Figure):
-                figure = plot
-            if figure is not None:
-                pdf.savefig(figure, dpi=dpi)
-                plt.close(figure)
+            sink.add(plot)
 
 
 _get_path_and_name_kwargs_doc = """
@@ -88,9 +332,85 @@ def get_path_and_name_from_kwargs(name: str, **kwargs) -> Tuple[str, str]:
     return save_path, name
 
 
+def add_manifest_output(file_path: str):
+    outputs = getattr(_manifest_state, "outputs", None)
+    if outputs is not None:
+        outputs.append(file_path)
+
+
+def write_manifest_record(record_path: str, record: dict):
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    # replace the record at once, several workers might write records at the same time
+    tmp_path = f"{record_path}.{os.getpid()}_{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, record_path)
+
+
+@contextmanager
+def plot_manifest_record(name: str, func: Callable, kwargs: dict):
+    f"""
+    Records the outputs of a plot in the plot manifest, which is a directory next to the outputs with one json file
+    per plot. A record contains a fingerprint of the plot function, all kwargs including the plot data and the
+    mspypeline version, and the files that were written. Only the outermost decorated function creates a record,
+    functions called by it only add their outputs.
+
+    Parameters
+    ----------
+    name
+        name of the record, formatted like the name of a plot
+    func
+        the plot function
+    kwargs
+        kwargs of the plot function. Records are only used if skip_unchanged_plots is passed and True. The record is
+        written by the output_writer of the kwargs, if one is passed.
+        {_get_path_and_name_kwargs_doc}
+
+    Yields
+    ------
+    True if the plot is unchanged since its record was written and all its outputs exist, so it does not need to be
+    created again. Otherwise False and the outputs written until the context exits are recorded.
+
+    """
+    if getattr(_manifest_state, "outputs", None) is not None or not kwargs.get("skip_unchanged_plots", False):
+        yield False
+        return
+    try:
+        save_path, record_name = get_path_and_name_from_kwargs(name, **kwargs)
+        if save_path is None:
+            raise TypeError("plots which are not saved are not recorded")
+        fingerprint = get_fingerprint(func.__module__, func.__qualname__, __version__,
+                                      {k: v for k, v in kwargs.items()
+                                       if k not in ("skip_unchanged_plots", "output_writer")})
+    except (KeyError, TypeError):
+        yield False
+        return
+    record_path = os.path.join(save_path, PLOT_MANIFEST_DIR, record_name + ".json")
+    try:
+        with open(record_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = {}
+    outputs = record.get("outputs", [])
+    if record.get("fingerprint") == fingerprint and outputs and \
+            all(os.path.isfile(os.path.join(save_path, output)) for output in outputs):
+        yield True
+        return
+    _manifest_state.outputs = []
+    try:
+        yield False
+        outputs = [os.path.relpath(output, save_path) for output in _manifest_state.outputs]
+    finally:
+        _manifest_state.outputs = None
+    record = {"fingerprint": fingerprint, "version": __version__, "function": func.__qualname__, "outputs": outputs}
+    # queued after the outputs, so the record is only written once they were written
+    write_output(kwargs.get("output_writer"), write_manifest_record, record_path, record)
+
+
 def save_plot_func(
-        fig: plt.Figure, path: str, plot_name: str, func: Callable, fig_format: str = FIG_FORMAT,
-        dpi: int = 200, **kwargs
+        fig: Figure, path: str, plot_name: str, func: Callable, fig_format: str = FIG_FORMAT,
+        dpi: int = 200, tight_bbox: bool = True, in_background: bool = True,
+        output_writer: Optional[BackgroundWriter] = None, **kwargs
 ) -> None:
     """
 
@@ -101,7 +421,14 @@ def save_plot_func(
     plot_name
     func
     fig_format
+        file type of the figure, e.g. ".pdf" or ".png"
     dpi
+    tight_bbox
+        if the saved area should be fit to the drawn elements, which requires drawing the figure twice
+    in_background
+        if the figure can be written by the output_writer. Should be False if the figure is changed afterwards
+    output_writer
+        writes the figure in the background if passed, see BasePlotter.create_results
     kwargs
 
     Returns
@@ -109,12 +436,24 @@ def save_plot_func(
 
     """
     if path is not None:
-        try:
-            os.makedirs(path, exist_ok=True)
-            res_path = os.path.join(path, plot_name)
-            fig.savefig(res_path + fig_format, dpi=dpi, bbox_inches="tight")
-        except PermissionError:
-            warnings.warn(f"Permission error in function {str(func).split(' ')[1]}. Did you forget to close the file?")
+        if not fig_format.startswith("."):
+            fig_format = "." + fig_format
+        add_manifest_output(os.path.join(path, plot_name) + fig_format)
+        if in_background:
+            write_output(output_writer, write_figure, fig, path, plot_name, func, fig_format, dpi, tight_bbox)
+        else:
+            write_figure(fig, path, plot_name, func, fig_format, dpi, tight_bbox)
+
+
+def write_figure(fig: Figure, path: str, plot_name: str, func: Callable, fig_format: str = FIG_FORMAT, dpi: int = 200,
+                 tight_bbox: bool = True):
+    try:
+        os.makedirs(path, exist_ok=True)
+        res_path = os.path.join(path, plot_name)
+        with text_layout_lock:
+            fig.savefig(res_path + fig_format, dpi=dpi, bbox_inches="tight" if tight_bbox else None)
+    except PermissionError:
+        warnings.warn(f"Permission error in function {str(func).split(' ')[1]}. Did you forget to close the file?")
 
 
 def save_plot(plot_name: str):
@@ -134,21 +473,27 @@ def save_plot(plot_name: str):
     def decorator_save_plot(func):
         @functools.wraps(func)
         def wrapper_save_plot(*args, **kwargs):
-            # run original function
-            ret = func(*args, **kwargs)
-            if ret is not None:
-                path, pn = get_path_and_name_from_kwargs(name=plot_name, **kwargs)
-                save_plot_func(ret[0], path, pn, func, **kwargs)
-            return ret
+            with plot_manifest_record(plot_name, func, kwargs) as unchanged:
+                if unchanged:
+                    return None
+                # run original function
+                ret = func(*args, **kwargs)
+                if ret is not None:
+                    path, pn = get_path_and_name_from_kwargs(name=plot_name, **kwargs)
+                    save_plot_func(ret[0], path, pn, func, **kwargs)
+                return ret
         return wrapper_save_plot
     return decorator_save_plot
 
 
-def save_csv_fn(save_path: str, csv_name: str, df: Union[pd.Series, pd.DataFrame]):
+def save_csv_fn(save_path: str, csv_name: str, df: Union[pd.Series, pd.DataFrame],
+                output_writer: Optional[BackgroundWriter] = None):
     if save_path is not None:
         os.makedirs(save_path, exist_ok=True)
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        df.to_csv(os.path.join(save_path, csv_name) + ".csv", header=True)
+        csv_path = os.path.join(save_path, csv_name) + ".csv"
+        add_manifest_output(csv_path)
+        write_output(output_writer, df.to_csv, csv_path, header=True)
 
 
 def save_csvs(name_map: Dict[str, str]):
@@ -166,37 +511,67 @@ def save_csvs(name_map: Dict[str, str]):
     def decorator_save_csvs(func):
         @functools.wraps(func)
         def wrapper_save_csvs(*args, **kwargs):
-            for kwarg_name, file_name in name_map.items():
-                df = kwargs.get(kwarg_name, None)
-                if df is not None:
-                    save_path, csv_name = get_path_and_name_from_kwargs(file_name, **kwargs)
-                    save_csv_fn(save_path, csv_name, df)
-            return func(*args, **kwargs)
+            with plot_manifest_record(next(iter(name_map.values())), func, kwargs) as unchanged:
+                if unchanged:
+                    return None
+                for kwarg_name, file_name in name_map.items():
+                    df = kwargs.get(kwarg_name, None)
+                    if df is not None:
+                        save_path, csv_name = get_path_and_name_from_kwargs(file_name, **kwargs)
+                        save_csv_fn(save_path, csv_name, df, kwargs.get("output_writer"))
+                return func(*args, **kwargs)
         return wrapper_save_csvs
     return decorator_save_csvs
 
 
+def get_venn_txt_path(save_path: str, txt_name: str, intersected: Iterable[str], unioned: Iterable[str]) -> str:
+    # the name is based on the intersections and unions that were done
+    intersected_name = "&".join(sorted(intersected))
+    unioned_name = "-" + "-".join(sorted(unioned)) if unioned else ""
+    return os.path.join(save_path, f"{txt_name}_{intersected_name}{unioned_name}.txt")
+
+
+def get_venn_txt_paths(named_sets: Dict[str, set], save_path: str, txt_name: str) -> List[str]:
+    """
+    Paths of the txt files written by write_venn_to_txt, without computing the intersections
+    """
+    if len(named_sets) > 6:
+        return [os.path.join(save_path, f"{txt_name}_intersections.txt")]
+    names = set(named_sets)
+    return [get_venn_txt_path(save_path, txt_name, intersected, names.difference(intersected))
+            for i in range(1, len(names) + 1) for intersected in combinations(sorted(names), i)]
+
+
+def write_venn_to_txt(named_sets: Dict[str, set], save_path: str, txt_name: str):
+    os.makedirs(save_path, exist_ok=True)
+    if len(named_sets) > 6:
+        # one file per combination is not feasible, so all non-empty intersections are written into
+        # one tab separated file instead
+        res_path = os.path.join(save_path, f"{txt_name}_intersections.txt")
+        with open(res_path, "w") as out:
+            out.write("intersection\tn_proteins\tproteins\n")
+            for intersected, unioned, result in venn_names(named_sets, only_nonempty=True):
+                out.write(f"{'&'.join(intersected)}\t{len(result)}\t{';'.join(sorted(result))}\n")
+        return
+    for intersected, unioned, result in venn_names(named_sets):
+        res_path = get_venn_txt_path(save_path, txt_name, intersected, unioned)
+        # write all names line by line into the file
+        with open(res_path, "w") as out:
+            for re in result:
+                out.write(re + "\n")
+
+
 def save_venn_to_txt(name_map: Dict[str, str]):
     def decorator_save_venn(func):
         @functools.wraps(func)
         def wrapper_save_venn(*args, **kwargs):
             for kwarg_name, file_name in name_map.items():
                 named_sets = kwargs.get(kwarg_name, None)
-                if named_sets is not None:
-                    if len(named_sets) > 6:
-                        warnings.warn(f"Skipping save_venn_to_txt because more than 6 experiments were passed at once. "
-                                      f"({len(named_sets)}")
-                        continue
-                    save_path, txt_name = get_path_and_name_from_kwargs(file_name, **kwargs)
-                    for intersected, unioned, result in venn_names(named_sets):
-                        # create name based on the intersections and unions that were done
-                        intersected_name = "&".join(sorted(intersected))
-                        unioned_name = "-" + "-".join(sorted(unioned)) if unioned else ""
-                        res_path = os.path.join(save_path, f"{txt_name}_{intersected_name}{unioned_name}.txt")
-                        # write all names line by line into the file
-                        with open(res_path, "w") as out:
-                            for re in result:
-                                out.write(re + "\n")
+                save_path, txt_name = get_path_and_name_from_kwargs(file_name, **kwargs)
+                if named_sets is not None and save_path is not None:
+                    for txt_path in get_venn_txt_paths(named_sets, save_path, txt_name):
+                        add_manifest_output(txt_path)
+                    write_output(kwargs.get("output_writer"), write_venn_to_txt, named_sets, save_path, txt_name)
             return func(*args, **kwargs)
         return wrapper_save_venn
     return decorator_save_venn
@@ -221,8 +596,8 @@ def save_volcano_results(
         volcano_data: pd.DataFrame, unique_g1: pd.Series = None, unique_g2: pd.Series = None, g1: str = "group1",
         g2: str = "group2", adj_pval: bool = True, intensity_label: str = "Intensity", split_files: bool = True,
         show_suptitle: bool = True, fchange_threshold: float = 2, scatter_size: float = 10,
-        n_labelled_proteins: int = 10, **kwargs
-) -> Tuple[plt.Figure, Tuple[plt.Axes, plt.Axes, plt.Axes]]:
+        n_labelled_proteins: int = 10, label_placement: Optional[str] = "adjust_text", **kwargs
+) -> Tuple[Figure, Tuple[Axes, Axes, Axes]]:
     f"""
     Saves multiple csv files and images containing the information of the volcano plot
 
@@ -251,12 +626,15 @@ def save_volcano_results(
         size of the points in the scatter plots
     n_labelled_proteins
         number of points that will be marked in th plot
+    label_placement
+        how the labels are moved apart to avoid overlaps. "adjust_text" iteratively repels the labels, which gets
+        slow for many labels, "grid" places them greedily with a fixed number of tries per label, see
+        place_labels_on_grid. None leaves the labels on their points
     kwargs
         {_get_path_and_name_kwargs_doc}
 
 
     """
-    plt.close("all")
 
     col_mapping = {"adjpval": "adjusted p value", "pval": "unadjusted p value"}
     if adj_pval:
@@ -281,21 +659,21 @@ def save_volcano_results(
     # save the volcano data csv in full and only the significant part
     save_path, csv_name = get_path_and_name_from_kwargs("volcano_plot_data_{g1}_vs_{g2}_full_{p}",
                                                         g1=g1, g2=g2, p=col_mapping[col].replace(' ', '_'), **kwargs)
-    save_csv_fn(save_path, csv_name, volcano_data)
+    save_csv_fn(save_path, csv_name, volcano_data, kwargs.get("output_writer"))
     save_path, csv_name = get_path_and_name_from_kwargs("volcano_plot_data_{g1}_vs_{g2}_significant_{p}",
                                                         g1=g1, g2=g2, p=col_mapping[col].replace(' ', '_'), **kwargs)
-    save_csv_fn(save_path, csv_name, volcano_data[volcano_data[col] < 0.05])
+    save_csv_fn(save_path, csv_name, volcano_data[volcano_data[col] < 0.05], kwargs.get("output_writer"))
 
     significance_to_color = {"ns": "gray", "up": "red", "down": "blue"}
     significance_to_label = {"ns": "non-significant", "up": f"upregulated in {g2}", "down": f"upregulated in {g1}"}
 
     # plot
-    fig = plt.figure(figsize=(7, 7))
+    fig = new_figure(figsize=(7, 7))
 
-    gs = gridspec.GridSpec(1, 3, width_ratios=[1, 8, 1])
-    ax_unique_down: plt.Axes = plt.subplot(gs[0])
-    ax: plt.Axes = plt.subplot(gs[1])
-    ax_unique_up: plt.Axes = plt.subplot(gs[2])
+    gs = fig.add_gridspec(1, 3, width_ratios=[1, 8, 1])
+    ax_unique_down: Axes = fig.add_subplot(gs[0])
+    ax: Axes = fig.add_subplot(gs[1])
+    ax_unique_up: Axes = fig.add_subplot(gs[2])
 
     # hide the spines between ax and ax2
     ax_unique_down.spines['right'].set_visible(False)
@@ -308,10 +686,13 @@ def save_volcano_results(
     ax_unique_up.tick_params(which='both', bottom=False, labelbottom=False)
 
     # non sign gray, left side significant blue, right side red
+    # only the non significant proteins are drawn according to the dense mode
+    dense_mode = get_dense_mode(len(volcano_data), **kwargs)
     for regulation in significance_to_color:
         mask = [x == regulation for x in volcano_data["regulation"]]
-        ax.scatter(volcano_data["logFC"][mask], -np.log10(volcano_data[col])[mask], s=scatter_size,
-                   color=significance_to_color[regulation], label=f"{sum(mask)} {significance_to_label[regulation]}")
+        dense_scatter(ax, volcano_data["logFC"][mask], -np.log10(volcano_data[col])[mask],
+                      dense_mode if regulation == "ns" else None, s=scatter_size,
+                      color=significance_to_color[regulation], label=f"{sum(mask)} {significance_to_label[regulation]}")
     # get axis bounds for vertical and horizontal lines
     ymin, ymax = ax.get_ybound()
     xmin, xmax = ax.get_xbound()
@@ -351,12 +732,13 @@ def save_volcano_results(
     ax_unique_down.set_ylabel(intensity_label)
     ax_unique_up.set_ylabel(intensity_label)
     fig.legend(bbox_to_anchor=(1.02, 0.5), loc="center left", frameon=False)
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
 
     # save intermediate results
     path, plot_name = get_path_and_name_from_kwargs(name="volcano_{g1}_{g2}_no_annotation_{p}", g1=g1, g2=g2,
                                                          p=col_mapping[col].replace(' ', '_'), **kwargs)
-    save_plot_func(fig, path, plot_name, save_volcano_results, **kwargs)
+    # the labels are added to the same figure afterwards
+    save_plot_func(fig, path, plot_name, save_volcano_results, in_background=False, **kwargs)
 
     # add text labels to the most significantly regulated genes
     significant_upregulated = volcano_data[
@@ -366,10 +748,21 @@ def save_volcano_results(
         (volcano_data["logFC"] < -np.log2(fchange_threshold)) & (volcano_data[col] < 0.05)
     ].sort_values(by=[col], ascending=True).head(n_labelled_proteins)
     significant = pd.concat([significant_upregulated, significant_downregulated])
+    if label_placement not in ("adjust_text", "grid", None):
+        raise ValueError(f"Invalid label placement: {label_placement}")
     texts = []
     for log_fold_change, p_val, gene_name in zip(significant["logFC"], significant[col], significant.index):
-        texts.append(ax.text(log_fold_change, -np.log10(p_val), gene_name, ha="center", va="center", fontsize=8))
-    adjust_text(texts, arrowprops=dict(width=0.15, headwidth=0, color='gray', alpha=0.6), ax=ax)
+        if label_placement == "grid":
+            # the arrow is only kept if the label is moved away from its point
+            texts.append(ax.annotate(gene_name, (log_fold_change, -np.log10(p_val)), ha="center", va="center",
+                                     fontsize=8, arrowprops=dict(arrowstyle="-", color='gray', alpha=0.6, lw=0.5)))
+        else:
+            texts.append(ax.text(log_fold_change, -np.log10(p_val), gene_name, ha="center", va="center", fontsize=8))
+    with text_layout_lock:
+        if label_placement == "adjust_text":
+            adjust_text(texts, arrowprops=dict(width=0.15, headwidth=0, color='gray', alpha=0.6), ax=ax)
+        elif label_placement == "grid":
+            place_labels_on_grid(ax, texts, np.column_stack([volcano_data["logFC"], -np.log10(volcano_data[col])]))
 
     # save the final result
     path, plot_name = get_path_and_name_from_kwargs(name="volcano_{g1}_{g2}_annotation_{p}", g1=g1, g2=g2,
@@ -383,7 +776,7 @@ def save_volcano_results(
 def save_pca_results(
         pca_data: pd.DataFrame, pca_fit: PCA = None, normalize: bool = True, intensity_label: str = "Intensity",
         color_map: Optional[dict] = None, show_suptitle: bool = True, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+) -> Tuple[Figure, Axes]:
     """
     Saves image containing the pca results
 
@@ -404,7 +797,6 @@ def save_pca_results(
 
 
     """
-    plt.close("all")
     n_components = pca_data.shape[0]
     singular_values = np.ones(n_components)
     base_color_map = {value: f"C{i}" for i, value in enumerate(pca_data.columns.get_level_values(0).unique())}
@@ -414,7 +806,7 @@ def save_pca_results(
         warnings.warn("Normalizing not possible when pca_fit is None")
     elif normalize and pca_fit is not None:
         singular_values = pca_fit.singular_values_
-    fig, axarr = plt.subplots(n_components, n_components, figsize=(14, 14))
+    fig, axarr = subplots(n_components, n_components, figsize=(14, 14))
     for row in range(n_components):
         row_pc = row + 1
         for col in range(n_components):
@@ -432,7 +824,7 @@ def save_pca_results(
         fig.suptitle(intensity_label, fontsize="xx-large")
     legend_elements = get_legend_elements(labels=pca_data.columns.get_level_values(0).unique(), color_map=base_color_map)
     fig.legend(handles=legend_elements, bbox_to_anchor=(1.02, 0.5), loc="center left", frameon=False, fontsize=20)
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, axarr
 
 
@@ -441,7 +833,7 @@ def save_pca_results(
 def save_pathway_analysis_results(
         protein_intensities: pd.DataFrame, significances: pd.DataFrame = None, pathway: str = "",
         show_suptitle: bool = False, threshold: float = 0.05, intensity_label: str = "Intensity", **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+) -> Tuple[Figure, Axes]:
     f"""
     
     Parameters
@@ -459,10 +851,9 @@ def save_pathway_analysis_results(
     -------
 
     """
-    plt.close("all")
     level_keys = list(protein_intensities.columns.get_level_values(0).unique())
     n_rows, n_cols = get_number_rows_cols_for_fig(protein_intensities.index)
-    fig, axarr = plt.subplots(n_rows, n_cols, figsize=(n_cols * 4, int(n_rows * len(level_keys) / 1.5)))
+    fig, axarr = subplots(n_rows, n_cols, figsize=(n_cols * 4, int(n_rows * len(level_keys) / 1.5)))
     color_map = {value: f"C{i}" for i, value in enumerate(level_keys)}
     color_map.update(kwargs.get("color_map", {}))  # TODO move to function deceleration
     if show_suptitle:
@@ -475,10 +866,11 @@ def save_pathway_analysis_results(
         ax.set_yticks([i for i in range(len(level_keys))])
         ax.set_yticklabels(level_keys)
         ax.set_xlabel(intensity_label)
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
 
     path, plot_name = get_path_and_name_from_kwargs(name="{pathway}_no_labels", pathway=pathway, **kwargs)
-    save_plot_func(fig, path, plot_name, save_pathway_analysis_results, **kwargs)
+    # the significances are added to the same figure afterwards
+    save_plot_func(fig, path, plot_name, save_pathway_analysis_results, in_background=significances is None, **kwargs)
 
     if significances is not None:
         for protein, (pos, ax) in zip(protein_intensities.index, np.ndenumerate(axarr)):
@@ -490,7 +882,7 @@ def save_pathway_analysis_results(
             for i, (index, pval) in enumerate(to_annotate.items()):
                 plot_annotate_line(ax, level_keys.index(index[0]), level_keys.index(index[1]), xmax * (1 + i * 0.015) - 0.005, pval)
 
-        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        tight_layout(fig)
 
         path, plot_name = get_path_and_name_from_kwargs(name="{pathway}", pathway=pathway, **kwargs)
         save_plot_func(fig, path, plot_name, save_pathway_analysis_results, **kwargs)
@@ -500,8 +892,8 @@ def save_pathway_analysis_results(
 @save_plot("boxplot")
 def save_boxplot_results(
         protein_intensities: pd.DataFrame, intensity_label: str = "Intensity",
-        plot: Optional[Tuple[plt.Figure, plt.Axes]] = None, vertical: bool = False, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+        plot: Optional[Tuple[Figure, Axes]] = None, vertical: bool = False, **kwargs
+) -> Tuple[Figure, Axes]:
     f"""
     Boxplot of intensities
 
@@ -521,8 +913,7 @@ def save_boxplot_results(
     """
     # TODO give colors to the different groups
     if plot is None:
-        plt.close("all")
-        fig, ax = plt.subplots(figsize=(14, 1 + len(protein_intensities.columns) // 3))
+        fig, ax = subplots(figsize=(14, 1 + len(protein_intensities.columns) // 3))
     else:
         fig, ax = plot
     # indicate overall median with a line
@@ -542,7 +933,7 @@ def save_boxplot_results(
         ax.set_ylabel(intensity_label)
     else:
         ax.set_xlabel(intensity_label)
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
@@ -550,7 +941,7 @@ def save_boxplot_results(
 def save_relative_std_results(
         intensities: pd.DataFrame, experiment_name: str, intensity_label: str = "Intensity",
         show_suptitle: bool = False, bins=(10, 20, 30), cmap: dict = None, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+) -> Tuple[Figure, Axes]:
     f"""
     Relative standard deviations of passed intensities with color marking based on the specified bins and color map
 
@@ -578,7 +969,6 @@ def save_relative_std_results(
     """
     # TODO add percentage to absolute numbers
     # TODO see if code could be optimized
-    plt.close("all")
 
     bins = np.array(bins)
     if "Log_2" in intensity_label:
@@ -594,9 +984,10 @@ def save_relative_std_results(
     plot_colors = pd.Series([default_cm.get(x, "black") for x in inds], index=relative_std_percent.index)
     color_counts = {color: (plot_colors == color).sum() for color in plot_colors.unique()}
 
-    fig, ax = plt.subplots(1, 1, figsize=(14, 7))
-    ax.scatter(intensities.mean(axis=1), relative_std_percent, c=plot_colors, marker="o", s=(2 * 72. / fig.dpi) ** 2,
-               alpha=0.8)
+    fig, ax = subplots(1, 1, figsize=(14, 7))
+    dense_scatter(ax, intensities.mean(axis=1), relative_std_percent, get_dense_mode(len(intensities), **kwargs),
+                  xscale="linear" if "Log_2" in intensity_label else "log", c=plot_colors, marker="o",
+                  s=(2 * 72. / fig.dpi) ** 2, alpha=0.8)
     if show_suptitle:
         fig.suptitle(experiment_name)
     ax.set_xlabel(f"Mean {intensity_label}")
@@ -610,14 +1001,14 @@ def save_relative_std_results(
         ax.axhline(bin_, color=default_cm[i])
         ax.text(xmin, bin_, cumulative_count)
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
 @save_plot("detected_counts")
 def save_detection_counts_results(
         counts: pd.DataFrame, intensity_label: str = "Intensity", show_suptitle: bool = True, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+) -> Tuple[Figure, Axes]:
     f"""
 
     Parameters
@@ -636,10 +1027,9 @@ def save_detection_counts_results(
     figure and axis of the plot
 
     """
-    plt.close("all")
 
     n_rows_experiment, n_cols_experiment = get_number_rows_cols_for_fig(counts.columns)
-    fig, axarr = plt.subplots(n_rows_experiment, n_cols_experiment, squeeze=True,
+    fig, axarr = subplots(n_rows_experiment, n_cols_experiment, squeeze=True,
                               figsize=(5 * n_cols_experiment, 3 * n_rows_experiment))
     if show_suptitle:
         fig.suptitle(f"Detection counts from {intensity_label}")
@@ -658,16 +1048,16 @@ def save_detection_counts_results(
         ax.set_yticklabels([f"detected in {i} replicates" for i in col_data.index])
         ax.set_xlabel("Counts")
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, axarr
 
 
 @save_plot("kde")
 def save_kde_results(
         intensities: pd.DataFrame, quantile_range: Optional[np.array] = None, n_points: int = 1000,
-        cmap: Union[str, colors.Colormap] = "viridis", plot: Optional[Tuple[plt.Figure, plt.Axes]] = None,
-        intensity_label: str = "Intensity", **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+        cmap: Union[str, colors.Colormap] = "viridis", plot: Optional[Tuple[Figure, Axes]] = None,
+        intensity_label: str = "Intensity", bw_method: Union[str, float] = "scott", **kwargs
+) -> Tuple[Figure, Axes]:
     f"""
     
     Parameters
@@ -675,9 +1065,12 @@ def save_kde_results(
     intensities
     quantile_range
     n_points
+        number of points of the grid on which the densities of all columns are estimated
     cmap
     plot
     intensity_label
+    bw_method
+        bandwidth of the gaussian kernels, "scott", "silverman" or a factor of the standard deviation
     kwargs
         {_get_path_and_name_kwargs_doc}
 
@@ -688,18 +1081,19 @@ def save_kde_results(
     if plot is not None:
         fig, ax = plot
     else:
-        plt.close("all")
-        fig, ax = plt.subplots(1, 1)
+        fig, ax = subplots(1, 1)
 
     if quantile_range is None:
         quantile_range = np.arange(0.05, 1, 0.05)
 
-    for col in intensities.columns:
+    # the densities of all columns are estimated at once on one grid, each column is drawn within its own range
+    col_min, col_max = intensities.min() * 0.9, intensities.max() * 1.1
+    grid = np.linspace(col_min.min(), col_max.max(), n_points)
+    densities = binned_kde(intensities.values, grid, bw_method=bw_method)
+    for i, col in enumerate(intensities.columns):
         intensity_quantiles = intensities.loc[:, col].quantile(quantile_range)
-        kde_fit = gaussian_kde(intensities.loc[~pd.isna(intensities.loc[:, col]), col])
-
-        x = np.linspace(intensities.loc[:, col].min() * 0.9, intensities.loc[:, col].max() * 1.1, n_points)
-        y = kde_fit.evaluate(x)
+        in_range = (grid >= col_min[col]) & (grid <= col_max[col])
+        x, y = grid[in_range], densities[in_range, i]
         # Create a set of line segments so that we can color them individually
         # This creates the points as a N x 1 x 2 array so that we can stack points
         # together easily to get the segments. The segments array for line collection
@@ -720,16 +1114,16 @@ def save_kde_results(
 
     ax.autoscale_view()
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
 @save_plot("n_proteins_vs_quantile")
 def save_n_proteins_vs_quantile_results(
         quantiles: pd.DataFrame, n_proteins: pd.Series, nstd: int = 1, cmap: Union[str, colors.Colormap] = "viridis",
-        plot: Optional[Tuple[plt.Figure, plt.Axes]] = None, cbar_ax: Optional[plt.Axes] = None,
+        plot: Optional[Tuple[Figure, Axes]] = None, cbar_ax: Optional[Axes] = None,
         intensity_label: str = "Intensity", fill_between: bool = False, **kwargs
-) -> Tuple[plt.Figure, Tuple[plt.Axes, plt.Axes]]:
+) -> Tuple[Figure, Tuple[Axes, Axes]]:
     f"""
     
     Parameters
@@ -752,8 +1146,7 @@ def save_n_proteins_vs_quantile_results(
     if plot is not None:
         fig, ax = plot
     else:
-        plt.close("all")
-        fig, ax = plt.subplots(1, 1, figsize=(14, 7))
+        fig, ax = subplots(1, 1, figsize=(14, 7))
 
     if not isinstance(cmap, colors.Colormap):
         cmap = cm.get_cmap(cmap)
@@ -782,7 +1175,7 @@ def save_n_proteins_vs_quantile_results(
     ax.set_ylabel("# detected proteins")
     ax.set_xlabel(intensity_label)
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, (ax, cbar_ax)
 
 
@@ -790,7 +1183,7 @@ def save_n_proteins_vs_quantile_results(
 def save_normalization_overview_results(
         quantiles, n_proteins, intensities, protein_intensities,
         height: int = 15, intensity_label: str = "Intensity", **kwargs
-) -> Tuple[plt.Figure, Tuple[plt.Axes, plt.Axes, plt.Axes, plt.Axes]]:
+) -> Tuple[Figure, Tuple[Axes, Axes, Axes, Axes]]:
     f"""
     
     Parameters
@@ -808,7 +1201,7 @@ def save_normalization_overview_results(
     -------
 
     """
-    fig = plt.figure(figsize=(18, 18), constrained_layout=True)
+    fig = new_figure(figsize=(18, 18), constrained_layout=True)
     gs = fig.add_gridspec(height, 2)
     ax_density = fig.add_subplot(gs[0:height // 2, 0])
     ax_nprot = fig.add_subplot(gs[height // 2:height - 1, 0])
@@ -829,17 +1222,17 @@ def save_normalization_overview_results(
         save_boxplot_results(boxplot_data, plot=(fig, ax_boxplot), vertical=False, **plot_kwargs)
     ax_density.set_xlim(ax_nprot.get_xlim())
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, (ax_nprot, ax_density, ax_colorbar, ax_boxplot)
 
 
 @save_plot("intensities_heatmap")
 def save_intensities_heatmap_result(
         intensities: pd.DataFrame, cmap: Union[str, colors.Colormap] = "autumn_r", cmap_bad="dimgray",
-        cax: plt.Axes = None, plot: Optional[Tuple[plt.Figure, plt.Axes]] = None, vmax: Optional[float] = None,
+        cax: Axes = None, plot: Optional[Tuple[Figure, Axes]] = None, vmax: Optional[float] = None,
         vmin: Optional[float] = None,
-        intensity_label: str = "Intensity", show_suptitle: bool = True, **kwargs
-) -> Tuple[plt.Figure, Tuple[plt.Axes, plt.Axes]]:
+        intensity_label: str = "Intensity", show_suptitle: bool = True, max_rows: int = 2000, **kwargs
+) -> Tuple[Figure, Tuple[Axes, Axes]]:
     f"""
     
     Parameters
@@ -853,6 +1246,8 @@ def save_intensities_heatmap_result(
     vmin
     intensity_label
     show_suptitle
+    max_rows
+        if the heatmap is dense according to get_dense_mode, blocks of proteins are averaged to at most max_rows
     kwargs
         {_get_path_and_name_kwargs_doc}
 
@@ -863,15 +1258,19 @@ def save_intensities_heatmap_result(
     if plot is not None:
         fig, ax = plot
     else:
-        plt.close("all")
-        fig, ax = plt.subplots(figsize=(14, 16))  # TODO scale with intensities.shape
+        fig, ax = subplots(figsize=(14, 16))  # TODO scale with intensities.shape
 
     if not isinstance(cmap, colors.Colormap):
         cmap = cm.get_cmap(cmap)
     if cmap_bad is not None:
         cmap.set_bad(color='dimgray')
 
-    im = ax.imshow(intensities.values.T, aspect="auto", cmap=cmap, vmin=vmin, vmax=vmax)
+    values = intensities.values
+    if get_dense_mode(intensities.size, **kwargs) is not None:
+        values = bin_rows(intensities, max_rows)
+    # the extent keeps the protein positions on the axis if the rows are binned
+    extent = (-0.5, len(intensities) - 0.5, len(intensities.columns) - 0.5, -0.5)
+    im = ax.imshow(values.T, aspect="auto", cmap=cmap, vmin=vmin, vmax=vmax, extent=extent)
     if cax is None:
         cbar = ax.figure.colorbar(im, ax=ax)
     else:
@@ -886,7 +1285,7 @@ def save_intensities_heatmap_result(
     ax.set_yticklabels(intensities.columns)
     ax.set_ylim(*y_lim)
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, (ax, cbar.ax)
 
 
@@ -894,10 +1293,9 @@ def save_intensities_heatmap_result(
 def save_number_of_detected_proteins_results(
         all_heights: Dict[str, pd.Series], intensity_label: str = "Intensity", show_suptitle: bool = True, **kwargs
 ):
-    plt.close("all")
     # determine number of rows and columns in the plot based on the number of experiments
     n_rows_experiment, n_cols_experiment = get_number_rows_cols_for_fig(all_heights.keys())
-    fig, axarr = plt.subplots(n_rows_experiment, n_cols_experiment,
+    fig, axarr = subplots(n_rows_experiment, n_cols_experiment,
                               figsize=(5 * n_cols_experiment, 3 * n_rows_experiment))
     if show_suptitle:
         fig.suptitle(f"Number of detected proteins from {intensity_label}")
@@ -916,7 +1314,7 @@ def save_number_of_detected_proteins_results(
         ax.set_yticks([i for i in range(len(experiment_heights.index))])
         ax.set_yticklabels(experiment_heights.index)
         ax.set_xlabel("Counts")
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, axarr
 
 
@@ -924,14 +1322,13 @@ def save_number_of_detected_proteins_results(
 def save_intensity_histogram_results(
         hist_data: pd.DataFrame, intensity_label: str = "Intensity", show_suptitle: bool = False,
         compare_to_remaining: bool = False, n_bins: int = 25, histtype="bar", color=None,
-        plot: Optional[Tuple[plt.Figure, plt.Axes]] = None, **kwargs
+        plot: Optional[Tuple[Figure, Axes]] = None, **kwargs
 ):
     if plot is not None:
         fig, axarr = plot
     else:
-        plt.close("all")
         n_rows, n_cols = get_number_rows_cols_for_fig(hist_data.columns.get_level_values(0).unique())
-        fig, axarr = plt.subplots(n_rows, n_cols, figsize=(5 * n_cols, 5 * n_rows))
+        fig, axarr = subplots(n_rows, n_cols, figsize=(5 * n_cols, 5 * n_rows))
 
     if show_suptitle:
         fig.suptitle(f"{intensity_label} histograms")
@@ -961,39 +1358,68 @@ def save_intensity_histogram_results(
         ax.set_xlabel(intensity_label)
         ax.set_ylabel("Counts")
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, axarr
 
 
 @save_plot("scatter_{full_name}")
 def save_scatter_replicates_results(
-        scatter_data: pd.DataFrame, intensity_label: str = "Intensity", show_suptitle: bool = False, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
-    plt.close("all")
-    fig, ax = plt.subplots(1, 1, figsize=(7, 7))
+        scatter_data: pd.DataFrame, correlations: Optional[pd.DataFrame] = None, intensity_label: str = "Intensity",
+        show_suptitle: bool = False, **kwargs
+) -> Tuple[Figure, Axes]:
+    """
+    Scatter plot of all pairs of replicates
+
+    Parameters
+    ----------
+    scatter_data
+        intensities of the replicates
+    correlations
+        pearson correlations of the replicates. If None they are calculated for each pair
+    intensity_label
+    show_suptitle
+    kwargs
+
+    """
+    fig, ax = subplots(1, 1, figsize=(7, 7))
 
     if show_suptitle:
         fig.suptitle()
 
-    for rep1, rep2 in combinations(scatter_data.columns, 2):
+    pairs = list(combinations(scatter_data.columns, 2))
+    dense_mode = get_dense_mode(len(pairs) * len(scatter_data), **kwargs)
+    scale = "linear" if "Log_2" in intensity_label else "log"
+    dense_x, dense_y = [], []
+    for rep1, rep2 in pairs:
         x1 = scatter_data.loc[:, rep1]
         x2 = scatter_data.loc[:, rep2]
         corr_mask = np.logical_and(x1.notna(), x2.notna())
         plot_mask = np.logical_or(x1.notna(), x2.notna())
         exp = r"$r^{2}$"
-        ax.scatter(x1.fillna(x2.min() * 0.95)[plot_mask], x2.fillna(x2.min() * 0.95)[plot_mask],
-                   label=f"{rep1} vs {rep2}, "
-                         fr"{exp}: {stats.pearsonr(x1[corr_mask], x2[corr_mask])[0] ** 2:.4f}",
-                   alpha=0.5, marker=".")
+        if correlations is not None:
+            r = correlations.loc[rep1, rep2]
+        else:
+            r = stats.pearsonr(x1[corr_mask], x2[corr_mask])[0]
+        label = f"{rep1} vs {rep2}, {exp}: {r ** 2:.4f}"
+        x, y = x1.fillna(x2.min() * 0.95)[plot_mask], x2.fillna(x2.min() * 0.95)[plot_mask]
+        if dense_mode == "hexbin":
+            # the density of all pairs is drawn at once, the pairs are only shown in the legend
+            dense_x.append(x)
+            dense_y.append(y)
+            ax.scatter([], [], label=label, marker=".")
+        else:
+            dense_scatter(ax, x, y, dense_mode, label=label, alpha=0.5, marker=".")
         ax.set_xlabel(intensity_label)
         ax.set_ylabel(intensity_label)
+    if dense_x:
+        dense_scatter(ax, np.concatenate(dense_x), np.concatenate(dense_y), dense_mode, xscale=scale, yscale=scale)
 
     fig.legend(frameon=False)
     if "Log_2" not in intensity_label:
         ax.set_xscale("log")
         ax.set_yscale("log")
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
@@ -1001,8 +1427,7 @@ def save_scatter_replicates_results(
 def save_rank_results(
         rank_data: pd.Series, interesting_proteins, intensity_label: str = "Intensity", full_name="Experiment",
         show_suptitle: bool = False, **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
-    plt.close("all")
+) -> Tuple[Figure, Axes]:
     if interesting_proteins.values():
         all_pathway_proteins = set.union(*(set(x) for x in interesting_proteins.values()))
     else:
@@ -1023,8 +1448,11 @@ def save_rank_results(
     x = [dic[protein][0] for protein in non_pathway_proteins]
     y = [dic[protein][1] for protein in non_pathway_proteins]
 
-    fig, ax = plt.subplots(1, 1, figsize=(14, 7))
-    ax.scatter(x, y, c=f"darkgray", s=10, alpha=0.3, marker=".", label="no pathway")
+    fig, ax = subplots(1, 1, figsize=(14, 7))
+    # the pathway proteins are always drawn as vector elements
+    dense_scatter(ax, x, y, get_dense_mode(len(rank_data), **kwargs),
+                  yscale="linear" if "Log_2" in intensity_label else "log", c=f"darkgray", s=10, alpha=0.3,
+                  marker=".", label="no pathway")
     # plot all proteins of a specific pathway
     for i, (pathway, proteins) in enumerate(interesting_proteins.items()):
         proteins = set(proteins) & found_proteins
@@ -1054,7 +1482,7 @@ def save_rank_results(
     ax.set_ylabel(f"{full_name} mean")
 
     fig.legend(bbox_to_anchor=(1.02, 0.5), loc="center left")
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
@@ -1063,20 +1491,22 @@ def save_experiment_comparison_results(
         protein_intensities_sample1: pd.Series, protein_intensities_sample2: pd.Series,
         exclusive_sample1: pd.Series, exclusive_sample2: pd.Series, sample1: str, sample2: str,
         intensity_label: str = "Intensity", show_suptitle: bool = False,
-        plot: Optional[Tuple[plt.Figure, plt.Axes]] = None,  **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
-    # calculate r
-    try:
-        r = stats.pearsonr(protein_intensities_sample1, protein_intensities_sample2)
-    except ValueError:
-        warnings.warn(f"Could not calculate pearson r for {sample1} vs {sample2}")
-        r = (np.nan,)
+        plot: Optional[Tuple[Figure, Axes]] = None, correlation: Optional[float] = None, **kwargs
+) -> Tuple[Figure, Axes]:
+    # calculate r if it was not passed
+    if correlation is not None:
+        r = (correlation,)
+    else:
+        try:
+            r = stats.pearsonr(protein_intensities_sample1, protein_intensities_sample2)
+        except ValueError:
+            warnings.warn(f"Could not calculate pearson r for {sample1} vs {sample2}")
+            r = (np.nan,)
 
     if plot is not None:
         fig, ax = plot
     else:
-        plt.close("all")
-        fig, ax = plt.subplots(1, 1, figsize=(7, 7))
+        fig, ax = subplots(1, 1, figsize=(7, 7))
 
     exp = r"$r^{2}$"
     ax.scatter(protein_intensities_sample1, protein_intensities_sample2, s=8, alpha=0.6, marker=".",
@@ -1098,18 +1528,131 @@ def save_experiment_comparison_results(
     ax.set_xlim(min(xmin, ymin), max(xmax, ymax))
     ax.set_ylim(min(xmin, ymin), max(xmax, ymax))
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
+    return fig, ax
+
+
+@save_plot("experiment_comparison_matrix")
+@save_csvs({"shared": "experiment_comparison_shared", "exclusive": "experiment_comparison_exclusive",
+            "pearson": "experiment_comparison_pearson", "spearman": "experiment_comparison_spearman"})
+def save_experiment_comparison_matrix_results(
+        shared: pd.DataFrame, exclusive: pd.DataFrame, pearson: pd.DataFrame, spearman: pd.DataFrame,
+        intensity_label: str = "Intensity", show_suptitle: bool = True, max_annotated_groups: int = 20, **kwargs
+) -> Tuple[Figure, np.ndarray]:
+    f"""
+    Heatmaps comparing all groups of a level
+
+    Parameters
+    ----------
+    shared
+        number of proteins detected in both groups
+    exclusive
+        number of proteins detected in the row group and missing in the column group
+    pearson
+        pearson correlation of the mean intensities of the shared proteins
+    spearman
+        spearman correlation of the mean intensities of the shared proteins
+    intensity_label
+    show_suptitle
+    max_annotated_groups
+        the values are written into the cells if there are at most this many groups
+    kwargs
+        {_get_path_and_name_kwargs_doc}
+
+    Returns
+    -------
+    the figure and the axes of the four heatmaps
+
+    """
+    n_groups = shared.shape[0]
+    size = max(7, 0.4 * n_groups)
+    fig, axarr = subplots(2, 2, figsize=(2 * size + 4, 2 * size))
+    if show_suptitle:
+        fig.suptitle(f"Comparison of all groups, {intensity_label}")
+    matrices = (
+        (shared, "Shared proteins", "Blues", None, None),
+        (exclusive, "Exclusive proteins of row vs column", "Oranges", None, None),
+        (pearson, "Pearson r", "RdBu_r", -1, 1),
+        (spearman, "Spearman r", "RdBu_r", -1, 1),
+    )
+    for ax, (matrix, title, cmap, vmin, vmax) in zip(axarr.flat, matrices):
+        im = ax.imshow(matrix.values.astype(float), cmap=cmap, vmin=vmin, vmax=vmax)
+        fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+        ax.set_title(title)
+        ax.set_xticks(np.arange(n_groups))
+        ax.set_yticks(np.arange(n_groups))
+        ax.set_xticklabels(matrix.columns, rotation=90)
+        ax.set_yticklabels(matrix.index)
+        if n_groups <= max_annotated_groups:
+            is_int = np.issubdtype(matrix.values.dtype, np.integer)
+            for (i, j), value in np.ndenumerate(matrix.values):
+                text = f"{value}" if is_int else f"{value:.2f}"
+                ax.text(j, i, text, ha="center", va="center", fontsize=8)
+    tight_layout(fig)
+    return fig, axarr
+
+
+@save_plot("correlation_heatmap")
+@save_csvs({"correlation": "sample_correlations"})
+def save_correlation_heatmap_results(
+        correlation: pd.DataFrame, intensity_label: str = "Intensity", show_suptitle: bool = True,
+        cmap: Union[str, colors.Colormap] = "viridis", vmin: Optional[float] = None, vmax: Optional[float] = 1,
+        method: str = "pearson", **kwargs
+) -> Tuple[Figure, Axes]:
+    f"""
+    Heatmap of the correlations of all samples. Lines separate the groups.
+
+    Parameters
+    ----------
+    correlation
+        correlations with the groups and samples as index and columns
+    intensity_label
+    show_suptitle
+    cmap
+    vmin
+    vmax
+    method
+        name of the correlation shown in the colorbar
+    kwargs
+        {_get_path_and_name_kwargs_doc}
+
+    Returns
+    -------
+    the figure and the axes of the heatmap
+
+    """
+    n_samples = correlation.shape[0]
+    size = min(max(7, 0.2 * n_samples), 40)
+    fig, ax = subplots(1, 1, figsize=(size + 2, size))
+    if show_suptitle:
+        fig.suptitle(f"Sample correlations, {intensity_label}")
+    im = ax.imshow(correlation.values, cmap=cmap, vmin=vmin, vmax=vmax, interpolation="nearest")
+    cbar = fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+    cbar.set_label(f"{method.capitalize()} r")
+    groups = correlation.index.get_level_values(0)
+    # separate the groups and label them at their center
+    boundaries = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    for boundary in boundaries:
+        ax.axhline(boundary - 0.5, color="white", linewidth=0.5)
+        ax.axvline(boundary - 0.5, color="white", linewidth=0.5)
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [n_samples]])
+    centers = (starts + stops - 1) / 2
+    ax.set_xticks(centers)
+    ax.set_yticks(centers)
+    ax.set_xticklabels(groups[starts], rotation=90)
+    ax.set_yticklabels(groups[starts])
+    tight_layout(fig)
     return fig, ax
 
 
 @save_plot("go_analysis")
 def save_go_analysis_results(
         heights, test_results, go_analysis_gene_names, intensity_label="Intensity", **kwargs
-) -> Tuple[plt.Figure, plt.Axes]:
+) -> Tuple[Figure, Axes]:
     # TODO also create table
     # TODO move labels to bars, remove legend
-    plt.close("all")
-    fig, ax = plt.subplots(1, 1, figsize=(7, int(len(heights) * len(go_analysis_gene_names) / 3)))
+    fig, ax = subplots(1, 1, figsize=(7, int(len(heights) * len(go_analysis_gene_names) / 3)))
 
     bar_width = 0.25
     for i, experiment in enumerate(heights):
@@ -1128,17 +1671,17 @@ def save_go_analysis_results(
                    for x in range(len(go_analysis_gene_names))])
     # replace the y ticks with the compartiment names
     ax.set_yticklabels([x for x in go_analysis_gene_names])
-    plt.legend()
+    ax.legend()
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, ax
 
 
 @save_plot("pathway_timecourse_{pathway}")
 def save_pathway_timecourse_results():
-    """plt.close("all")
+    """
     n_rows, n_cols = get_number_rows_cols_for_fig(found_proteins)
-    fig, axarr = plt.subplots(n_rows, n_cols, figsize=(n_cols * int(max_time / 5), 4 * n_rows))
+    fig, axarr = subplots(n_rows, n_cols, figsize=(n_cols * int(max_time / 5), 4 * n_rows))
     if show_suptitle:
         fig.suptitle(pathway)
 
@@ -1161,34 +1704,41 @@ def save_pathway_timecourse_results():
         ax.set_xlim(left=0, right=max_time + 1)
     handles, labels = next(np.ndenumerate(axarr))[1].get_legend_handles_labels()
     fig.legend(handles, labels, bbox_to_anchor=(1.04, 0.5), loc="center left")
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
 
     return fig, axarr"""
 
 
 @save_plot("venn_bar_{ex}")
-@save_venn_to_txt({"named_sets": "set_bar"})
+@save_venn_to_txt({"named_sets": "set_bar_{ex}"})
 def save_bar_venn(
-        named_sets: Dict[str, set], ex: str, show_suptitle: bool = True, **kwargs
-) -> Optional[Tuple[plt.Figure, Tuple[plt.Axes, plt.Axes]]]:
-    plt.close("all")
-    if len(named_sets) > 6:
-        warnings.warn(f"Skipping bar-venn for {ex} because it has more than 6 experiments")
-        return
-
+        named_sets: Dict[str, set], ex: str, show_suptitle: bool = True, max_intersections: int = 30, **kwargs
+) -> Optional[Tuple[Figure, Tuple[Axes, Axes]]]:
     # create a mapping from name to a y coordinate
     y_mappings = {name: i for i, name in enumerate(named_sets)}
     # get all the heights and other info required for the plot
+    if len(named_sets) > 6:
+        # with many sets only the largest non-empty intersections are shown as UpSet plot
+        intersections = sorted(venn_names(named_sets, only_nonempty=True), key=lambda x: len(x[2]), reverse=True)
+        if len(intersections) > max_intersections:
+            warnings.warn(f"Showing only the {max_intersections} largest of {len(intersections)} intersections for {ex}")
+        intersections = intersections[:max_intersections]
+    else:
+        intersections = list(venn_names(named_sets))
+    if not intersections:
+        warnings.warn(f"Skipping bar-venn for {ex} because all sets are empty")
+        return
     heights = []
     x = []
     ys = []
-    for i, (intersected, unioned, result) in enumerate(venn_names(named_sets)):
+    for i, (intersected, unioned, result) in enumerate(intersections):
         heights.append(len(result))
         x.append(i)
         ys.append([y_mappings[x] for x in intersected])
 
     # initial figure setup
-    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True, figsize=(1 * len(heights), 7))
+    fig, (ax1, ax2) = subplots(2, 1, sharex=True, figsize=(1 * len(heights), max(7, 0.5 * len(y_mappings))),
+                                   gridspec_kw={"height_ratios": [1, max(1, len(y_mappings) / 10)]})
     if show_suptitle:
         fig.suptitle(ex, fontsize=20)
     # create the bar plot
@@ -1208,20 +1758,19 @@ def save_bar_venn(
     ax2.set_ylabel("Sample name")
     ax2.set_xlabel("Number of comparison")
 
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    tight_layout(fig)
     return fig, (ax1, ax2)
 
 
 @save_plot("venn_replicate_{ex}")
-@save_venn_to_txt({"named_sets": "set"})
+@save_venn_to_txt({"named_sets": "set_{ex}"})
 def save_venn(
         named_sets: Dict[str, set], ex: str, show_suptitle: bool = True,
         title_font_size=20, set_label_font_size=16, subset_label_font_size=14, **kwargs
-) -> Optional[Tuple[plt.Figure, plt.Axes]]:
-    plt.close("all")
-    fig, ax = plt.subplots(1, 1, figsize=(14, 7))
+) -> Optional[Tuple[Figure, Axes]]:
+    fig, ax = subplots(1, 1, figsize=(14, 7))
     if show_suptitle:
-        plt.title(ex, fontsize=title_font_size)
+        ax.set_title(ex, fontsize=title_font_size)
 
     # create venn diagram based on size of set
     sets = named_sets.values()
@@ -1253,6 +1802,6 @@ def save_venn(
             text.set_fontsize(subset_label_font_size)
         except AttributeError:
             pass
-    plt.legend(handles, labels, bbox_to_anchor=(1.02, 0.5), loc="center left")
-    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    ax.legend(handles, labels, bbox_to_anchor=(1.02, 0.5), loc="center left")
+    tight_layout(fig)
     return fig, ax
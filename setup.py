@@ -32,6 +32,10 @@ setup(
         "scikit-learn>=0.22.1",
         "plotly>=4.6.0",
     ],
+    extras_require={
+        "numba": ["numba>=0.50"],  # optional, compiles the normalization kernels
+        "parquet": ["pyarrow>=1.0"],  # optional, saves the plot data as parquet or feather
+    },
     project_urls={
         "Documentation": "https://mspypeline.readthedocs.io/en/stable/",
         "Source": "https://github.com/siheming/mspypeline",
@@ -0,0 +1,348 @@
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def get_plotter(tmp_path, n_groups=4, n_replicates=5, n_proteins=1000, n_factors=3, nan_fraction=0.1,
+                missing_not_at_random=False):
+    from mspypeline.core.MSPPlots import BasePlotter
+    samples = [f"G{g}_{r}" for g in range(n_groups) for r in range(n_replicates)]
+    design = {f"G{g}": {str(r): f"G{g}_{r}" for r in range(n_replicates)} for g in range(n_groups)}
+    # log2 intensities with a low rank structure
+    log2_values = 25 + np.random.normal(0, 1, (n_proteins, n_factors)) @ np.random.normal(0, 1, (n_factors, len(samples)))
+    log2_values += np.random.normal(0, 0.3, log2_values.shape)
+    values = 2 ** log2_values
+    if missing_not_at_random:
+        # low intensities are missing more often, up to twice the nan_fraction
+        nan_fraction = 2 * nan_fraction * (1 - log2_values.argsort(axis=0).argsort(axis=0) / n_proteins)
+    values[np.random.random(values.shape) < nan_fraction] = 0
+    df = pd.DataFrame(values, index=[f"P{i}" for i in range(n_proteins)], columns=["Intensity " + s for s in samples])
+    plotter = BasePlotter(str(tmp_path), {}, configs={"analysis_design": design}, loglevel=logging.WARNING)
+    plotter.add_intensity_column("raw", "Intensity ", "Intensity", df=df)
+    return plotter
+
+
+def test_pca_solvers(tmp_path, monkeypatch):
+    from sklearn.decomposition import PCA
+    from mspypeline.modules import DataTree
+    plotter = get_plotter(tmp_path)
+    data = plotter.all_tree_dict["raw_log2"].groupby(0, method=None)
+    # the samples are read from the tree in blocks, the matrix of all samples is never created
+    monkeypatch.setattr(DataTree, "groupby", None)
+    data_norm = data.subtract(data.mean(axis=1), axis=0).divide(data.std(axis=1), axis=0).fillna(0)
+    reference = PCA(n_components=4, svd_solver="full").fit(data_norm.T)
+    reference_transformed = reference.transform(data_norm.T)
+    for solver in ("exact", "randomized", "incremental"):
+        result = plotter.get_pca_data("raw_log2", 0, solver=solver, batch_size=6)
+        assert result["pca_data"].shape == (4, 20)
+        assert result["pca_data"].columns.equals(data.columns)
+        # the structured components agree up to the sign
+        for component in range(3):
+            r = np.corrcoef(result["pca_data"].values[component], reference_transformed[:, component])[0, 1]
+            assert abs(r) > 0.99
+        if solver == "exact":
+            np.testing.assert_allclose(result["pca_data"].values.T, reference_transformed, atol=1e-8)
+    with pytest.raises(ValueError):
+        plotter.get_pca_data("raw_log2", 0, solver="unknown")
+
+
+@pytest.mark.slow
+def test_pca_benchmark(tmp_path):
+    # many samples: the randomized solver wins for a small number of components, the incremental solver trades time
+    # for standardizing only one block of samples at a time
+    plotter = get_plotter(tmp_path, n_groups=20, n_replicates=50, n_proteins=10000, n_factors=5)
+    timings = {}
+    for solver in ("exact", "randomized", "incremental"):
+        start = time.perf_counter()
+        plotter.get_pca_data("raw_log2", 0, solver=solver, batch_size=200)
+        timings[solver] = time.perf_counter() - start
+    assert timings["randomized"] < timings["exact"]
+
+
+def test_sample_correlation(tmp_path):
+    plotter = get_plotter(tmp_path, nan_fraction=0.3)
+    expected = plotter.all_tree_dict["raw_log2"].aggregate(None, method=None).corr(min_periods=2)
+    correlation = plotter.get_sample_correlation_data("raw_log2")["correlation"]
+    pd.testing.assert_frame_equal(correlation, expected, check_names=False, atol=1e-9)
+    group = plotter.get_sample_correlation_data("raw_log2", full_name="G1")["correlation"]
+    pd.testing.assert_frame_equal(group, expected.loc[group.index, group.columns], check_names=False, atol=1e-9)
+    heatmap = plotter.get_correlation_heatmap_data("raw_log2", 0)["correlation"]
+    assert heatmap.shape == (20, 20)
+    assert list(heatmap.index.get_level_values(0).unique()) == ["G0", "G1", "G2", "G3"]
+
+
+def test_experiment_comparison_matrix(tmp_path):
+    plotter = get_plotter(tmp_path, nan_fraction=0.3, missing_not_at_random=True)
+    data = plotter.get_experiment_comparison_matrix_data("raw_log2", 0)
+    summary = plotter.get_group_summary("raw_log2", ["G0", "G1", "G2", "G3"])
+    means = summary["means"].where(summary["enough_values"])
+    for method in ("pearson", "spearman"):
+        pd.testing.assert_frame_equal(data[method], means.corr(method=method), check_names=False, atol=1e-9)
+    enough_values = summary["enough_values"].astype(int)
+    pd.testing.assert_frame_equal(data["shared"], enough_values.T @ enough_values, check_names=False)
+
+
+def test_pathway_statistics(tmp_path):
+    plotter = get_plotter(tmp_path)
+    plotter.interesting_proteins = {"A": pd.Series(["P1", "P2", "unknown"]), "B": pd.Series(["P2", "P3"])}
+    assert plotter.pathway_proteins == {"P1", "P2", "P3", "unknown"}
+    data = plotter.get_pathway_analysis_data("raw_log2", 0, "B")
+    assert list(data["significances"].index) == ["P2", "P3"]
+    assert plotter.get_pathway_statistics("raw_log2", 0) is plotter.get_pathway_statistics("raw_log2", 0)
+    assert list(plotter.pathway_statistics) == [("raw_log2", 0, True)]
+    # new pathways reset the statistics
+    plotter.interesting_proteins = {"C": pd.Series(["P4"])}
+    assert plotter.pathway_statistics == {}
+    assert list(plotter.get_pathway_analysis_data("raw_log2", 0, "C")["significances"].index) == ["P4"]
+
+
+def test_create_results_workers(tmp_path):
+    files = {}
+    for n_workers, worker_type in ((1, "process"), (2, "process"), (2, "thread")):
+        result_dir = tmp_path / f"{n_workers}_{worker_type}"
+        plotter = get_plotter(result_dir, n_groups=3, n_replicates=3, n_proteins=200)
+        for plot_name in ("plot_scatter_replicates", "plot_rank", "plot_correlation_heatmap"):
+            plotter.configs[plot_name + "_settings"] = {"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}
+        plotter.create_results(n_workers=n_workers, worker_type=worker_type)
+        assert plotter.executor is None
+        files[n_workers, worker_type] = sorted(
+            os.path.relpath(os.path.join(root, file), result_dir)
+            for root, _, dir_files in os.walk(result_dir) for file in dir_files
+        )
+    assert len(files[1, "process"]) == 8
+    assert files[1, "process"] == files[2, "process"] == files[2, "thread"]
+    with pytest.raises(ValueError):
+        plotter.create_results(worker_type="unknown")
+
+
+def test_create_results_write_error(tmp_path):
+    plotter = get_plotter(tmp_path, n_groups=2, n_replicates=3, n_proteins=100)
+    # the figures can not be saved into a file
+    (tmp_path / "not_a_dir").write_text("")
+    plotter.configs["plot_rank_settings"] = {"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0],
+                                             "save_path": str(tmp_path / "not_a_dir")}
+    with pytest.raises(OSError):
+        plotter.create_results()
+    assert plotter.output_writer is None
+
+
+def test_skip_unchanged_plots(tmp_path):
+    plotter = get_plotter(tmp_path, n_groups=2, n_replicates=3, n_proteins=100)
+    plotter.configs["skip_unchanged_plots"] = True
+
+    def create_results(**rank_settings):
+        for plot_name in ("plot_rank", "plot_correlation_heatmap", "plot_scatter_replicates"):
+            plotter.configs[plot_name + "_settings"] = {"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}
+        plotter.configs["plot_rank_settings"].update(rank_settings)
+        plotter.create_results()
+        return {file: os.stat(os.path.join(plotter.file_dir_descriptive, file)).st_mtime_ns
+                for file in os.listdir(plotter.file_dir_descriptive) if not file.startswith(".")}
+
+    first = create_results()
+    assert len(first) == 6
+    # one record per plot, the heatmap record also contains the csv file
+    assert len(os.listdir(os.path.join(plotter.file_dir_descriptive, ".plot_manifest"))) == 5
+    assert create_results() == first
+    # only the plots with changed settings or missing files are created again
+    os.remove(os.path.join(plotter.file_dir_descriptive, "sample_correlations_raw_log2_level_0.csv"))
+    changed = create_results(show_suptitle=True)
+    assert {file for file in first if changed[file] != first[file]} == {
+        "rank_G0_raw_log2_level_0.pdf", "rank_G1_raw_log2_level_0.pdf", "correlation_heatmap_raw_log2_level_0.pdf",
+        "sample_correlations_raw_log2_level_0.csv"
+    }
+
+
+def test_skip_unchanged_venn(tmp_path):
+    plotter = get_plotter(tmp_path, n_groups=3, n_replicates=3, n_proteins=100)
+    plotter.configs["skip_unchanged_plots"] = True
+    plotter.configs["plot_venn_groups_settings"] = {"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}
+    plotter.create_results()
+    txt_files = sorted(file for file in os.listdir(plotter.file_dir_venn) if file.endswith(".txt"))
+    # one file per combination of the three groups for the venn diagram and the bar plot
+    assert len(txt_files) == 14
+    # a deleted txt file is written again
+    os.remove(os.path.join(plotter.file_dir_venn, txt_files[0]))
+    plotter.create_results()
+    assert sorted(file for file in os.listdir(plotter.file_dir_venn) if file.endswith(".txt")) == txt_files
+
+
+@pytest.mark.parametrize("dense_mode", ["rasterize", "hexbin"])
+def test_dense_rendering(tmp_path, dense_mode):
+    np.random.seed(0)
+    plotter = get_plotter(tmp_path, n_groups=1, n_replicates=8, n_proteins=5000)
+
+    def create_results(dense_threshold):
+        plotter.configs["plot_scatter_replicates_settings"] = {
+            "create_plot": True, "dfs_to_use": ["raw"], "levels": [0], "dense_threshold": dense_threshold,
+            "dense_mode": dense_mode
+        }
+        plotter.create_results()
+        return {file: os.path.getsize(os.path.join(plotter.file_dir_descriptive, file))
+                for file in os.listdir(plotter.file_dir_descriptive)}
+
+    # 28 pairs of replicates with 5000 points each
+    vector = create_results(None)
+    dense = create_results(50000)
+    assert len(vector) == 1
+    assert vector.keys() == dense.keys()
+    for file in vector:
+        assert dense[file] < vector[file] * 0.75
+
+
+def test_bin_rows():
+    from mspypeline.plotting_backend.matplotlib_plots import bin_rows
+    data = pd.DataFrame([[1, np.nan], [3, np.nan], [5, 2], [np.nan, np.nan], [7, 1]])
+    assert np.array_equal(bin_rows(data, 5), data.values, equal_nan=True)
+    np.testing.assert_equal(bin_rows(data, 3), [[2, np.nan], [5, 2], [7, 1]])
+    np.testing.assert_equal(bin_rows(data, 2), [[3, np.nan], [7, 1]])
+
+
+def test_create_results_data_mode(tmp_path):
+    import json
+    import subprocess
+    import sys
+    # matplotlib is already imported by other tests, so the data mode runs in a new interpreter
+    script = f"""
+import sys
+from test.core.test_BasePlotter import get_plotter
+plotter = get_plotter({str(tmp_path)!r}, n_groups=2, n_replicates=3, n_proteins=100)
+for plot_name in ("plot_rank", "plot_correlation_heatmap", "plot_venn_groups", "plot_r_volcano"):
+    plotter.configs[plot_name + "_settings"] = {{"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}}
+plotter.configs["data_format"] = "csv"
+plotter.create_results(mode="data")
+assert not any(module.startswith("matplotlib") for module in sys.modules)
+"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
+
+    with open(os.path.join(tmp_path, "data_index.json")) as f:
+        index = json.load(f)
+    assert index["data_format"] == "csv"
+    plots = index["plots"]
+    assert {"rank_raw_log2_level_0", "rank_raw_log2_level_0_1", "correlation_heatmap_raw_log2_level_0",
+            "venn_raw_log2_level_0", "volcano_raw_log2_level_0"} <= set(plots)
+    assert plots["rank_raw_log2_level_0_1"]["settings"]["full_name"] == "G1"
+    assert not any(file.endswith(".pdf") for _, _, files in os.walk(tmp_path) for file in files)
+    # samples are indexed by their group and name
+    correlation = pd.read_csv(
+        os.path.join(tmp_path, plots["correlation_heatmap_raw_log2_level_0"]["files"]["correlation"]),
+        index_col=[0, 1], header=[0, 1]
+    )
+    assert correlation.shape == (6, 6)
+    assert np.allclose(np.diag(correlation), 1)
+
+
+def test_create_results_thread_workers_first(tmp_path):
+    import subprocess
+    import sys
+    # the plotting backend is imported lazily, in a new interpreter it is first used by the thread workers
+    script = f"""
+from test.core.test_BasePlotter import get_plotter
+plotter = get_plotter({str(tmp_path)!r}, n_groups=2, n_replicates=3, n_proteins=100)
+for plot_name in ("plot_detection_counts", "plot_number_of_detected_proteins", "plot_intensity_histograms",
+                  "plot_rank", "plot_correlation_heatmap"):
+    plotter.configs[plot_name + "_settings"] = {{"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}}
+plotter.create_results(n_workers=4, worker_type="thread")
+"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
+    assert any(file.endswith(".pdf") for file in os.listdir(os.path.join(tmp_path, "descriptive")))
+
+
+def test_create_results_preview(tmp_path):
+    plotter = get_plotter(tmp_path, n_groups=2, n_replicates=3, n_proteins=100)
+    for plot_name in ("plot_rank", "plot_scatter_replicates"):
+        plotter.configs[plot_name + "_settings"] = {"create_plot": True, "dfs_to_use": ["raw_log2"], "levels": [0]}
+    plotter.create_results(preview=True)
+    preview = os.listdir(plotter.file_dir_descriptive)
+    assert len(preview) == 4 and all(file.endswith(".png") for file in preview)
+    # the preview does not change the settings
+    plotter.create_results()
+    files = set(os.listdir(plotter.file_dir_descriptive)) - set(preview)
+    assert {os.path.splitext(file)[0] for file in files} == {os.path.splitext(file)[0] for file in preview}
+    assert all(file.endswith(".pdf") for file in files)
+
+
+def test_all_normalizer_overview_streaming(tmp_path):
+    import re
+    plotter = get_plotter(tmp_path, n_groups=2, n_replicates=3, n_proteins=100)
+    plots = plotter.plot_heatmap_overview_all_normalizers("raw_log2", 0)
+    # the figures are written to the pdf while they are created and not returned
+    assert len(plots) == len(plotter.normalizers) + 1
+    assert all(plot is None for plot in plots)
+    with open(os.path.join(plotter.file_dir_descriptive, "heatmap_overview_all_normalizers.pdf"), "rb") as f:
+        assert len(re.findall(rb"/Type /Page\b(?!s)", f.read())) == len(plots)
+
+
+def test_pdf_sink(tmp_path, monkeypatch):
+    import re
+    from matplotlib.backends.backend_pdf import PdfPages
+    from mspypeline.plotting_backend import matplotlib_plots
+    data = pd.DataFrame(np.random.random((50, 4)))
+    with matplotlib_plots.PdfSink(os.path.join(tmp_path, "sink.pdf")) as sink:
+        for _ in range(3):
+            sink.add(matplotlib_plots.save_intensities_heatmap_result(data))
+    # matplotlib versions which were not checked write the images on close
+    with monkeypatch.context() as m:
+        m.setattr(matplotlib_plots, "PDF_IMAGE_FLUSH_VERSIONS", ((1, 0), (1, 0)))
+        with matplotlib_plots.PdfSink(os.path.join(tmp_path, "unflushed_sink.pdf")) as unflushed_sink:
+            assert not unflushed_sink.flush_images
+            for _ in range(3):
+                unflushed_sink.add(matplotlib_plots.save_intensities_heatmap_result(data))
+    with PdfPages(os.path.join(tmp_path, "pdf_pages.pdf")) as pdf:
+        for _ in range(3):
+            pdf.savefig(matplotlib_plots.save_intensities_heatmap_result(data)[0], dpi=200)
+
+    def get_images(file_name):
+        with open(os.path.join(tmp_path, file_name), "rb") as f:
+            content = f.read()
+        # every image is written once, although the sink writes them after each page
+        assert len(re.findall(rb"\n(\d+) 0 obj", content)) == len(set(re.findall(rb"\n(\d+) 0 obj", content)))
+        return sorted(re.findall(rb"/Subtype /Image.*?stream\n(.*?)\nendstream", content, re.S))
+
+    images = get_images("sink.pdf")
+    assert len(images) == 6
+    assert images == get_images("pdf_pages.pdf") == get_images("unflushed_sink.pdf")
+
+
+def test_place_labels_on_grid():
+    import matplotlib.pyplot as plt
+    from matplotlib.text import Text
+    from mspypeline.plotting_backend.label_placement import place_labels_on_grid
+    fig, ax = plt.subplots(figsize=(5, 5))
+    points = np.random.default_rng(0).normal(size=(2000, 2))
+    ax.scatter(points[:, 0], points[:, 1])
+    ax.set_xlim(-4, 4)
+    ax.set_ylim(-4, 4)
+    # all labels start on the same crowded spot, one label is far away from the other points
+    labels = [ax.annotate(f"label {i}", (0, 0), ha="center", va="center", arrowprops={}) for i in range(10)]
+    labels.append(ax.annotate("single", (3.5, -3.5), ha="center", va="center", arrowprops={}))
+    place_labels_on_grid(ax, labels, points)
+    renderer = fig.canvas.get_renderer()
+    boxes = [Text.get_window_extent(label, renderer) for label in labels]
+    assert not any(a.overlaps(b) for i, a in enumerate(boxes) for b in boxes[i + 1:])
+    assert all(ax.get_window_extent(renderer).contains(box.x0, box.y0) for box in boxes)
+    # the unmoved label does not need an arrow
+    assert labels[-1].xyann == pytest.approx((3.5, -3.5))
+    assert labels[-1].arrowprops is None and labels[0].arrowprops is not None
+    plt.close(fig)
+
+
+def test_volcano_label_placement():
+    from mspypeline.plotting_backend import matplotlib_plots
+    rng = np.random.default_rng(0)
+    fold_change = rng.normal(0, 1.5, 500)
+    p_val = 10 ** -(np.abs(fold_change) * rng.exponential(1.5, 500))
+    volcano_data = pd.DataFrame({"logFC": fold_change, "pval": p_val, "adjpval": p_val},
+                                index=[f"protein{i}" for i in range(500)])
+    unique = pd.Series(dtype=float)
+    for label_placement in ("adjust_text", "grid", None):
+        fig, (ax, _, _) = matplotlib_plots.save_volcano_results(
+            volcano_data, unique, unique, label_placement=label_placement
+        )
+        assert len([text for text in ax.texts if text.get_text().startswith("protein")]) == 20
+    with pytest.raises(ValueError):
+        matplotlib_plots.save_volcano_results(volcano_data, unique, unique, label_placement="repel")
@@ -16,8 +16,19 @@ def test_initializer():
     ini.update_config_file()
     ini.configs["test"] = True
     ini.update_config_file()
-    # TODO set some pathways
-    ini.init_interest_from_txt()
+    ini.configs["pathways"] = MSPInitializer.possible_pathways[:2]
+    ini.configs["go_terms"] = MSPInitializer.possible_gos[:2]
+    MSPInitializer.bundled_libraries.clear()
+    dict_pathway, dict_go = ini.init_interest_from_txt()
+    # only the requested files are read
+    assert len(MSPInitializer.bundled_libraries) == 4
+    assert ini.get_bundled_library(MSPInitializer.go_path, "unknown.txt") is None
+    for file in MSPInitializer.possible_pathways[:2]:
+        name, proteins = ini.read_config_txt_file(MSPInitializer.pathway_path, file)
+        assert sorted(dict_pathway[name]) == sorted(set(proteins) - {""})
+    for file in MSPInitializer.possible_gos[:2]:
+        name, proteins = ini.read_config_txt_file(MSPInitializer.go_path, file)
+        assert sorted(dict_go[name]) == sorted(set(proteins) - {""})
     del ini
     ini = MSPInitializer(dir_path)
     assert ini.configs["test"] is True
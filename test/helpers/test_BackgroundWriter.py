@@ -0,0 +1,34 @@
+import threading
+import pytest
+
+
+def test_background_writer():
+    from mspypeline.helpers import BackgroundWriter
+    written = []
+    release = threading.Event()
+    with BackgroundWriter(max_pending=2) as writer:
+        writer.submit(release.wait)
+        for i in range(2):
+            writer.submit(written.append, i)
+        # the queue is full until the first write is done
+        assert writer.queue.full()
+        release.set()
+        writer.flush()
+        assert written == [0, 1]
+        writer.submit(written.append, 2)
+    assert written == [0, 1, 2]
+    with pytest.raises(RuntimeError):
+        writer.submit(written.append, 3)
+
+
+def test_background_writer_errors():
+    from mspypeline.helpers import BackgroundWriter
+    writer = BackgroundWriter()
+    writer.submit(int, "not a number")
+    writer.submit(int, "1")
+    with pytest.raises(ValueError):
+        writer.flush()
+    # errors are only raised once
+    writer.flush()
+    writer.submit(int, "not a number")
+    writer.close(raise_errors=False)
@@ -0,0 +1,48 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_data_exporter(tmp_path):
+    from mspypeline.helpers import DataExporter
+    exporter = DataExporter(os.path.join(tmp_path, "data_index.json"), "csv")
+    series = pd.Series([1., 2.], index=["P1", "P2"])
+    for _ in range(2):
+        exporter.export("save_test_results", os.path.join(tmp_path, "plots"), series=series,
+                        groups={"G1": {"P1"}, "G2": series}, label="Intensity", level=np.int64(0), colors={"G1": "red"})
+    exporter.export("save_test_results", None, series=series)
+    exporter.write_index()
+    with open(os.path.join(tmp_path, "data_index.json")) as f:
+        index = json.load(f)
+    assert index["data_format"] == "csv"
+    assert list(index["plots"]) == ["test_level_0", "test_level_0_1"]
+    plot = index["plots"]["test_level_0"]
+    assert plot["function"] == "save_test_results"
+    assert plot["settings"] == {"label": "Intensity", "level": 0, "colors": {"G1": "red"}}
+    assert plot["files"] == {
+        "series": os.path.join("plots", "test_level_0_series.csv"),
+        "groups_G1": os.path.join("plots", "test_level_0_groups_G1.csv"),
+        "groups_G2": os.path.join("plots", "test_level_0_groups_G2.csv"),
+    }
+    loaded = pd.read_csv(os.path.join(tmp_path, plot["files"]["series"]), index_col=0)
+    assert loaded["series"].equals(series)
+    with pytest.raises(ValueError):
+        DataExporter(os.path.join(tmp_path, "data_index.json"), "xlsx")
+
+
+@pytest.mark.parametrize("data_format", ["parquet", "feather"])
+def test_data_exporter_columnar(tmp_path, data_format):
+    pytest.importorskip("pyarrow")
+    from mspypeline.helpers import DataExporter
+    df = pd.DataFrame({"a": [1., 2.], 0: [3., np.nan]}, index=["P1", "P2"])
+    exporter = DataExporter(os.path.join(tmp_path, "data_index.json"), data_format)
+    exporter.export("save_test_results", str(tmp_path), df=df)
+    path = os.path.join(tmp_path, exporter.index["test"]["files"]["df"])
+    if data_format == "parquet":
+        loaded = pd.read_parquet(path)
+    else:
+        loaded = pd.read_feather(path).set_index("index")
+    assert list(loaded.columns) == ["a", "0"]
+    assert np.allclose(loaded.values, df.values, equal_nan=True)
@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_get_number_rows_cols_for_fig():
     from mspypeline.helpers import get_number_rows_cols_for_fig
     assert get_number_rows_cols_for_fig([1, 1, 1, 1]) == (2, 2)
@@ -34,6 +37,17 @@ def test_plot_annotate_line():
 
 def test_venn_names():
     from mspypeline.helpers import venn_names
+    named_sets = {"a": {1, 2, 3, 4}, "b": {3, 4, 5}, "c": {4, 6}}
+    result = list(venn_names(named_sets))
+    assert [x[0] for x in result] == [("a",), ("b",), ("c",), ("a", "b"), ("a", "c"), ("b", "c"), ("a", "b", "c")]
+    assert [x[2] for x in result] == [{1, 2}, {5}, {6}, {3}, set(), set(), {4}]
+    assert result[3][1] == {"c"}
+    assert list(venn_names(named_sets, only_nonempty=True)) == [x for x in result if x[2]]
+    # many sets only return the non-empty intersections
+    named_sets = {str(i): {j for j in range(100) if (j >> (i % 6)) & 1} for i in range(40)}
+    result = list(venn_names(named_sets, only_nonempty=True))
+    assert sum(len(x[2]) for x in result) == len(set.union(*named_sets.values()))
+    assert all(all(e in named_sets[name] for name in x[0] for e in x[2]) for x in result)
 
 
 def test_install_r_dependencies():
@@ -80,3 +94,20 @@ def test_get_plot_name_suffix():
     assert get_plot_name_suffix("test") == "_test"
     assert get_plot_name_suffix(level=1) == "_level_1"
     assert get_plot_name_suffix("test", 1) == "_test_level_1"
+
+
+def test_get_fingerprint():
+    import numpy as np
+    import pandas as pd
+    from mspypeline.helpers import get_fingerprint
+    df = pd.DataFrame(np.random.random((10, 3)), columns=["a", "b", "c"])
+    kwargs = {"intensities": df, "sets": {"x": {"p1", "p2"}}, "level": 1, "name": "G1"}
+    assert get_fingerprint(kwargs) == get_fingerprint({"name": "G1", "level": 1, "sets": {"x": {"p2", "p1"}},
+                                                       "intensities": df.copy()})
+    changed = df.copy()
+    changed.iloc[3, 1] += 1e-9
+    assert get_fingerprint(df) != get_fingerprint(changed)
+    assert get_fingerprint(df) != get_fingerprint(df.rename(columns={"a": "d"}))
+    assert get_fingerprint(1) != get_fingerprint("1")
+    with pytest.raises(TypeError):
+        get_fingerprint(object())
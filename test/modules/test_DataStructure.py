@@ -68,3 +68,17 @@ def test_simple_structure():
     assert tree["Ex1"].get_total_number_children(go_max_depth=True) == 4
     assert tree["Ex1_A"].get_total_number_children(go_max_depth=True) == 2
     assert tree["Ex1_A_1"].get_total_number_children(go_max_depth=True) == 0
+
+
+def test_float32_aggregation():
+    from mspypeline import DataTree
+    import numpy as np
+    import pandas as pd
+    analysis_design = {"Ex1": {"1": "Ex1_1", "2": "Ex1_2"}, "Ex2": {"1": "Ex2_1", "2": "Ex2_2"}}
+    data = pd.DataFrame(np.random.random((10, 4)), columns=["Ex1_1", "Ex1_2", "Ex2_1", "Ex2_2"])
+    tree = DataTree.from_analysis_design(analysis_design, data.astype(np.float32), False)
+    for method in ("mean", "median", "std"):
+        result = tree.groupby(0, method=method)
+        assert (result.dtypes == np.float32).all()
+        expected = DataTree.from_analysis_design(analysis_design, data, False).groupby(0, method=method)
+        np.testing.assert_allclose(result.values, expected.values, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def write_gmt(path, n_sets=200, n_genes=500):
+    gene_sets = {}
+    with open(path, "w") as f:
+        for i in range(n_sets):
+            genes = [f"GENE{g}" for g in np.random.choice(n_genes, np.random.randint(1, 50))]
+            gene_sets[f"SET_{i}"] = set(genes)
+            f.write("\t".join([f"SET_{i}", f"description {i}"] + genes) + "\n")
+    return gene_sets
+
+
+def test_gene_set_library(tmp_path):
+    from mspypeline.modules import GeneSetLibrary
+    gmt_path = str(tmp_path / "library.gmt")
+    gene_sets = write_gmt(gmt_path)
+    cache_dir = str(tmp_path / "cache")
+    library = GeneSetLibrary.compile(gmt_path, cache_dir)
+    assert isinstance(library.indices, np.memmap)
+    assert len(library) == len(gene_sets)
+    for name, genes in gene_sets.items():
+        assert library.get_genes(name) == sorted(genes)
+    assert library.get_description("SET_3") == "description 3"
+    gene = next(iter(gene_sets["SET_0"]))
+    assert library.get_sets_of_gene(gene) == [name for name, genes in gene_sets.items() if gene in genes]
+    assert library.get_sets_of_gene("not a gene") == []
+    # the compiled library is reused until the file changes
+    mtime = os.path.getmtime(os.path.join(cache_dir, "library", "indices.npy"))
+    GeneSetLibrary.compile(gmt_path, cache_dir)
+    assert os.path.getmtime(os.path.join(cache_dir, "library", "indices.npy")) == mtime
+    with open(gmt_path, "a") as f:
+        f.write("NEW_SET\tnew\tGENE1\tGENE1\n")
+    library = GeneSetLibrary.compile(gmt_path, cache_dir)
+    assert library.get_genes("NEW_SET") == ["GENE1"]
+
+
+def test_membership_matrix():
+    from mspypeline.modules import GeneSetLibrary
+    gene_sets = {f"set{i}": [f"g{g}" for g in np.random.choice(100, 20)] + [np.nan] for i in range(10)}
+    library = GeneSetLibrary.from_gene_sets(gene_sets)
+    index = pd.Index([f"g{g}" for g in np.random.choice(150, 200)])
+    expected = np.array([[gene in gene_sets[name] for name in gene_sets] for gene in index])
+    np.testing.assert_array_equal(library.membership_matrix(index), expected)
+    subset = ["set4", "set1"]
+    np.testing.assert_array_equal(library.membership_matrix(index.unique(), subset),
+                                  expected[~index.duplicated()][:, [4, 1]])
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def get_design_and_data(n_proteins=300):
+    samples = [f"s{i}" for i in range(12)]
+    design = pd.DataFrame({
+        "A": [1.] * 6 + [0.] * 6,
+        "B": [0.] * 6 + [1.] * 6,
+        "batch": [0., 1.] * 6,
+        "time": np.arange(12) % 3,
+    }, index=samples)
+    coefficients = np.random.normal(20, 2, (n_proteins, 4))
+    data = pd.DataFrame(coefficients @ design.values.T + np.random.normal(0, 0.5, (n_proteins, 12)),
+                        columns=samples)
+    data[np.random.random(data.shape) > 0.85] = np.nan
+    return design, data
+
+
+def test_linear_model_fit():
+    from mspypeline.modules.LinearModel import LinearModel
+    design, data = get_design_and_data()
+    model = LinearModel(design).fit(data)
+    for i in np.random.choice(data.shape[0], 20, replace=False):
+        observed = data.iloc[i].notna().values
+        x, y = design.values[observed], data.iloc[i].values[observed]
+        coefficients, residuals, _, _ = np.linalg.lstsq(x, y, rcond=None)
+        np.testing.assert_allclose(model.coefficients[i], coefficients)
+        sigma2 = residuals[0] / (observed.sum() - 4)
+        standard_errors = np.sqrt(np.diag(np.linalg.inv(x.T @ x)) * sigma2)
+        np.testing.assert_allclose(model.standard_errors[i], standard_errors)
+
+
+def test_linear_model_contrasts():
+    from mspypeline.modules.LinearModel import LinearModel
+    from mspypeline.modules.Statistics import moderated_ttest
+    groups = [np.random.normal(20, 1, (200, 4)), np.random.normal(20.5, 1, (200, 5)), np.random.normal(21, 1, (200, 3))]
+    groups[0][np.random.random((200, 4)) > 0.8] = np.nan
+    data = pd.DataFrame(np.concatenate(groups, axis=1), columns=[f"s{i}" for i in range(12)])
+    design = pd.DataFrame({g: [1. if i in idx else 0. for i in range(12)]
+                           for g, idx in (("g0", range(0, 4)), ("g1", range(4, 9)), ("g2", range(9, 12)))},
+                          index=data.columns)
+    model = LinearModel(design).fit(data)
+    contrasts = LinearModel.pairwise_contrasts(design.columns)
+    assert list(contrasts) == ["g1-g0", "g2-g0", "g2-g1"]
+    result = model.test_contrasts(contrasts)
+    assert result["pval"].shape == (200, 3)
+    np.testing.assert_allclose(result["estimate"][:, 0], np.nanmean(groups[1], axis=1) - np.nanmean(groups[0], axis=1))
+    # with only two groups the moderated test is the same as the limma style two group test
+    two_groups = LinearModel(design.iloc[:9, :2]).fit(data.iloc[:, :9]).test_contrasts({"g1-g0": {"g1": 1, "g0": -1}},
+                                                                                         moderated=True)
+    expected = moderated_ttest(groups[:2])
+    np.testing.assert_allclose(two_groups["t"], expected["t"])
+    np.testing.assert_allclose(two_groups["pval"], expected["pval"])
+    with pytest.raises(ValueError):
+        model.test_contrasts({"x": {"unknown": 1}})
+
+
+def test_linear_model_from_data_tree():
+    from mspypeline.modules.LinearModel import LinearModel
+    from mspypeline import DataTree
+    analysis_design = {"Ex1": {"1": "Ex1_1", "2": "Ex1_2", "3": "Ex1_3"}, "Ex2": {"1": "Ex2_1", "2": "Ex2_2"}}
+    data = pd.DataFrame(np.random.normal(20, 1, (50, 5)), columns=["Ex1_1", "Ex1_2", "Ex1_3", "Ex2_1", "Ex2_2"])
+    tree = DataTree.from_analysis_design(analysis_design, data, False)
+    model = LinearModel.from_data_tree(tree, 0)
+    assert list(model.design.columns) == ["Ex1", "Ex2"]
+    np.testing.assert_allclose(model.coefficients[:, 1], data[["Ex2_1", "Ex2_2"]].mean(axis=1))
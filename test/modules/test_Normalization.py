@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 import pytest
@@ -60,3 +61,121 @@ def test_default_normalizers():
         norm.fit_transform(data)
         assert data.equals(data_copy)
 
+
+
+def test_normalization_cache(tmp_path, monkeypatch):
+    from mspypeline.modules.Normalization import NormalizationCache, QuantileNormalizer, MedianNormalizer
+    data = pd.DataFrame(np.random.random((100, 10)) + 1)
+    cache = NormalizationCache(str(tmp_path))
+    norm = QuantileNormalizer(input_scale="normal", col_name_prefix="test")
+    result = cache.fit_transform(norm, data)
+    assert len(list(tmp_path.iterdir())) == 1
+    # a new normalizer with the same parameters is restored from the cache without fitting
+    cached_norm = QuantileNormalizer(input_scale="normal", col_name_prefix="test")
+    with monkeypatch.context() as m:
+        m.setattr(QuantileNormalizer, "fit", None)
+        cached_result = cache.fit_transform(cached_norm, data)
+    assert cached_result.equals(result)
+    assert cached_norm.rank_replace == norm.rank_replace
+    # different parameters, normalizers or data create new entries
+    cache.fit_transform(QuantileNormalizer(input_scale="normal", col_name_prefix="other"), data)
+    cache.fit_transform(MedianNormalizer(input_scale="normal", col_name_prefix="test"), data)
+    cache.fit_transform(QuantileNormalizer(input_scale="normal", col_name_prefix="test"), data + 1)
+    assert len(list(tmp_path.iterdir())) == 4
+    # results of another mspypeline version are not reused
+    key = cache.get_key(norm, data)
+    monkeypatch.setattr("mspypeline.modules.Normalization.__version__", "0.0")
+    assert cache.get_key(norm, data) != key
+    cache.clear()
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_normalization_cache_entries(tmp_path):
+    from mspypeline.modules.Normalization import NormalizationCache, default_normalizers
+    from copy import deepcopy
+    data = pd.DataFrame(np.random.random((100, 10)) + 1, index=[f"protein {i}" for i in range(100)],
+                        columns=[f"sample {i}" for i in range(10)])
+    data[np.random.random((100, 10)) > 0.8] = np.nan
+    new = data.iloc[:, :3].rename(lambda x: f"new {x}", axis=1)
+    cache = NormalizationCache(str(tmp_path), max_entries=3)
+    # the fitted state of all normalizers is restored from the arrays of the cache
+    for norm_name, norm in deepcopy(default_normalizers).items():
+        setattr(norm, "input_scale", "normal")
+        result = cache.fit_transform(norm, data)
+        cached_norm = deepcopy(default_normalizers[norm_name])
+        setattr(cached_norm, "input_scale", "normal")
+        path = cache.get_path(cache.get_key(cached_norm, data))
+        with open(path, "rb") as f:
+            assert b"pickle" not in f.read()
+        pd.testing.assert_frame_equal(cache.fit_transform(cached_norm, data), result)
+        pd.testing.assert_frame_equal(cached_norm.transform_new(new), norm.transform_new(new))
+    # only the most recently used entries are kept
+    assert len(cache.get_entries()) == 3
+    assert not any(file.name.endswith(".tmp") for file in tmp_path.iterdir())
+    # entries which can not be read are normalized again and replaced
+    norm = deepcopy(default_normalizers["median_norm"])
+    path = cache.get_path(cache.get_key(norm, data))
+    with open(path, "wb") as f:
+        f.write(b"not an entry")
+    result = cache.fit_transform(norm, data)
+    assert os.path.isfile(path)
+    pd.testing.assert_frame_equal(cache.fit_transform(deepcopy(default_normalizers["median_norm"]), data), result)
+
+
+def test_incremental_normalization(tmp_path):
+    from mspypeline.modules.Normalization import MedianNormalizer, QuantileNormalizer, TailRobustNormalizer, \
+        BaseNormalizer
+    data = pd.DataFrame(np.random.random((100, 20)) + 1, columns=[f"sample {i}" for i in range(20)])
+    data[np.random.random((100, 20)) > 0.8] = np.nan
+    old, new = data.iloc[:, :15], data.iloc[:, 15:]
+    for norm_class in (MedianNormalizer, QuantileNormalizer, TailRobustNormalizer):
+        full = norm_class(input_scale="normal").fit_transform(data)
+        # new samples transformed against the frozen reference of the full cohort
+        norm = norm_class(input_scale="normal").fit(data)
+        pd.testing.assert_frame_equal(norm.transform_new(new), full.loc[:, new.columns], check_like=True)
+        # the reference is persisted to disk
+        path = str(tmp_path / f"{norm_class.__name__}.pkl")
+        norm.save(path)
+        loaded = BaseNormalizer.load(path)
+        assert isinstance(loaded, norm_class)
+        pd.testing.assert_frame_equal(loaded.transform_new(new), full.loc[:, new.columns], check_like=True)
+        with pytest.raises(ValueError):
+            norm_class().transform_new(new)
+    # updating the reference with new samples is the same as fitting on all samples
+    for norm_class in (MedianNormalizer, QuantileNormalizer):
+        full = norm_class(input_scale="normal").fit_transform(data)
+        norm = norm_class(input_scale="normal").partial_fit(old).partial_fit(new)
+        pd.testing.assert_frame_equal(norm.transform(data), full, check_like=True)
+    # the reference of the tail robust normalizer can not be updated exactly
+    with pytest.raises(NotImplementedError):
+        TailRobustNormalizer(input_scale="normal").fit(old).partial_fit(new)
+
+
+def test_normalize_chunked(tmp_path):
+    from mspypeline.modules.Normalization import normalize_chunked, default_normalizers
+    from copy import deepcopy
+    data = np.random.random((100, 20)) + 1
+    data[np.random.random((100, 20)) > 0.8] = np.nan
+    input_path = str(tmp_path / "input.npy")
+    np.save(input_path, data)
+    for norm_name, norm in deepcopy(default_normalizers).items():
+        setattr(norm, "input_scale", "normal")
+        expected = norm.fit_transform(pd.DataFrame(data)).reindex(range(100))
+        output_path = str(tmp_path / f"{norm_name}.npy")
+        normalize_chunked(norm, input_path, output_path, block_size=6)
+        np.testing.assert_allclose(np.load(output_path), expected.values)
+    with pytest.raises(ValueError):
+        normalize_chunked(deepcopy(default_normalizers["median_norm"]), input_path, np.empty((100, 20)), block_size=0)
+
+
+def test_float32_normalization():
+    from mspypeline.modules.Normalization import default_normalizers
+    from copy import deepcopy
+    data = pd.DataFrame(np.random.normal(28, 2, (200, 12))).astype(np.float32)
+    data[np.random.random((200, 12)) > 0.8] = np.nan
+    for norm_name, norm in deepcopy(default_normalizers).items():
+        expected = deepcopy(norm).fit_transform(data.astype(np.float64))
+        result = norm.fit_transform(data)
+        assert (result.dtypes == np.float32).all(), norm_name
+        # values are in the normal scale, on the log2 scale the error is well below the measurement precision
+        np.testing.assert_allclose(np.log2(result.values), np.log2(expected.values), rtol=1e-5, atol=1e-4)
@@ -0,0 +1,48 @@
+import time
+import pandas as pd
+import numpy as np
+import pytest
+
+
+def get_interpolation_input(rows, cols):
+    data = np.random.random((rows, cols))
+    data[np.random.random((rows, cols)) > 0.6] = np.nan
+    not_na = np.maximum((~np.isnan(data)).sum(axis=0), 1)
+    float_index = (np.tile(np.linspace(0, 1, rows), (cols, 1)) * (not_na[:, np.newaxis] - 1)).T
+    return np.floor(float_index).astype(int), float_index
+
+
+def test_kernel_paths_are_identical():
+    from mspypeline.modules.NormalizationKernels import interpolation_positions, median_polish_kernel, map_ranks
+    index, float_index = get_interpolation_input(200, 20)
+    np.testing.assert_array_equal(interpolation_positions(index, float_index, use_numba=True),
+                                  interpolation_positions(index, float_index, use_numba=False))
+
+    data = np.random.random((50, 10))
+    data[np.random.random((50, 10)) > 0.7] = np.nan
+    data[3, :] = np.nan
+    for loop_result, numpy_result in zip(median_polish_kernel(data, use_numba=True),
+                                         median_polish_kernel(data, use_numba=False)):
+        np.testing.assert_allclose(loop_result, numpy_result)
+
+    ranks = pd.DataFrame(data).rank().values
+    ranks[0, 0] = 51  # not part of the reference
+    rank_means, half_rank_means = np.random.random(50), np.random.random(50)
+    loop_result = map_ranks(ranks, rank_means, half_rank_means, use_numba=True)
+    np.testing.assert_array_equal(loop_result, map_ranks(ranks, rank_means, half_rank_means, use_numba=False))
+    assert np.isnan(loop_result[0, 0])
+
+
+@pytest.mark.slow
+def test_kernel_benchmark():
+    from mspypeline.modules.NormalizationKernels import interpolation_positions, HAS_NUMBA
+    index, float_index = get_interpolation_input(20000, 200)
+    timings = {}
+    for use_numba in (True, False):
+        # first call includes the compilation
+        interpolation_positions(index[:10], float_index[:10], use_numba=use_numba)
+        start = time.perf_counter()
+        interpolation_positions(index, float_index, use_numba=use_numba)
+        timings[use_numba] = time.perf_counter() - start
+    if HAS_NUMBA:
+        assert timings[True] < timings[False]
@@ -0,0 +1,195 @@
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+
+def get_random_groups(n_features=100, sizes=(5, 7, 4)):
+    groups = []
+    for i, size in enumerate(sizes):
+        group = np.random.normal(i, 1 + i, (n_features, size))
+        group[np.random.random(group.shape) < 0.3] = np.nan
+        groups.append(group)
+    # constant rows have zero variance
+    groups[0][0], groups[1][0] = 1., 1.
+    groups[0][1], groups[1][1] = 1., 2.
+    return groups
+
+
+@pytest.mark.parametrize("equal_var", [True, False])
+def test_batched_ttest_ind(equal_var):
+    from mspypeline.modules.Statistics import batched_ttest_ind
+    a, b, _ = get_random_groups()
+    t, p = batched_ttest_ind(a, b, equal_var=equal_var)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [stats.ttest_ind(x, y, equal_var=equal_var, nan_policy="omit") for x, y in zip(a, b)]
+    expected_t, expected_p = (np.ma.filled(np.ma.array(x, dtype=float), np.nan) for x in zip(*expected))
+    np.testing.assert_allclose(t, expected_t, equal_nan=True)
+    np.testing.assert_allclose(p, expected_p, equal_nan=True)
+
+
+def test_pairwise_ttest_ind():
+    from mspypeline.modules.Statistics import batched_ttest_ind, pairwise_ttest_ind
+    groups = get_random_groups()
+    t, p, pairs = pairwise_ttest_ind(groups, equal_var=False)
+    assert pairs == [(0, 1), (0, 2), (1, 2)]
+    assert p.shape == (100, 3)
+    for i, (first, second) in enumerate(pairs):
+        np.testing.assert_allclose(p[:, i], batched_ttest_ind(groups[first], groups[second], equal_var=False)[1],
+                                   equal_nan=True)
+
+
+def test_benjamini_hochberg():
+    from mspypeline.modules.Statistics import benjamini_hochberg
+    # same as p.adjust(c(0.01, 0.04, 0.03, 0.2, 0.5), method="BH") in R
+    adjusted = benjamini_hochberg(np.array([0.01, 0.04, 0.03, 0.2, np.nan, 0.5]))
+    np.testing.assert_allclose(adjusted, [0.05, 0.2 / 3, 0.2 / 3, 0.25, np.nan, 0.5], equal_nan=True)
+
+
+def test_fit_f_dist():
+    from mspypeline.modules.Statistics import fit_f_dist
+    # variances drawn from a scaled inverse chi square prior
+    prior_df, prior_var, df = 4, 0.5, 5
+    true_var = prior_df * prior_var / np.random.chisquare(prior_df, 100000)
+    sample_var = true_var * np.random.chisquare(df, 100000) / df
+    scale, df2 = fit_f_dist(sample_var, df)
+    assert abs(scale - prior_var) < 0.05
+    assert abs(df2 - prior_df) < 0.5
+
+
+def test_moderated_ttest():
+    from mspypeline.modules.Statistics import moderated_ttest, squeeze_var, group_statistics
+    groups = [np.random.normal(0, 1, (500, 4)), np.random.normal(0.5, 1, (500, 5))]
+    # the first sample is never missing, features without values in a group are not tested
+    groups[0][:, 1:][np.random.random((500, 3)) > 0.9] = np.nan
+    mask = np.ones((500, 1), dtype=bool)
+    mask[:10] = False
+    result = moderated_ttest(groups, mask=mask)
+    assert result["pairs"] == [(0, 1)]
+    assert np.isnan(result["pval"][:10]).all()
+    (n1, m1, v1), (n2, m2, v2) = group_statistics(groups[0][10:]), group_statistics(groups[1][10:])
+    df = n1 + n2 - 2
+    # a group with a single value does not contribute to the residual variance
+    var_post, _, _ = squeeze_var((np.nan_to_num((n1 - 1) * v1) + np.nan_to_num((n2 - 1) * v2)) / df, df)
+    np.testing.assert_allclose(result["t"][10:, 0], (m2 - m1) / np.sqrt(var_post * (1 / n1 + 1 / n2)))
+    assert ((result["adjpval"][10:] >= result["pval"][10:]) & (result["adjpval"][10:] <= 1)).all()
+
+
+@pytest.mark.slow
+def test_moderated_ttest_limma():
+    pytest.importorskip("rpy2")
+    from rpy2.robjects.packages import importr
+    from rpy2.robjects import pandas2ri
+    from mspypeline.modules.Statistics import moderated_ttest
+    pandas2ri.activate()
+    limma = importr("limma")
+    groups = [np.random.normal(20, 1, (300, 4)), np.random.normal(20.5, 1, (300, 3))]
+    groups[0][np.random.random((300, 4)) > 0.9] = np.nan
+    df = pd.DataFrame(np.concatenate(groups, axis=1), columns=[f"s{i}" for i in range(7)])
+    design = pd.DataFrame([[0] * 4 + [1] * 3, [1] * 4 + [0] * 3], index=["g2", "g1"]).T
+    fit = limma.lmFit(pandas2ri.py2ri(df), pandas2ri.py2ri(design))
+    contrast_fit = limma.contrasts_fit(fit, limma.makeContrasts("g2-g1", levels=pandas2ri.py2ri(design)))
+    res = pandas2ri.ri2py(limma.topTable(limma.eBayes(contrast_fit), adjust="BH", number=df.shape[0], sort_by="none"))
+    result = moderated_ttest(groups)
+    for col in ("logFC", "AveExpr", "t", "pval", "adjpval"):
+        r_col = {"pval": "P.Value", "adjpval": "adj.P.Val"}.get(col, col)
+        np.testing.assert_allclose(result[col][:, 0], res[r_col].values, rtol=1e-6)
+
+
+def test_moderated_ttest_limma_reference():
+    from mspypeline.modules.Statistics import moderated_ttest, squeeze_var, group_statistics
+    rng = np.random.default_rng(0)
+    # feature wise standard deviations from a scaled inverse chi2 distribution give a finite prior df
+    sd = np.sqrt(4 * 0.5 / rng.chisquare(4, (30, 1)))
+    groups = [20 + rng.normal(0, 1, (30, 4)) * sd, 20.5 + rng.normal(0, 1, (30, 3)) * sd]
+    groups[0][rng.random((30, 4)) > 0.85] = np.nan
+    # topTable(eBayes(lmFit(data, design)), coef=2, adjust="BH") with design ~group, computed with the limma port
+    # of inmoose 0.9.1
+    expected_t = np.array([
+        0.166436702, 0.1056470003, 0.7646063289, -0.4332036134, 0.2173736279, 1.169882225, -0.3703345011,
+        -0.9487652516, 0.6363436152, 1.658310722, 1.309128069, 2.965254223, 1.078481218, 0.4747076076, -1.229734506,
+        1.970903493, 0.650513032, 2.001990637, -2.831075568, -1.099851521, 1.214196381, 1.946957802, 1.454604428,
+        1.35367586, 1.982662061, 1.396836839, 0.2934086097, -2.457728183, 0.5159836528, -0.3224210153
+    ])
+    expected_p = np.array([
+        0.8719157094, 0.9184462515, 0.4639667154, 0.6740131931, 0.8322650161, 0.2719208269, 0.7196483989,
+        0.3649869114, 0.5403035395, 0.1280816154, 0.2196193699, 0.01786617336, 0.3060127542, 0.6462362361,
+        0.246795797, 0.08003376196, 0.5299447645, 0.07299154785, 0.02196379094, 0.2970332163, 0.2553909847,
+        0.07999514971, 0.1762754991, 0.2086624163, 0.07538291747, 0.1925281939, 0.7758239325, 0.03614349631,
+        0.6170219473, 0.754454219
+    ])
+    expected_adj_p = np.array([
+        0.9019817683, 0.9184462515, 0.7325790242, 0.8425164914, 0.8917125173, 0.5400225074, 0.8620265917,
+        0.608311519, 0.7718621993, 0.4803060577, 0.5400225074, 0.3294568641, 0.5400225074, 0.8425164914,
+        0.5400225074, 0.343001837, 0.7718621993, 0.343001837, 0.3294568641, 0.5400225074, 0.5400225074, 0.343001837,
+        0.5400225074, 0.5400225074, 0.343001837, 0.5400225074, 0.8620265917, 0.343001837, 0.8413935645, 0.8620265917
+    ])
+    expected_df_prior, expected_s2_prior = 5.054258745, 0.6283229537
+    result = moderated_ttest(groups)
+    np.testing.assert_allclose(result["t"][:, 0], expected_t, rtol=1e-8)
+    np.testing.assert_allclose(result["pval"][:, 0], expected_p, rtol=1e-8)
+    np.testing.assert_allclose(result["adjpval"][:, 0], expected_adj_p, rtol=1e-8)
+    (n1, _, v1), (n2, _, v2) = group_statistics(groups[0]), group_statistics(groups[1])
+    df = n1 + n2 - 2
+    _, s2_prior, df_prior = squeeze_var((np.nan_to_num((n1 - 1) * v1) + np.nan_to_num((n2 - 1) * v2)) / df, df)
+    np.testing.assert_allclose([df_prior, s2_prior], [expected_df_prior, expected_s2_prior], rtol=1e-8)
+
+
+def test_hypergeometric_enrichment():
+    from mspypeline.modules.Statistics import hypergeometric_enrichment
+    detected = np.random.random((300, 4)) > 0.4
+    gene_sets = np.random.random((300, 25)) > 0.9
+    overlap, p_values = hypergeometric_enrichment(detected, gene_sets)
+    assert overlap.shape == p_values.shape == (4, 25)
+    for sample in range(4):
+        for gene_set in range(25):
+            d, g = detected[:, sample], gene_sets[:, gene_set]
+            table = [[(d & g).sum(), (d & ~g).sum()], [(~d & g).sum(), (~d & ~g).sum()]]
+            assert overlap[sample, gene_set] == table[0][0]
+            np.testing.assert_allclose(p_values[sample, gene_set], stats.fisher_exact(table, alternative="greater")[1])
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_pairwise_correlation(method):
+    from mspypeline.modules.Statistics import pairwise_correlation
+    values = np.random.normal(size=(200, 6)) @ np.random.normal(size=(6, 6)) + 2 ** 20
+    # low values are missing more often, so the rows observed in a pair differ from those of each column
+    missing_probability = 0.6 * stats.rankdata(values, axis=0) / values.shape[0]
+    values[np.random.random(values.shape) < missing_probability] = np.nan
+    values[:, 5] = np.nan
+    values[:3, 5] = 1
+    # ties
+    values[10:20, 0] = values[10, 0]
+    correlation, n = pairwise_correlation(values, method=method)
+    df = pd.DataFrame(values)
+    # pandas also uses the pairwise complete rows
+    np.testing.assert_allclose(correlation, df.corr(method=method, min_periods=2).values, atol=1e-9)
+    np.testing.assert_array_equal(n, df.notna().astype(int).T.dot(df.notna().astype(int)).values)
+    mask = np.random.random(values.shape) > 0.2
+    masked, _ = pairwise_correlation(values, mask, method=method)
+    expected = df.where(mask).corr(method=method, min_periods=2).values
+    np.testing.assert_allclose(masked, expected, atol=1e-9)
+    with pytest.raises(ValueError):
+        pairwise_correlation(values, method="kendall")
+
+
+@pytest.mark.parametrize("bw_method", ["scott", "silverman", 0.3])
+def test_binned_kde(bw_method):
+    from mspypeline.modules.Statistics import binned_kde
+    values = np.concatenate([np.random.normal(25, 2, (600, 5)), np.random.normal(30, 1, (400, 5))])
+    values[np.random.random(values.shape) < 0.3] = np.nan
+    values[:, 4] = np.nan
+    values[0, 4] = 20
+    grid = np.linspace(np.nanmin(values) * 0.9, np.nanmax(values) * 1.1, 1000)
+    densities = binned_kde(values, grid, bw_method=bw_method)
+    assert densities.shape == (1000, 5)
+    for col in range(4):
+        column = values[:, col]
+        expected = stats.gaussian_kde(column[~np.isnan(column)], bw_method=bw_method).evaluate(grid)
+        np.testing.assert_allclose(densities[:, col], expected, atol=1e-3 * expected.max())
+    # a single value has no bandwidth
+    assert np.isnan(densities[:, 4]).all()
+    with pytest.raises(ValueError):
+        binned_kde(values, grid, bw_method="unknown")